@@ -1,6 +1,8 @@
-import subprocess, signal
+import atexit
+import signal
 from subprocess import call
 import os
+import threading
 import datetime
 import time
 from numpy import loadtxt, mean
@@ -30,31 +32,48 @@ def print_free_cpu():
     print('Free CPU #:')
     print('    %.2f'%free_cpu())
 
-def find_process_by_pid(processes, pid):
-    for p in processes:
-        if p.pid == pid:
-            return p
-    raise ValueError('PID %d is not found.'%pid)
-
-
-def kill_child_processes(parent_pid, sig=signal.SIGTERM):
-        ps_command = subprocess.Popen('pstree -p %d | perl -ne \'print "$1 " while /\((\d+)\)/g\'' %\
-                                      parent_pid,
-                                      shell=True, stdout=subprocess.PIPE)
-        ps_output = ps_command.stdout.read().decode()
-        retcode = ps_command.wait()
-        assert retcode == 0, "ps command returned %d" % retcode
-        for pid_str in ps_output.split():
-            try:
-                os.kill(int(pid_str), sig)
-            except ProcessLookupError as err:
-                print('    ',str(err))                
-
-
-def remove_process_by_pids(processes, pids):
-    for pid in pids:
-        p = find_process_by_pid(pid)
-        processes.remove(p)
+def kill_process_group(pgid, sig=signal.SIGTERM):
+    ''' Kill a worker and all its children.
+A worker leads its own process group, see DPoolProcess.
+'''
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError as err:
+        print('    ',str(err))
+
+# Process groups of the live workers of this process. Workers are in
+# sessions of their own, so neither a Ctrl-C nor a kill of the pool reaches
+# them; they are killed when the pool process exits instead.
+_process_groups = set()
+# PID of the process that installed the cleanup, not inherited by workers.
+_cleanup_pid = None
+
+def kill_all_process_groups(sig=signal.SIGTERM):
+    if os.getpid() != _cleanup_pid:
+        return
+    for pgid in list(_process_groups):
+        kill_process_group(pgid, sig)
+    _process_groups.clear()
+
+def _kill_all_and_reraise(signum, frame):
+    kill_all_process_groups()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+def _install_cleanup():
+    ''' Kill the worker process groups at exit, on an uncaught
+KeyboardInterrupt too, and on SIGTERM or SIGHUP unless the program
+handles them itself.
+'''
+    global _cleanup_pid
+    if _cleanup_pid == os.getpid():
+        return
+    _cleanup_pid = os.getpid()
+    atexit.register(kill_all_process_groups)
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            if signal.getsignal(signum) == signal.SIG_DFL:
+                signal.signal(signum, _kill_all_and_reraise)
 
 class DPool(object):
     def __init__(self,
@@ -66,13 +85,16 @@ class DPool(object):
         self.dp_state = DPoolState()
         self.controller = Controller(controller_file)
         self._finished_tasks = []
-        self.running_procs = []
+        # PID -> process
+        self.running_procs = {}
     
     def _add_a_process(self):
+        _install_cleanup()
         p = DPoolProcess(dp_state=self.dp_state)
         p.start()
+        _process_groups.add(p.pid)
         print('    PID %d is started.'%p.pid)
-        self.running_procs.append(p)
+        self.running_procs[p.pid] = p
 
     def _add_procs(self, n):
         n = int(n)
@@ -85,25 +107,34 @@ class DPool(object):
 
     def update_running_task(self):
         pid_tasks = self.dp_state.get_all_running_tasks()
-        pids_to_remove = []
         for pid, task in pid_tasks:
-            p = find_process_by_pid(self.running_procs, pid)
+            p = self.running_procs.get(pid)
+            if p is None:
+                # killed already
+                continue
             if (task == 'Done'):
-                pids_to_remove.append(pid)
+                del self.running_procs[pid]
+                _process_groups.discard(pid)
+                p.join()
+                continue
             p.task = task
 
-        remove_process_by_pids(
-            self.running_procs, pids_to_remove)
-
     def _kill_a_process(self):
         if len(self.running_procs) > 0:
-            while not hasattr(self.running_procs[-1], 'task'):
+            # the latest process
+            pid = next(reversed(self.running_procs))
+            while pid in self.running_procs and \
+                  not hasattr(self.running_procs[pid], 'task'):
                 print(' Updating running task...')
                 self.update_running_task()
-            p = self.running_procs.pop()
+            p = self.running_procs.pop(pid, None)
+            if p is None:
+                return
             print("    Termination: PID: %d, Task: %s"%\
                   (p.pid, str(p.task)))
-            kill_child_processes(p.pid)
+            kill_process_group(p.pid)
+            _process_groups.discard(p.pid)
+            p.join()
             self.dp_state.add_aborted_task(p.task)
 
     def _kill_procs(self, n):
@@ -125,7 +156,7 @@ class DPool(object):
                          self.controller.num_processes)
 
     def _join_all_procs(self):
-        for p in self.running_procs:
+        for p in self.running_procs.values():
             p.join()
             
     def cls(self):
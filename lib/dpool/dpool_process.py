@@ -1,3 +1,4 @@
+import os
 from multiprocessing import Process
 
 class DPoolProcess(Process):
@@ -7,6 +8,10 @@ class DPoolProcess(Process):
 
    
     def run(self):
+        # A new session makes this process lead a process group of its own,
+        # which includes the commands it runs, so the pool can kill them
+        # all at once with os.killpg.
+        os.setsid()
         state = self.dp_state
         task = state.get_task()
         while task is not None:
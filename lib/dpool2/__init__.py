@@ -1,2 +1,4 @@
 from .task import Task
 from .dpool import DPool
+from .journal import TaskJournal
+from .broker import Node
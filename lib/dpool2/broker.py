@@ -0,0 +1,316 @@
+''' Serve the tasks of a DPool over a socket to worker nodes.
+
+On the controller host, bound to the interface of the cluster network:
+    DPool(tasks, controller_file, broker_address=('node0.cluster', 50000),
+          authkey=read_authkey('~/.dpool2_authkey')).run()
+On every worker host:
+    python -m dpool2.broker node0.cluster:50000 --authkey-file ~/.dpool2_authkey
+
+The broker runs pickled objects, so whoever is authenticated can run code
+on the controller. A TCP address therefore needs a secret authkey, given
+as an argument, by the environment variable DPOOL2_AUTHKEY or by a file
+readable only by the user. A Unix socket can be used without one: the
+socket is made readable only by the user, and a random key is made for
+every run and written to <socket>.authkey, also readable only by the
+user, where the nodes on the same host read it.
+
+A node runs worker processes that pull tasks from the broker and send back
+their events and timings, as local processes do. The controller file of a
+node works as that of DPool: the dynamic pool adds processes by
+threshold_load and stops them by threshold_kill of the node's own free CPUs,
+a static pool keeps nproc processes.
+
+Tasks are pickled, so their targets must be importable on the nodes.
+An address is (host, port) for TCP or a file name for a Unix socket.
+'''
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from multiprocessing import Event, AuthenticationError
+from multiprocessing.managers import BaseManager
+
+from .controller import Controller
+from .dpool_process import DPoolProcess
+from .load_sampler import LoadSampler
+
+__all__ = ['BrokerState', 'serve_broker', 'connect_broker', 'Node',
+           'read_authkey', 'get_authkey']
+
+AUTHKEY_ENV = 'DPOOL2_AUTHKEY'
+
+logger = logging.getLogger('dpool2')
+
+def parse_address(address):
+    ''' 'host:port' -> (host, port), otherwise a Unix socket file name.
+'''
+    if isinstance(address, str) and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+def read_authkey(file_name):
+    ''' Read an authkey from the first line of a file.
+'''
+    with open(os.path.expanduser(file_name), 'rb') as fid:
+        key = fid.readline().strip()
+    if len(key) == 0:
+        raise ValueError('Authkey file %s is empty.'%file_name)
+    return key
+
+def get_unix_socket_authkey_file(address):
+    return address + '.authkey'
+
+def write_unix_socket_authkey(address):
+    ''' Write a new random authkey for the Unix socket address into a file
+readable only by the user.
+'''
+    key = os.urandom(32).hex().encode()
+    fn = get_unix_socket_authkey_file(address)
+    tmp = '%s.%d'%(fn, os.getpid())
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as fid:
+        fid.write(key + b'\n')
+    # a node never reads a file that is half written
+    os.replace(tmp, fn)
+    return key
+
+def get_authkey(address, authkey = None):
+    ''' The authkey of a broker at address: authkey if given, otherwise
+that in the environment variable DPOOL2_AUTHKEY. A TCP address needs
+one of them. For a Unix socket, it is otherwise read from the file
+written by serve_broker, see get_unix_socket_authkey_file.
+'''
+    if authkey is None and os.environ.get(AUTHKEY_ENV):
+        authkey = os.environ[AUTHKEY_ENV]
+    if authkey is None:
+        if isinstance(address, tuple):
+            raise ValueError('A broker at TCP address %s needs an authkey. '
+                             'Give it as an argument or by %s.'%(address, AUTHKEY_ENV))
+        return read_authkey(get_unix_socket_authkey_file(address))
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+class BrokerState(object):
+    ''' Methods of a DPool that a node calls through the broker.
+They run in threads of the controller process.
+
+Every call of a worker, and its heartbeats, renew the lease of the worker,
+see DPool.worker_timeout.
+'''
+    def __init__(self, dpool):
+        self._dpool = dpool
+
+    def get_task(self, wid, timeout = None):
+        self.heartbeat(wid)
+        return self._dpool.dp_state.get_task(wid, timeout = timeout)
+
+    def add_event(self, event, wid, task = None):
+        self.heartbeat(wid)
+        self._dpool.dp_state.add_event(event, wid, task)
+
+    def heartbeat(self, wid):
+        self._dpool.renew_lease(wid)
+
+    def num_pending(self):
+        return self._dpool.get_num_pending_tasks()
+
+    def is_finished(self):
+        return self._dpool.finished
+
+def serve_broker(state, address, authkey = None):
+    ''' Serve state in a daemon thread. See get_authkey for authkey.
+A Unix socket without an authkey gets a random one, see write_unix_socket_authkey.
+:return: server, whose stop_event stops it.
+'''
+    is_unix_socket = not isinstance(address, tuple)
+    authkey_file = None
+    if is_unix_socket and authkey is None and not os.environ.get(AUTHKEY_ENV):
+        authkey = write_unix_socket_authkey(address)
+        authkey_file = get_unix_socket_authkey_file(address)
+    authkey = get_authkey(address, authkey)
+    class _Manager(BaseManager):
+        pass
+    _Manager.register('get_state', callable = lambda: state)
+    if is_unix_socket:
+        # the socket is bound readable only by the user
+        umask = os.umask(0o177)
+        try:
+            server = _Manager(address = address, authkey = authkey).get_server()
+        finally:
+            os.umask(umask)
+        os.chmod(address, 0o600)
+    else:
+        server = _Manager(address = address, authkey = authkey).get_server()
+    server.authkey_file = authkey_file
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    logger.info('event=broker_started address=%s', server.address)
+    return server
+
+def stop_broker(server):
+    server.stop_event.set()
+    server.listener.close()
+    if server.authkey_file is not None and os.path.exists(server.authkey_file):
+        os.remove(server.authkey_file)
+
+def connect_broker(address, authkey = None, timeout = 30.):
+    ''' Connect to a broker, waiting at most timeout sec for it to start.
+See get_authkey for authkey.
+:return: proxy of BrokerState
+'''
+    class _Manager(BaseManager):
+        pass
+    _Manager.register('get_state')
+    t0 = time.time()
+    while True:
+        try:
+            # the key file of a Unix socket is written when the broker starts,
+            # and a key of a former run fails to authenticate.
+            manager = _Manager(address = address,
+                               authkey = get_authkey(address, authkey))
+            manager.connect()
+            break
+        except (ConnectionError, FileNotFoundError, AuthenticationError):
+            if time.time() - t0 > timeout:
+                raise
+            time.sleep(0.2)
+    return manager.get_state()
+
+class RemoteDPoolProcess(DPoolProcess):
+    ''' A worker process of a node. It connects to the broker by itself,
+since connections are not shared across fork. A thread of the process
+sends a heartbeat every heartbeat_interval sec, also while a task runs,
+so that the controller can tell a dead worker from a busy one.
+'''
+    def __init__(self, address, authkey, stop_event, heartbeat_interval = 5.):
+        super().__init__(dp_state = None, stop_event = stop_event)
+        self.address = address
+        # not authkey, which is that of multiprocessing.Process
+        self.broker_authkey = authkey
+        self.heartbeat_interval = heartbeat_interval
+        self.hostname = socket.gethostname()
+
+    @property
+    def worker_id(self):
+        return '%s:%d'%(self.hostname, self.pid)
+
+    def _send_heartbeats(self):
+        wid = self.worker_id
+        while True:
+            try:
+                self.dp_state.heartbeat(wid)
+            except (ConnectionError, EOFError):
+                return
+            time.sleep(self.heartbeat_interval)
+
+    def run(self):
+        self.dp_state = connect_broker(self.address, self.broker_authkey)
+        threading.Thread(target = self._send_heartbeats, daemon = True).start()
+        super().run()
+
+class Node(object):
+    ''' Worker processes on a host pulling tasks from a broker.
+Run until the pool is finished.
+'''
+    def __init__(self,
+                 address,
+                 authkey = None,
+                 controller_file = 'pool.config',
+                 sample_interval = 1.,
+                 heartbeat_interval = 5.):
+        self.address = parse_address(address)
+        if isinstance(self.address, tuple):
+            # fail at once without a key
+            get_authkey(self.address, authkey)
+        self.authkey = authkey
+        self.heartbeat_interval = heartbeat_interval
+        self.controller = Controller(controller_file)
+        self.sampler = LoadSampler(interval = sample_interval)
+        # PID -> (process, stop event)
+        self.processes = {}
+        self._t_last_spawn = 0.
+
+    def _add_procs(self, n):
+        n = min(int(n), self.state.num_pending())
+        for ii in range(n):
+            stop_event = Event()
+            p = RemoteDPoolProcess(self.address, self.authkey, stop_event,
+                                   self.heartbeat_interval)
+            p.start()
+            self.processes[p.pid] = (p, stop_event)
+        if n > 0:
+            self._t_last_spawn = time.time()
+            self.sampler.reset()
+
+    def _stop_procs(self, n):
+        running = [(pid, ev) for pid, (p, ev) in self.processes.items()
+                   if not ev.is_set()]
+        for pid, ev in running[:max(int(n), 0)]:
+            ev.set()
+
+    def _reap(self):
+        for pid, (p, ev) in list(self.processes.items()):
+            if not p.is_alive():
+                p.join()
+                self.processes.pop(pid)
+
+    def _adjust_processes(self):
+        num_running = sum(1 for p, ev in self.processes.values() if not ev.is_set())
+        if self.controller.if_fix:
+            n = int(self.controller.num_processes) - num_running
+            if n > 0:
+                self._add_procs(n)
+            else:
+                self._stop_procs(-n)
+            return
+        t_sample = self.sampler.t_sample
+        if t_sample is None or t_sample < self._t_last_spawn:
+            return
+        free = self.sampler.free_cpu
+        if free < self.controller.threshold_kill:
+            self._stop_procs(1)
+        else:
+            self._add_procs(free - self.controller.threshold_load)
+
+    def run(self):
+        self.state = connect_broker(self.address, self.authkey)
+        self.sampler.start()
+        try:
+            while True:
+                self.controller.update()
+                self._reap()
+                try:
+                    finished = self.state.is_finished()
+                except (ConnectionError, EOFError):
+                    finished = True
+                if finished:
+                    break
+                self._adjust_processes()
+                time.sleep(self.sampler.interval)
+            for p, ev in self.processes.values():
+                ev.set()
+            for p, ev in self.processes.values():
+                p.join()
+        finally:
+            self.sampler.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run a dpool2 worker node.')
+    parser.add_argument('address', help = 'host:port or Unix socket of the broker')
+    parser.add_argument('--controller-file', default = 'pool.config')
+    parser.add_argument('--authkey-file',
+                        help = 'file of the authkey, needed by a TCP address '
+                               'unless %s is set'%AUTHKEY_ENV)
+    args = parser.parse_args()
+    authkey = None
+    if args.authkey_file is not None:
+        authkey = read_authkey(args.authkey_file)
+    Node(args.address, authkey, args.controller_file).run()
+
+if __name__ == '__main__':
+    main()
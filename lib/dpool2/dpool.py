@@ -1,80 +1,354 @@
-import subprocess, signal
-from subprocess import call
-import os
 import datetime
+import logging
+import sys
+import threading
 import time
-from numpy import loadtxt, mean
+from multiprocessing import Queue
+from numpy import mean
 
 import psutil as ps
 
 from .controller import Controller
 from .dpool_state import DPoolState
 from .dpool_process import DPoolProcess
+from .journal import TaskJournal
+from .broker import BrokerState, serve_broker, stop_broker
+from .load_sampler import LoadSampler
 from .task import Task
 from .utils import free_cpu
 
+logger = logging.getLogger('dpool2')
+
+def _task_name(task):
+    return str(task).split('\n')[0].strip()
+
 def print_free_cpu():
     print('Free CPU #:')
     print('    %.2f'%free_cpu())
 
-def find_process_by_pid(processes, pid):
-    for p in processes:
-        if p.pid == pid:
-            return p
-    raise ValueError('PID %d is not found.'%pid)
+class DPool(object):
+    ''' Pool of processes that grows with free CPUs (dynamic pool)
+or keeps a fixed size (static pool), see Controller.
 
-def remove_process_by_pids(processes, pids):
-    for pid in pids:
-        p = find_process_by_pid(processes, pid)
-        processes.remove(p)
+The pool waits on events from its processes, so a finished task is
+followed by the next one at once. CPU usage is sampled in a background
+thread every sample_interval sec. The controller file is re-read and
+the pool status is logged every sleep_interval sec of the controller.
 
-class DPool(object):
+Status goes to the logger 'dpool2' as key=value records. If log_file
+is given, it is also written there. If the logger is not configured,
+it is printed to stdout.
+
+journal_file - TaskJournal of task states. Tasks that are done in it are
+    skipped, so an interrupted run resumes where it stopped. Durations of
+    tasks done in former runs are counted in the estimated finishing time.
+max_retries - number of times a failed task is run again.
+retry_backoff - a failed task is run again after retry_backoff * 2**n sec,
+    where n is the number of its former retries.
+broker_address - if given, tasks are also served at this address to worker
+    nodes on other hosts, see broker.Node. (host, port) or a Unix socket.
+authkey - authkey of the broker, needed by a TCP broker_address unless
+    DPOOL2_AUTHKEY is set, see broker.get_authkey.
+local_processes - if False, only worker nodes run tasks.
+worker_timeout - a worker of a node that is not heard from, by its events
+    or heartbeats, for worker_timeout sec is taken as dead, e.g. the node
+    is down or disconnected. Its task is failed and retried as that of a
+    local process that died. Later events of it are ignored.
+
+Every task is given to an idle worker of its own, so the pool knows the
+task a worker holds from the time it is given. The task of a worker that
+is lost before it reports 'started' is queued again.
+'''
     def __init__(self,
                  tasks,
-                 controller_file = 'pool.config',):
+                 controller_file = 'pool.config',
+                 sample_interval = 1.,
+                 log_file = None,
+                 journal_file = None,
+                 max_retries = 0,
+                 retry_backoff = 10.,
+                 broker_address = None,
+                 authkey = None,
+                 local_processes = True,
+                 worker_timeout = 60.):
 
         self.tasks = tasks
-        self.num_total_tasks = len(tasks)        
+        self.num_total_tasks = len(tasks)
         self.controller = Controller(controller_file)
         self.dp_state = DPoolState(self.controller)
+        self.sampler = LoadSampler(interval = sample_interval)
+        self.log_file = log_file
+        self.journal_file = journal_file
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.journal = None
+        self.broker_address = broker_address
+        self.authkey = authkey
+        self.local_processes = local_processes
+        self.worker_timeout = worker_timeout
+        self.finished = False
+
         self._finished_tasks = []
-        self.processes = []
-    
+        self._failed_tasks = []
+        self._pending_tasks = list(tasks)
+        # (time to retry, task)
+        self._delayed_tasks = []
+        self._previous_durations = []
+        # PID -> local process
+        self.processes = {}
+        # worker id -> running task, None if the worker is idle.
+        # The id of a local process is its PID, that of a process on
+        # a worker node is "host:PID".
+        self._running_tasks = {}
+        # worker id -> task given to it that it has not started yet.
+        self._given_tasks = {}
+        # ids of workers that are asked to exit.
+        self._retiring = set()
+        # ids of workers that are taken as dead. Their events are ignored.
+        self._lost_workers = set()
+        # worker id of a node -> time it was last heard from,
+        # set by threads of the broker.
+        self._lease_renewed = {}
+        # guards _pending_tasks and _lease_renewed, which the threads of
+        # the broker read or write.
+        self._lock = threading.Lock()
+        self._t_last_spawn = 0.
+
     def _add_a_process(self):
-        p = DPoolProcess(dp_state=self.dp_state)
+        q_task = Queue()
+        p = DPoolProcess(dp_state=self.dp_state, q_task=q_task)
         p.start()
-        print('    PID %d is started.'%p.pid)
-        self.processes.append(p)
+        self.dp_state.add_queue(p.pid, q_task)
+        # the PID may be that of a process that died before
+        self._lost_workers.discard(p.pid)
+        logger.info('event=process_started pid=%d', p.pid)
+        self.processes[p.pid] = p
+        self._running_tasks[p.pid] = None
 
     def _add_procs(self, n):
         n = int(n)
-        n_left = self.dp_state.num_waiting_tasks()
-        n = min(n, n_left)        
+        n_left = len(self._pending_tasks) - self.num_idle_processes
+        n = min(n, n_left)
         if n > 0:
-            print('    %d processes will be added.'%n)
             for ii in range(n):
                 self._add_a_process()
-            time.sleep(1)
+            self._t_last_spawn = time.time()
+            # samples before the new processes don't count.
+            self.sampler.reset()
 
+    def _retire_procs(self, n):
+        ''' Ask at most n idle processes to exit.
+'''
+        for wid in self._idle_workers()[:max(int(n), 0)]:
+            self.dp_state.put_task(wid, None)
+            self._retiring.add(wid)
 
     def _dynamic_pool_adjust_process(self):
-        self._add_procs(free_cpu() - self.controller.threshold_load)
+        # Wait for a sample taken after the last processes were started.
+        t_sample = self.sampler.t_sample
+        if t_sample is None or t_sample < self._t_last_spawn:
+            return
+        free = self.sampler.free_cpu
+        if free < self.controller.threshold_kill:
+            self._retire_procs(self.num_idle_processes)
+        else:
+            self._add_procs(free - self.controller.threshold_load)
 
     def _static_pool_adjust_process(self):
-        self._add_procs(self.controller.num_processes -
-                        self.num_running_tasks)        
+        n = int(self.controller.num_processes) - \
+            (self.num_processes - len(self._retiring))
+        if n > 0:
+            self._add_procs(n)
+        else:
+            self._retire_procs(-n)
+
+    def _adjust_processes(self):
+        if not self.local_processes:
+            return
+        if self.controller.if_fix == 0:
+            self._dynamic_pool_adjust_process()
+        elif self.controller.if_fix == 1:
+            self._static_pool_adjust_process()
+
+    def _load_journal(self):
+        if self.journal_file is None:
+            return
+        self.journal = TaskJournal(self.journal_file)
+        self._previous_durations = self.journal.durations()
+        tasks = []
+        for task in self._pending_tasks:
+            if self.journal.is_done(task.key):
+                continue
+            self.journal.record(task.key, 'queued')
+            tasks.append(task)
+        num_skipped = len(self._pending_tasks) - len(tasks)
+        logger.info('event=journal_loaded file=%s done=%d queued=%d',
+                    self.journal_file, num_skipped, len(tasks))
+        with self._lock:
+            self._pending_tasks = tasks
+        self.num_total_tasks = len(tasks)
+
+    def _record(self, task, state, **kwargs):
+        if self.journal is not None:
+            self.journal.record(task.key, state, **kwargs)
+
+    def _release_delayed_tasks(self):
+        now = time.time()
+        ready = [task for t, task in self._delayed_tasks if t <= now]
+        self._delayed_tasks = [(t, task) for t, task in self._delayed_tasks if t > now]
+        with self._lock:
+            self._pending_tasks += ready
+
+    def _retry_or_fail(self, task):
+        if task.retries < self.max_retries:
+            delay = self.retry_backoff * 2**task.retries
+            task.retries += 1
+            task.exception = None
+            logger.info('event=task_retry task=%s retries=%d delay=%.1f',
+                        _task_name(task), task.retries, delay)
+            self._record(task, 'queued', retries = task.retries)
+            self._delayed_tasks.append((time.time() + delay, task))
+        else:
+            self._failed_tasks.append(task)
+            self._finished_tasks.append(task)
+
+    def _dispatch(self):
+        ''' Give a task to every idle process.
+'''
+        self._release_delayed_tasks()
+        for wid in self._idle_workers()[:len(self._pending_tasks)]:
+            with self._lock:
+                task = self._pending_tasks.pop(0)
+            self._given_tasks[wid] = task
+            self.dp_state.put_task(wid, task)
+        if len(self._pending_tasks) == 0 and len(self._delayed_tasks) == 0:
+            # Nothing left, idle processes are done.
+            self._retire_procs(self.num_idle_processes)
+
+    def renew_lease(self, wid):
+        with self._lock:
+            self._lease_renewed[wid] = time.time()
+
+    def get_num_pending_tasks(self):
+        with self._lock:
+            return len(self._pending_tasks)
+
+    def _handle_event(self, event):
+        name, pid, task = event
+        if pid in self._lost_workers:
+            # The worker was taken as dead and its task was queued again.
+            logger.warning('event=late_event_ignored worker=%s event=%s',
+                           pid, name)
+            return
+        if name == 'joined':
+            if pid not in self._running_tasks:
+                self._running_tasks[pid] = None
+                logger.info('event=worker_joined worker=%s', pid)
+        elif name == 'started':
+            self._given_tasks.pop(pid, None)
+            self._running_tasks[pid] = task
+            self._record(task, 'running', pid = pid)
+            logger.info('event=task_started worker=%s task=%s', pid, _task_name(task))
+        elif name == 'finished':
+            self._running_tasks[pid] = None
+            if task.exception is not None:
+                logger.error('event=task_failed worker=%s task=%s\n%s',
+                             pid, _task_name(task), task.exception)
+                self._record(task, 'failed', retries = task.retries,
+                             error = task.exception)
+                self._retry_or_fail(task)
+            else:
+                logger.info('event=task_finished worker=%s t_consumed=%.2f task=%s',
+                            pid, task.t_consumed, _task_name(task))
+                self._record(task, 'done', t_consumed = task.t_consumed)
+                self._finished_tasks.append(task)
+        elif name == 'exit':
+            if pid in self.processes:
+                self.processes.pop(pid).join()
+            self._forget_worker(pid)
+            logger.info('event=worker_exited worker=%s reason=%s', pid, task)
+        else:
+            raise ValueError('Unknown event %s.'%name)
+
+    def _forget_worker(self, wid):
+        ''' Remove a worker. A task given to it but not started is queued again.
+Return the task it was running.
+'''
+        self._retiring.discard(wid)
+        with self._lock:
+            self._lease_renewed.pop(wid, None)
+        self.dp_state.remove_queue(wid)
+        given = self._given_tasks.pop(wid, None)
+        if given is not None:
+            logger.info('event=task_requeued worker=%s task=%s',
+                        wid, _task_name(given))
+            with self._lock:
+                self._pending_tasks.insert(0, given)
+        return self._running_tasks.pop(wid, None)
 
-    def _join_all_procs(self):
-        for p in self.running_procs:
+    def _lose_worker(self, wid, error):
+        self._lost_workers.add(wid)
+        task = self._forget_worker(wid)
+        if task is not None:
+            task.exception = error
+            self._record(task, 'failed', retries = task.retries,
+                         error = task.exception)
+            self._retry_or_fail(task)
+
+    def _reap_dead_processes(self):
+        ''' Remove processes that died without an exit event.
+'''
+        for pid, p in list(self.processes.items()):
+            if p.is_alive():
+                continue
             p.join()
-            
-    def cls(self):
-        call('clear',shell=True)
-        print(self.controller)
-        print_free_cpu()
-        print(self.dp_state)
-        self.print_exe_summary()
-        self.print_finished_tasks()
+            self.processes.pop(pid)
+            if p.exitcode == 0 and self._running_tasks.get(pid) is None \
+               and pid not in self._given_tasks:
+                # exited, its exit event is not read yet.
+                self._forget_worker(pid)
+                continue
+            logger.error('event=process_died pid=%d exitcode=%s', pid, p.exitcode)
+            self._lose_worker(pid, 'Process %d died.'%pid)
+
+    def _expire_remote_workers(self):
+        ''' Remove workers of nodes whose lease has expired.
+'''
+        now = time.time()
+        for wid in list(self._running_tasks):
+            if wid in self.processes:
+                continue
+            with self._lock:
+                t = self._lease_renewed.get(wid)
+            if t is not None and now - t <= self.worker_timeout:
+                continue
+            if t is None:
+                # Joined before the lease was kept, give it a full lease.
+                self.renew_lease(wid)
+                continue
+            logger.error('event=worker_lost worker=%s silent=%.1f', wid, now - t)
+            self._lose_worker(wid, 'Worker %s was lost.'%wid)
+            # If it is still alive, it exits on its next request.
+            self.dp_state.put_task(wid, None)
+
+    def status(self):
+        ''' Pool status as a key=value record.
+'''
+        free = self.sampler.free_cpu
+        out = 'event=status'
+        out += ' free_cpu=%s'%('nan' if free is None else '%.2f'%free)
+        out += ' processes=%d running=%d waiting=%d finished=%d failed=%d total=%d'%\
+               (self.num_processes, self.num_running_tasks,
+                len(self._pending_tasks) + len(self._delayed_tasks),
+                self.num_finished_tasks, len(self._failed_tasks),
+                self.num_total_tasks)
+        out += ' average_exe_time=%.2f'%self._compute_average_exe_time()
+        out += ' finishing_at=%s'%\
+               self._compute_finishing_time().strftime("%Y-%m-%dT%H:%M:%S")
+        return out
+
+    def log_status(self):
+        logger.info(self.status())
 
     def print_finished_tasks(self, n=6):
         ll = self.finished_tasks
@@ -94,18 +368,18 @@ class DPool(object):
               (self._compute_total_exe_time()/3600.))
         print('    Est. finishing at: %s'%\
               self._compute_finishing_time().strftime("%A %d. %B %Y %H:%M" ))
-        
+
     def _compute_average_exe_time(self):
-        ts = []
+        ts = [t for t in self._previous_durations if t >= 0.1]
         for task in self.finished_tasks:
-            if task.t_consumed < 0.1:
+            if task.t_consumed is None or task.t_consumed < 0.1:
                 continue
             ts.append(task.t_consumed)
         if len(ts) == 0:
             return 0.
         return mean(ts)
 
-    def _compute_total_exe_time(self):        
+    def _compute_total_exe_time(self):
         t = self._compute_average_exe_time() * \
             self.num_total_tasks
         if self.num_processes > 0:
@@ -127,9 +401,12 @@ class DPool(object):
 
     @property
     def finished_tasks(self):
-        self._finished_tasks += self.dp_state.get_all_finished_tasks()
         return self._finished_tasks
 
+    @property
+    def failed_tasks(self):
+        return self._failed_tasks
+
     @property
     def num_finished_tasks(self):
         return len(self.finished_tasks)
@@ -140,27 +417,84 @@ class DPool(object):
 
     @property
     def num_processes(self):
-        return self.dp_state.num_processes.value
-            
+        return len(self._running_tasks)
+
+    @property
+    def num_running_tasks(self):
+        return sum(1 for task in self._running_tasks.values() if task is not None)
+
+    def _idle_workers(self):
+        return [wid for wid, task in self._running_tasks.items()
+                if task is None and wid not in self._given_tasks
+                and wid not in self._retiring]
+
+    @property
+    def num_idle_processes(self):
+        return len(self._idle_workers())
+
+    def _setup_logging(self):
+        handlers = []
+        if self.log_file is not None:
+            handlers.append(logging.FileHandler(self.log_file))
+        if not logger.hasHandlers():
+            handlers.append(logging.StreamHandler(sys.stdout))
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        for h in handlers:
+            h.setFormatter(formatter)
+            logger.addHandler(h)
+        if logger.level == logging.NOTSET:
+            logger.setLevel(logging.INFO)
+        return handlers
+
     def run(self):
-        print('Loading tasks ...')
-        for task in self.tasks:
-            self.dp_state.q_waiting.put(task)            
-                
-        while self.dp_state.num_waiting_tasks() > 0:
-            self.cls()
-            self.controller.update_and_sleep()
-            if self.controller.if_fix == 0:
-                self._dynamic_pool_adjust_process()
-            elif self.controller.if_fix == 1:
-                self._static_pool_adjust_process()
-        
-        for p in self.processes:
-            p.join()
+        handlers = self._setup_logging()
+        broker = None
+        self.sampler.add_sample(ps.cpu_percent(interval=0.1))
+        self.sampler.start()
+        try:
+            self._load_journal()
+            if self.broker_address is not None:
+                broker = serve_broker(BrokerState(self), self.broker_address, self.authkey)
+            logger.info('event=pool_started total=%d', self.num_total_tasks)
+            t_status = 0.
+            while len(self._pending_tasks) > 0 or len(self._delayed_tasks) > 0 \
+                  or self.num_processes > 0:
+                now = time.time()
+                if now - t_status >= self.controller.sleep_interval:
+                    self.controller.update()
+                    self.log_status()
+                    t_status = now
 
-        print('Done.')
-        
+                self._release_delayed_tasks()
+                if len(self._pending_tasks) > 0:
+                    self._adjust_processes()
+                self._dispatch()
 
-    
+                t_next = t_status + self.controller.sleep_interval
+                if len(self._delayed_tasks) > 0:
+                    t_next = min(t_next, min(t for t, task in self._delayed_tasks))
+                timeout = max(0., t_next - time.time())
+                if self.num_processes == 0:
+                    # Waiting for free CPUs or worker nodes.
+                    timeout = min(timeout, self.sampler.interval)
+                event = self.dp_state.get_event(timeout = timeout)
+                events = self.dp_state.get_all_events()
+                if event is not None:
+                    events.insert(0, event)
+                for event in events:
+                    self._handle_event(event)
+                self._reap_dead_processes()
+                self._expire_remote_workers()
 
-    
+            self.log_status()
+            logger.info('event=pool_done')
+        finally:
+            self.finished = True
+            if broker is not None:
+                stop_broker(broker)
+            self.sampler.stop()
+            if self.journal is not None:
+                self.journal.close()
+            for h in handlers:
+                logger.removeHandler(h)
+                h.close()
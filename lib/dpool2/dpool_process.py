@@ -1,21 +1,60 @@
+import traceback
 from multiprocessing import Process
+from queue import Empty
 
 class DPoolProcess(Process):
-    def __init__(self, dp_state):
+    ''' A process running tasks from dp_state until it gets None.
+
+q_task - queue of the tasks given to this process, see DPoolState.add_queue.
+    None to use the queue that dp_state keeps for worker_id.
+stop_event - if given, the process also exits when it is set, which is
+    checked between tasks every poll_interval sec.
+'''
+    def __init__(self, dp_state, q_task = None, stop_event = None, poll_interval = 1.):
         super().__init__()
         self.dp_state = dp_state
-        self.dp_state.num_processes.value += 1
+        self.q_task = q_task
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+
+    @property
+    def worker_id(self):
+        return self.pid
 
+    def _get_task(self):
+        ''' Return (reason to exit, task).
+'''
+        state = self.dp_state
+        wid = self.worker_id
+        if self.stop_event is None:
+            task = state.get_task(wid)
+        else:
+            while True:
+                if self.stop_event.is_set():
+                    return 'stopped', None
+                try:
+                    task = state.get_task(wid, timeout = self.poll_interval)
+                    break
+                except Empty:
+                    continue
+        if task is None:
+            return 'retired', None
+        return None, task
    
     def run(self):
         state = self.dp_state
-        task = state.get_task()
+        wid = self.worker_id
+        if self.q_task is not None:
+            state.add_queue(wid, self.q_task)
+        state.add_event('joined', wid)
+        reason, task = self._get_task()
         while task is not None:
             task.pid = self.pid
-            print('    Task started: %s on PID %d'%(str(task), self.pid))
-            task.run()
-            print('    Task end: %s on PID %d'%(str(task), self.pid))
-            state.add_finished_task(task)
-            task = state.get_task()
-        print('    Process %d is done.'%self.pid)
-        self.dp_state.num_processes.value -= 1
+            state.add_event('started', wid, task)
+            try:
+                task.run()
+            except Exception:
+                task.exception = traceback.format_exc()
+            state.add_event('finished', wid, task)
+            reason, task = self._get_task()
+        state.add_event('exit', wid, reason)
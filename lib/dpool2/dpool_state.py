@@ -1,53 +1,64 @@
-from multiprocessing import Queue, Lock, Manager, Value
+import queue
+import threading
+from multiprocessing import Queue
 from queue import Empty
 
-import numpy as np
-import psutil as ps
+class DPoolState(object):
+    ''' Queues between the pool and its processes.
 
-from .utils import free_cpu
+q_tasks - worker id -> queue of the tasks given to that worker. None asks
+    the worker to exit. The pool gives a task to a worker only when it is
+    idle, so it always knows the task that a worker holds.
+q_events - (event, worker id, task) sent by the processes, where event is
+    'joined', 'started', 'finished' or 'exit'. The task of 'exit' is
+    the reason, 'retired' or 'stopped'.
 
-class DPoolState(object):
+The queue of a local process is made before it is forked, see add_queue.
+That of a worker node lives in the controller process and is made on the
+first call of the worker through the broker.
+'''
     def __init__(self, controller):
-
-        self.q_waiting = Queue()
-        self.q_finished = Queue()
+        self.q_tasks = {}
+        self.q_events = Queue()
         self.controller = controller
-        self.num_processes = Value('i',0)
-        
-    def get_task(self):
-        free_cpu_num = free_cpu()
-        task = None
+        self._lock = threading.Lock()
+
+    def add_queue(self, wid, q):
+        with self._lock:
+            self.q_tasks[wid] = q
+
+    def get_queue(self, wid):
+        with self._lock:
+            if wid not in self.q_tasks:
+                self.q_tasks[wid] = queue.Queue()
+            return self.q_tasks[wid]
+
+    def remove_queue(self, wid):
+        with self._lock:
+            self.q_tasks.pop(wid, None)
+
+    def get_task(self, wid, timeout = None):
+        return self.get_queue(wid).get(timeout = timeout)
+
+    def put_task(self, wid, task):
+        self.get_queue(wid).put(task)
+
+    def add_event(self, event, pid, task = None):
+        self.q_events.put((event, pid, task))
+
+    def get_event(self, timeout):
+        ''' Wait for an event at most timeout sec. Return None on timeout.
+'''
         try:
-            if free_cpu_num > self.controller.threshold_kill:
-                if self.num_waiting_tasks() > 0:
-                    task = self.q_waiting.get(timeout=self.controller.sleep_interval)
+            return self.q_events.get(timeout=timeout)
         except Empty:
-            pass
-        return task
-
-    # about q_finished
-    def add_finished_task(self, task):
-        self.q_finished.put(task)
-
-    def num_waiting_tasks(self):
-        n2 = self.q_waiting.qsize()        
-        return n2
-    
-    def get_all_finished_tasks(self):
-        tasks = []
+            return None
+
+    def get_all_events(self):
+        events = []
         while True:
             try:
-                tasks.append(self.q_finished.get(block=False))
+                events.append(self.q_events.get(block=False))
             except Empty:
                 break
-        return tasks
-
-    def __str__(self):
-        ''' Output to sumarize pool state.
-'''
-        out = "Pool summary:\n"
-        out += "    # waiting tasks : %d\n"%self.num_waiting_tasks()
-        return out
-        
-                
-    
+        return events
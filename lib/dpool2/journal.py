@@ -0,0 +1,75 @@
+import json
+import time
+from os.path import exists, getsize
+
+class TaskJournal(object):
+    ''' Append-only JSON-lines journal of task states.
+
+Each line is a record of a task identified by Task.key:
+    {"key": ..., "state": ..., "t": ..., ...}
+where state is 'queued', 'running', 'done' or 'failed'.
+'done' records carry t_consumed and 'failed' records carry retries and error.
+
+The latest record of a task is its state. A line cut by a crash is ignored
+and removed when the journal is reopened, so that new records start on a
+line of their own and a journal can always be reopened to resume a run.
+'''
+    STATES = ('queued', 'running', 'done', 'failed')
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.states = {}
+        self.records = {}
+        if exists(file_name):
+            self._replay()
+        self._fid = open(file_name, 'at')
+
+    def _replay(self):
+        # end of the last complete line
+        end = 0
+        with open(self.file_name, 'rb') as fid:
+            for ln in fid:
+                if not ln.endswith(b'\n'):
+                    break
+                end += len(ln)
+                try:
+                    rec = json.loads(ln.decode())
+                except ValueError:
+                    continue
+                self.states[rec['key']] = rec['state']
+                self.records[rec['key']] = rec
+
+        if end < getsize(self.file_name):
+            with open(self.file_name, 'r+b') as fid:
+                fid.truncate(end)
+
+    def record(self, key, state, **kwargs):
+        assert state in self.STATES, 'Unknown state %s.'%state
+        rec = {'key':key, 'state':state, 't':time.time()}
+        rec.update(kwargs)
+        self._fid.write(json.dumps(rec) + '\n')
+        self._fid.flush()
+        self.states[key] = state
+        self.records[key] = rec
+
+    def get_state(self, key):
+        return self.states.get(key)
+
+    def is_done(self, key):
+        return self.states.get(key) == 'done'
+
+    def durations(self):
+        ''' t_consumed of done tasks.
+'''
+        return [rec['t_consumed'] for rec in self.records.values()
+                if rec['state'] == 'done' and rec.get('t_consumed') is not None]
+
+    def close(self):
+        if not self._fid.closed:
+            self._fid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import psutil as ps
+
+class LoadSampler(threading.Thread):
+    ''' Sample CPU usage in a background thread.
+
+interval - sampling cadence in sec.
+num_samples - number of latest samples averaged for free_cpu.
+
+Reading free_cpu never blocks, unlike utils.free_cpu, which takes
+interval*ntimes seconds per call.
+'''
+    def __init__(self, interval = 1., num_samples = 5):
+        super().__init__(daemon = True)
+        self.interval = interval
+        self._samples = deque(maxlen = num_samples)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.t_sample = None
+        self.ncpu = ps.cpu_count()
+
+    def run(self):
+        # The first call of cpu_percent(None) is meaningless.
+        ps.cpu_percent(interval=None)
+        while not self._stop_event.wait(self.interval):
+            self.add_sample(ps.cpu_percent(interval=None))
+
+    def add_sample(self, cpu_percent):
+        with self._lock:
+            self._samples.append(cpu_percent)
+            self.t_sample = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def free_cpu(self):
+        with self._lock:
+            if len(self._samples) == 0:
+                return None
+            cpu_percent = np.mean(self._samples)
+        return self.ncpu * (1. - cpu_percent/100.)
@@ -1,22 +1,55 @@
+import numbers
 import time
+import warnings
 
 def time_to_string(t):
     tstr = time.strftime("%H:%M", time.localtime(t))
     return tstr
 
+def _is_plain(arg):
+    ''' True if str(arg) is the same across runs, which is not the case
+of an object whose repr has its address.
+'''
+    if arg is None or isinstance(arg, (str, bytes, numbers.Number)):
+        return True
+    if isinstance(arg, (list, tuple)):
+        return all(_is_plain(a) for a in arg)
+    return False
+
 class Task(object):
     def __init__(self,
                  target,
                  args = (),
-                 kwargs = {}):
+                 kwargs = {},
+                 key = None):
+        ''' key - name of the task in a journal, which should be the same
+across runs. Default is the call, e.g. "_straina(epoch=10, file_flt=flt_0001)".
+    Give it if any argument is not a string, a number or a list of them.
+'''
         self.target = target
         self.args = args
         self.kwargs = kwargs
+        self._key = key
 
         self.t_start = None
         self.t_end = None
         self.t_consumed = None
         self.pid = None
+        self.exception = None
+        self.retries = 0
+
+    @property
+    def key(self):
+        if self._key is not None:
+            return self._key
+        if not all(_is_plain(arg) for arg in
+                   list(self.args) + list(self.kwargs.values())):
+            warnings.warn('Task %s has no key and an argument that is not a '
+                          'string or a number. Its default key may change '
+                          'between runs.'%self.target.__name__)
+        args = ['%s'%arg for arg in self.args]
+        args += ['%s=%s'%(k, self.kwargs[k]) for k in sorted(self.kwargs)]
+        return '%s(%s)'%(self.target.__name__, ', '.join(args))
 
     def run(self):
         self.t_start = time.time()
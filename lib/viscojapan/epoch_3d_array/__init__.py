@@ -3,5 +3,8 @@ from .epoch_sites_3d_array import *
 from .displacement import *
 from .g import *
 from .slip import *
+from .slab_cache import *
+from .masked_array_3d import *
+from .storage import *
 
 __author__ = 'zy'
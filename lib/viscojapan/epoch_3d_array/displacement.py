@@ -1,6 +1,7 @@
 import numpy as np
 
 from .epoch_sites_3d_array import EpochSites3DArray
+from .storage import read_array_3d
 
 __all__ = ['Displacement']
 
@@ -21,7 +22,7 @@ class Displacement(EpochSites3DArray):
 
     # displacement as 3d
     def get_cumu_disp_3d(self):
-        return self.get_array_3d()
+        return self.get_array_3d()[...]
 
     def get_post_disp_3d(self):
         disp = self.get_cumu_disp_3d()
@@ -62,10 +63,12 @@ class Displacement(EpochSites3DArray):
         return hor_mag
 
     def cumu_ts(self,site, cmpt):
-        return self._extract_time_series(self.get_cumu_disp_3d(), site, cmpt)
+        # only the time series is read
+        return self._extract_time_series(self.get_array_3d_lazy(), site, cmpt)
 
     def post_ts(self,site, cmpt):
-        return self._extract_time_series(self.get_post_disp_3d(), site, cmpt)
+        ts = self.cumu_ts(site, cmpt)
+        return ts - ts[0]
 
     def vel_ts(self,site, cmpt):
         return self._extract_time_series(self.get_velocity_3d(), site, cmpt)
@@ -80,10 +83,7 @@ class Displacement(EpochSites3DArray):
              mask_sites = None,
              memory_mode = False # if memory_mode is True, all the data will be loaded into memory.
     ):
-        if memory_mode:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, cls.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
         sites = [site.decode() for site in fid['sites'][...]]
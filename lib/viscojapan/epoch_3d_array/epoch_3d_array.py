@@ -1,6 +1,8 @@
 import numpy as np
 import h5py
 
+from .storage import create_data3d, write_epoch_slice, read_array_3d
+
 __author__ = 'zy'
 __all__ = ['Epoch3DArray']
 
@@ -41,23 +43,39 @@ class _Epoch3DArray(object):
         '''
         return self._array_3d
 
+    def get_array_3d_lazy(self):
+        '''
+        Like get_array_3d, but data in a h5py file may be returned without being read.
+        Use it when only part of the array is needed.
+        :return: ndarray(dim=3), or an object that reads data when indexed.
+        '''
+        return self.get_array_3d()
+
     def get_epochs(self):
         return self._epochs
 
     # Serialization
-    def save(self, fn):
+    def save(self, fn, **storage):
+        '''
+        :param storage: options of create_data3d, i.e. layout, compression, dtype and
+            error_bound. Without them, the array is saved contiguous and uncompressed.
+        '''
         with h5py.File(fn, 'w') as fid:
-            fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY] = self._array_3d[...]
+            if len(storage) == 0:
+                fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY] = self._array_3d[...]
+            else:
+                dset = create_data3d(fid, self._array_3d.shape,
+                                     name = self.HDF5_DATASET_NAME_FOR_3D_ARRAY,
+                                     **storage)
+                for nth in range(self._array_3d.shape[0]):
+                    write_epoch_slice(dset, nth, self._array_3d[nth,:,:])
             fid['epochs'] = self._epochs
 
     @classmethod
     def load(cls,fid,
              memory_mode = False # if memory_mode is True, all the data will be loaded into memory.
     ):
-        if memory_mode:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, cls.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
 
@@ -119,7 +137,7 @@ class Epoch3DArray(_Epoch3DArray):
         :param nth: int
         :return: np.ndarray
         '''
-        return self.get_array_3d()[nth,:,:]
+        return self.get_array_3d_lazy()[nth,:,:]
 
     # def get_data_at_epoch_no_interpolation(self, epoch):
     #     '''
@@ -130,27 +148,55 @@ class Epoch3DArray(_Epoch3DArray):
     #     nth = epochs.index(epoch)
     #     return self.get_data_at_nth_epoch(nth)
 
-    def get_data_at_epoch(self, epoch):
-        epochs = self.get_epochs()
-        self._assert_epoch_within_range(epoch)
-        if epoch in epochs:
-            nth = epochs.index(epoch)
-            return self.get_data_at_nth_epoch(nth)
-
-        for nth, ti in enumerate(epochs[1:], start=1):
-            if epoch <= ti:
-                break
-
-        t1 = epochs[nth-1]
-        val1 = self.get_data_at_nth_epoch(nth-1)
-
-        t2 = epochs[nth]
-        val2 = self.get_data_at_nth_epoch(nth)
-
-        val = (epoch-t1) / (t2-t1) * (val2-val1) + val1
-
-        return val
+    def get_interp_weights(self, epochs):
+        '''
+        Find the bracketing epochs of each epoch by binary search.
+        Data at epochs[i] is data[nth1[i]] + w[i] * (data[nth2[i]] - data[nth1[i]]).
+        If epochs[i] is one of the epochs, nth1[i] == nth2[i] and w[i] == 0.
+        :param epochs: list or 1-d array
+        :return: (nth1, nth2, w), 1-d arrays
+        '''
+        t = np.asarray(self.get_epochs(), dtype=float)
+        epochs = np.asarray(epochs, dtype=float).reshape([-1])
+        if len(epochs) > 0:
+            self._assert_epoch_within_range(epochs.max())
+            self._assert_epoch_within_range(epochs.min())
+
+        nth2 = np.searchsorted(t, epochs, side='left')
+        exact = t[nth2] == epochs
+        nth1 = np.where(exact, nth2, nth2 - 1)
+
+        t1 = t[nth1]
+        t2 = t[nth2]
+        w = np.zeros(len(epochs), dtype=float)
+        w[~exact] = (epochs[~exact] - t1[~exact]) / (t2[~exact] - t1[~exact])
+        return nth1, nth2, w
+
+    def interp_epochs(self, epochs):
+        '''
+        Data at many epochs by linear interpolation.
+        Every needed slice is read once, then all epochs are blended in one operation.
+        :param epochs: list or 1-d array
+        :return: ndarray(dim=3), the first dimension is epochs.
+        '''
+        nth1, nth2, w = self.get_interp_weights(epochs)
+
+        # sorted unique indices, so that h5py datasets can be indexed too.
+        rows = np.unique(np.hstack([nth1, nth2]))
+        data = self.get_array_3d_lazy()[list(rows),:,:]
+        if data.dtype.kind != 'f':
+            data = data.astype(float)
+
+        out = data[np.searchsorted(rows, nth1)]
+        ch = w != 0
+        if np.any(ch):
+            val1 = out[ch]
+            val2 = data[np.searchsorted(rows, nth2[ch])]
+            out[ch] = w[ch].reshape([-1,1,1]) * (val2 - val1) + val1
+        return out
 
+    def get_data_at_epoch(self, epoch):
+        return self.interp_epochs([epoch])[0]
 
     def __getitem__(self, name):
         return self.get_data_at_epoch(name)
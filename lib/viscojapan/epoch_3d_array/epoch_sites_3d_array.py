@@ -5,11 +5,21 @@ __author__ = 'zy'
 __all__ = ['EpochSites3DArray']
 
 from .epoch_3d_array import Epoch3DArray
-
-def if_ascending(ll):
-    if len(ll) == 1:
-        return True
-    return all(ll[i] <= ll[i+1] for i in range(len(ll)-1))
+from .masked_array_3d import mask_array_3d
+
+def _build_index(sites):
+    ''' Map each site to its first position, as list.index does.
+    '''
+    index = {}
+    for nth, site in enumerate(sites):
+        index.setdefault(site, nth)
+    return index
+
+def _lookup(index, sites, name):
+    try:
+        return np.fromiter((index[site] for site in sites), dtype=int, count=len(sites))
+    except KeyError as err:
+        raise AssertionError("%s is not in the %s list."%(err.args[0], name))
 
 class EpochSites3DArray(Epoch3DArray):
     def __init__(self,
@@ -30,6 +40,7 @@ class EpochSites3DArray(Epoch3DArray):
                          epochs = epochs)
 
         self._sites = sites
+        self._site_index = _build_index(sites)
 
         # core data, replacing _array_3d
         self._array_3d_masked = None
@@ -39,7 +50,7 @@ class EpochSites3DArray(Epoch3DArray):
 
     def assert_in_sites(self, sites):
         for s in sites:
-            assert s in self._sites, "%s is not in the sites list."%s
+            assert s in self._site_index, "%s is not in the sites list."%s
 
     def get_sites(self):
         return self._sites
@@ -59,34 +70,51 @@ class EpochSites3DArray(Epoch3DArray):
         else:
             self.assert_in_sites(mask_sites)
         self._mask_sites = mask_sites
+        self._mask_site_index = _build_index(mask_sites)
 
         mask = self.get_mask()
 
         array_3d = super().get_array_3d()
 
-        if if_ascending(mask):
-            # faster if mask is ascending
-            self._array_3d_masked = array_3d[:,mask,:]
-        else:
-            # slower if mask is not ordered.
-            self._array_3d_masked = np.hstack([array_3d[:,(mi,),:] for mi in mask])
+        # Lazy if array_3d is a h5py dataset: nothing is read until indexed.
+        self._array_3d_masked = mask_array_3d(array_3d, mask)
 
     def get_mask(self):
-        ch = []
-        for site in self._mask_sites:
-            ch.append(self.get_index_in_sites(site))
-        ch = np.asarray(ch)
-        return list(ch)
+        return list(self.get_indices(self._mask_sites))
 
     def get_index_in_sites(self, site):
-        return self._sites.index(site)
+        return self._site_index[site]
 
     def get_index_in_mask_sites(self, site):
-        return self._mask_sites.index(site)
+        return self._mask_site_index[site]
+
+    def get_indices(self, sites):
+        ''' Indices of sites in the sites list.
+        :param sites: list
+        :return: ndarray(dtype=int)
+        '''
+        return _lookup(self._site_index, sites, 'sites')
+
+    def get_indices_in_mask_sites(self, sites):
+        ''' Indices of sites in the mask sites list.
+        :param sites: list
+        :return: ndarray(dtype=int)
+        '''
+        return _lookup(self._mask_site_index, sites, 'mask sites')
 
     def get_array_3d(self):
         ''' This function overrides get_array_3d, which will mask outputs according to the mask array.
-        :return: ndarray(dim=3)
+        :return: ndarray(dim=3). If the data is in a h5py dataset, it is read on every call.
+        '''
+        arr = self._array_3d_masked
+        if isinstance(arr, np.ndarray):
+            return arr
+        return arr[...]
+
+    def get_array_3d_lazy(self):
+        ''' Masked data without reading it.
+        :return: ndarray(dim=3), or MaskedArray3D if the data is in a h5py dataset.
+            Only the indexed part of a MaskedArray3D is read.
         '''
         return self._array_3d_masked
 
@@ -105,9 +133,9 @@ class EpochSites3DArray(Epoch3DArray):
                    sites = sites,
                    mask_sites=mask_sites)
 
-    def save(self, fn):
-        super().save(fn)
-        with h5py.File(fn) as fid:
+    def save(self, fn, **storage):
+        super().save(fn, **storage)
+        with h5py.File(fn, 'a') as fid:
             sites = self.get_sites()
             sites = [site.encode() for site in sites]
             fid['sites'] = sites
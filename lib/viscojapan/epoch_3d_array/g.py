@@ -4,8 +4,16 @@ __author__ = 'zy'
 __all__ = ['G']
 
 from .epoch_sites_3d_array import EpochSites3DArray
+from .storage import read_array_3d
+from .slab_cache import default_slab_cache
 
 class G(EpochSites3DArray):
+    # Slab cache is disabled for a G by default. Use enable_slab_cache to turn
+    # it on. EpochG turns it on unless use_slab_cache is False.
+    _slab_cache = None
+    _slab_cache_source = None
+    _slab_cache_token = None
+
     def __init__(self,
                  g_3d,
                  epochs,
@@ -24,25 +32,62 @@ class G(EpochSites3DArray):
     def get_num_subflts(self):
         return self._num_subflts
 
+    # slab cache
+    def enable_slab_cache(self, source, cache = None):
+        '''
+        Serve repeated get_data_at_epoch calls from a LRU cache.
+        :param source: hashable, identifies the data, e.g. name of the G file.
+        :param cache: SlabCache, default is the cache shared by the process.
+        '''
+        if cache is None:
+            cache = default_slab_cache
+        self._slab_cache = cache
+        self._slab_cache_source = source
+        self._slab_cache_token = cache.register(source, self.get_mask_sites())
+
+    def disable_slab_cache(self):
+        self._slab_cache = None
+        self._slab_cache_source = None
+        self._slab_cache_token = None
+
+    def get_slab_cache_stats(self):
+        if self._slab_cache is None:
+            return None
+        return self._slab_cache.get_stats()
+
+    def set_mask_sites(self, mask_sites):
+        super().set_mask_sites(mask_sites)
+        if self._slab_cache is not None:
+            self.enable_slab_cache(self._slab_cache_source, self._slab_cache)
+
+    def get_data_at_epoch(self, epoch):
+        if self._slab_cache is None:
+            return super().get_data_at_epoch(epoch)
+
+        return self._slab_cache.get(
+            (self._slab_cache_token, epoch),
+            lambda : super(G, self).get_data_at_epoch(epoch))
+
     # displacement as 3d
     def get_cumu_disp_3d(self):
-        return self.get_array_3d()
+        return self.get_array_3d()[...]
 
     def get_post_disp_3d(self):
         disp = self.get_cumu_disp_3d()
         return disp - disp[0,:,:]
 
     def get_mask(self):
-        ch = super().get_mask()
-        ch1 = np.asarray(ch)*3
-        ch2 = np.asarray([ch1, ch1+1, ch1+2]).T.flatten()
-        return ch2
+        # e, n, u rows of every site
+        ch = np.asarray(super().get_mask(), dtype=int)*3
+        return (ch.reshape([-1,1]) + np.arange(3)).flatten()
 
     def cumu_ts(self,site, cmpt, nth_subflt):
-        return self._extract_time_series(self.get_cumu_disp_3d(), site, cmpt, nth_subflt)
+        # only the time series is read
+        return self._extract_time_series(self.get_array_3d_lazy(), site, cmpt, nth_subflt)
 
     def post_ts(self,site, cmpt, nth_subflt):
-        return self._extract_time_series(self.get_post_disp_3d(), site, cmpt, nth_subflt)
+        ts = self.cumu_ts(site, cmpt, nth_subflt)
+        return ts - ts[0]
 
     def _extract_time_series(self, arr3d, site, cmpt, nth_subflt):
         site_idx = self.get_index_in_mask_sites(site)
@@ -54,10 +99,7 @@ class G(EpochSites3DArray):
              mask_sites = None,
              memory_mode = False # if memory_mode is True, all the data will be loaded into memory.
     ):
-        if memory_mode:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, cls.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
         sites = [site.decode() for site in fid['sites'][...]]
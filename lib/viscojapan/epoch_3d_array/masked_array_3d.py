@@ -0,0 +1,117 @@
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+__author__ = 'zy'
+__all__ = ['MaskedArray3D', 'mask_array_3d']
+
+def _get_runs(sorted_idx):
+    ''' Split sorted unique indices into runs of consecutive indices.
+    :return: list of (start, stop) of the runs, and their positions in sorted_idx
+    '''
+    if len(sorted_idx) == 0:
+        return [], []
+    breaks = np.nonzero(np.diff(sorted_idx) != 1)[0] + 1
+    starts = np.hstack([[0], breaks])
+    stops = np.hstack([breaks, [len(sorted_idx)]])
+    runs = [(int(sorted_idx[a]), int(sorted_idx[b-1])+1) for a, b in zip(starts, stops)]
+    positions = [(int(a), int(b)) for a, b in zip(starts, stops)]
+    return runs, positions
+
+def _as_selection(idx):
+    ''' Selection along one axis for a h5py dataset. h5py requires increasing
+    indices, so unique sorted indices are selected, and the inverse map
+    gives the requested order. A slice is used if the indices are consecutive.
+    '''
+    uniq, inverse = np.unique(idx, return_inverse=True)
+    if uniq[-1] - uniq[0] + 1 == len(uniq):
+        return slice(int(uniq[0]), int(uniq[-1])+1), inverse, len(uniq)
+    return list(uniq), inverse, len(uniq)
+
+def _normalize_key(key, ndim=3):
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is Ellipsis for k in key):
+        nth = [ii for ii, k in enumerate(key) if k is Ellipsis][0]
+        key = key[:nth] + (slice(None),)*(ndim - len(key) + 1) + key[nth+1:]
+    key = key + (slice(None),)*(ndim - len(key))
+    assert len(key) == ndim, 'Too many indices.'
+    return key
+
+class MaskedArray3D(NDArrayOperatorsMixin):
+    ''' Read-only view of array_3d[:, mask, :] that reads nothing until indexed.
+
+    Only the requested epochs and rows are read. Masked rows are read as
+    few contiguous runs, which are hyperslab reads on a h5py dataset.
+    Indexing is outer indexing, as with h5py datasets: index arrays
+    select along their own axes independently.
+    '''
+    def __init__(self, array_3d, mask):
+        assert len(array_3d.shape) == 3
+        self._array_3d = array_3d
+        self._mask = np.asarray(mask, dtype=int).reshape([-1])
+
+        self.shape = (array_3d.shape[0], len(self._mask), array_3d.shape[2])
+        self.dtype = np.dtype(array_3d.dtype)
+        self.ndim = 3
+        self.size = int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        key = _normalize_key(key)
+
+        idx = [np.arange(n)[k] for n, k in zip(self.shape, key)]
+        scalar_axes = tuple(ii for ii, k in enumerate(idx) if np.ndim(k) == 0)
+        idx = [np.atleast_1d(k) for k in idx]
+
+        out = self._read(idx[0], self._mask[idx[1]], idx[2])
+        if len(scalar_axes) > 0:
+            out = out.reshape([n for ii, n in enumerate(out.shape) if ii not in scalar_axes])
+        return out
+
+    def _read(self, epochs, rows, cols):
+        if len(epochs) == 0 or len(rows) == 0 or len(cols) == 0:
+            return np.empty((len(epochs), len(rows), len(cols)), dtype=self.dtype)
+
+        sel0, inv0, num_epochs = _as_selection(epochs)
+
+        # h5py allows only one index list, so the covering range of cols is read.
+        col1 = int(np.min(cols))
+        col2 = int(np.max(cols)) + 1
+        inv2 = np.asarray(cols) - col1
+
+        uniq_rows, inv1 = np.unique(rows, return_inverse=True)
+        runs, positions = _get_runs(uniq_rows)
+
+        buf = np.empty((num_epochs, len(uniq_rows), col2 - col1), dtype=self.dtype)
+        for (start, stop), (pos1, pos2) in zip(runs, positions):
+            buf[:, pos1:pos2, :] = self._array_3d[sel0, start:stop, col1:col2]
+
+        return buf[np.ix_(inv0, inv1, inv2)]
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[...]
+        if dtype is not None:
+            out = out.astype(dtype)
+        return out
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(ii) if isinstance(ii, MaskedArray3D) else ii
+                       for ii in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+def mask_array_3d(array_3d, mask):
+    ''' array_3d[:, mask, :]
+    An in-memory array is masked at once, which is a view without copy if the
+    mask is consecutive. Otherwise a lazy MaskedArray3D is returned.
+    '''
+    mask = np.asarray(mask, dtype=int).reshape([-1])
+    consecutive = len(mask) > 0 and np.all(np.diff(mask) == 1)
+
+    if isinstance(array_3d, np.ndarray):
+        if consecutive:
+            return array_3d[:, mask[0]:mask[-1]+1, :]
+        return array_3d[:, mask, :]
+
+    return MaskedArray3D(array_3d, mask)
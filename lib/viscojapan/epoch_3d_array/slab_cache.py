@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+__author__ = 'zy'
+__all__ = ['SlabCache', 'default_slab_cache']
+
+class SlabCache(object):
+    ''' LRU cache of 2D slabs (data at one epoch) with a memory budget.
+
+Keys are (token, epoch), where token identifies the data source and
+the mask sites. Tokens are issued by register() so that a long list of
+mask sites is hashed only once per object, not once per lookup. At most
+max_tokens of them are kept; the least recently registered one is
+dropped with its slabs, and is issued anew if registered again.
+
+Every slab returned is read-only, since it may be shared between callers.
+'''
+    def __init__(self, max_bytes = 512*1024**2, max_tokens = 1024):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+
+        self._slabs = OrderedDict()
+        self.nbytes = 0
+
+        self._tokens = OrderedDict()
+        self._next_token = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, source, mask_sites):
+        key = (source, tuple(mask_sites))
+        if key in self._tokens:
+            self._tokens.move_to_end(key)
+            return self._tokens[key]
+
+        token = self._next_token
+        self._next_token += 1
+        self._tokens[key] = token
+        while len(self._tokens) > self.max_tokens:
+            _, old = self._tokens.popitem(last=False)
+            self._drop_token(old)
+        return token
+
+    def _drop_token(self, token):
+        for key in [key for key in self._slabs if key[0] == token]:
+            self.nbytes -= self._slabs.pop(key).nbytes
+
+    def get(self, key, compute):
+        ''' Return the slab at key. If it is not cached,
+compute() is called to produce it.
+'''
+        if key in self._slabs:
+            self.hits += 1
+            self._slabs.move_to_end(key)
+            return self._slabs[key]
+
+        self.misses += 1
+        slab = compute()
+        self._put(key, slab)
+        return slab
+
+    def _put(self, key, slab):
+        # Slabs are shared between callers. Freeze them so that an
+        # in-place operation can not corrupt the cache. A slab too large
+        # to be cached is frozen too, so that no caller relies on
+        # writing to it.
+        slab.flags.writeable = False
+        if slab.nbytes > self.max_bytes:
+            return
+
+        self._slabs[key] = slab
+        self.nbytes += slab.nbytes
+        self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            _, slab = self._slabs.popitem(last=False)
+            self.nbytes -= slab.nbytes
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self._slabs.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._slabs)
+
+    def get_stats(self):
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'num_slabs' : len(self._slabs),
+                'nbytes' : self.nbytes,
+                'max_bytes' : self.max_bytes}
+
+# Shared by all G objects in the process, which is where every EpochG
+# caches its slabs by default. Its budget, 512MB, is for the whole process;
+# change it with default_slab_cache.set_max_bytes.
+default_slab_cache = SlabCache()
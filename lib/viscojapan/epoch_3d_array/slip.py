@@ -6,6 +6,7 @@ import numpy as np
 import h5py
 
 from .epoch_3d_array import Epoch3DArray
+from .storage import read_array_3d
 
 __all__ = ['Slip']
 
@@ -35,7 +36,7 @@ class Slip(Epoch3DArray):
                          epochs = epochs
         )
 
-        slip_shape = self.get_array_3d().shape
+        slip_shape = self.get_array_3d_lazy().shape
         self.num_subflt_along_strike = slip_shape[2]
         self.num_subflt_along_dip = slip_shape[1]
 
@@ -117,9 +118,7 @@ class Slip(Epoch3DArray):
         if list(epochs) == self.get_epochs():
             return self
 
-        tp = [self.get_cumu_slip_at_epoch(t)[None,:,:] for t in epochs]
-
-        array_3d = np.vstack(tp)
+        array_3d = self.interp_epochs(epochs)
 
         return self.init_with_cumu_slip_3d(
             cumu_slip_3d = array_3d,
@@ -132,10 +131,7 @@ class Slip(Epoch3DArray):
     ):
         assert exists(file), "File %s doesn't not exist"%file
         fid = h5py.File(file,'r')
-        if memory_mode:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[cls.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, cls.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
 
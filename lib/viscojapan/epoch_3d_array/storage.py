@@ -0,0 +1,101 @@
+import numpy as np
+
+__author__ = 'zy'
+__all__ = ['get_chunks', 'create_data3d', 'write_epoch_slice', 'read_array_3d']
+
+LAYOUTS = ('epoch', 'site', 'both')
+
+def get_chunks(shape, layout = 'epoch', itemsize = 8, chunk_bytes = 2**20):
+    '''
+    Chunk shape of a (epochs, rows, subflts) dataset for an access pattern:
+        'epoch' - [epoch, rows, :], one epoch per chunk.
+        'site'  - [:, row, subflt], all epochs of a few sites per chunk.
+        'both'  - 4 epochs and a few sites per chunk, good enough for both.
+    Rows are chunked by whole sites (3 rows). A chunk is about chunk_bytes.
+    :return: tuple
+    '''
+    assert layout in LAYOUTS, 'layout should be one of %s.'%str(LAYOUTS)
+    num_epochs, num_rows, num_cols = shape
+
+    if layout == 'epoch':
+        chunk_epochs = 1
+        chunk_cols = num_cols
+    elif layout == 'site':
+        chunk_epochs = num_epochs
+        chunk_cols = max(1, min(num_cols, chunk_bytes // (itemsize*num_epochs*3)))
+    else:
+        chunk_epochs = min(num_epochs, 4)
+        chunk_cols = num_cols
+
+    chunk_rows = chunk_bytes // (itemsize*chunk_epochs*chunk_cols)
+    chunk_rows = max(3, chunk_rows // 3 * 3)
+    chunk_rows = min(num_rows, chunk_rows)
+
+    return (max(1, chunk_epochs), max(1, chunk_rows), max(1, chunk_cols))
+
+def create_data3d(fid, shape,
+                  name = 'data3d',
+                  layout = 'epoch',
+                  compression = None,
+                  dtype = 'float64',
+                  error_bound = None):
+    '''
+    Create a chunked dataset for a 3d array and record its layout in attributes.
+    :param compression: None, 'gzip' or 'lzf'. Compressed data are shuffled first.
+    :param dtype: 'float64' or 'float32'.
+    :param error_bound: maximum absolute error allowed when dtype is 'float32'.
+        It is checked by write_epoch_slice.
+    :return: h5py dataset
+    '''
+    dtype = np.dtype(dtype)
+    assert compression in (None, 'gzip', 'lzf')
+    if dtype == np.float32:
+        assert error_bound is not None, 'float32 storage needs an error bound.'
+
+    kwargs = {}
+    if compression is not None:
+        kwargs['compression'] = compression
+        kwargs['shuffle'] = True
+        if compression == 'gzip':
+            kwargs['compression_opts'] = 4
+
+    chunks = get_chunks(shape, layout, dtype.itemsize)
+    dset = fid.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks, **kwargs)
+
+    dset.attrs['layout'] = layout
+    dset.attrs['compression'] = 'none' if compression is None else compression
+    dset.attrs['storage_dtype'] = dtype.name
+    if error_bound is not None:
+        dset.attrs['error_bound'] = error_bound
+        dset.attrs['max_error'] = 0.
+    return dset
+
+def write_epoch_slice(dset, nth, data):
+    '''
+    dset[nth,:,:] = data, checking the error bound of float32 storage.
+    '''
+    data = np.asarray(data)
+    if dset.dtype == np.float32 and data.dtype != np.float32:
+        stored = data.astype(np.float32)
+        err = float(np.max(np.abs(stored - data))) if data.size > 0 else 0.
+        error_bound = dset.attrs['error_bound']
+        assert err <= error_bound, \
+               'float32 error %g is larger than the error bound %g.'%(err, error_bound)
+        dset.attrs['max_error'] = max(err, float(dset.attrs['max_error']))
+        data = stored
+    dset[nth,:,:] = data
+
+def read_array_3d(fid, name = 'data3d', memory_mode = False):
+    '''
+    :param memory_mode: If True, the whole array is read into memory, floats as float64.
+        HDF5 reads chunk by chunk and converts the type in place, so no
+        temporary copy is made for float32 or compressed storage.
+    :return: h5py dataset or ndarray
+    '''
+    dset = fid[name]
+    if not memory_mode:
+        return dset
+    out = np.empty(dset.shape, dtype=np.float64 if dset.dtype.kind == 'f' else dset.dtype)
+    if out.size > 0:
+        dset.read_direct(out)
+    return out
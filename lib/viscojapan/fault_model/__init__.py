@@ -1,5 +1,6 @@
 from .subfault_meshes import SubfaultsMeshes, \
     SubfaultsMeshesByLength, SubfaultsMeshesByNumber
+from .fault_geometry import *
 from .fault_file_reader import *
 from .fault import *
 from .fault_framework import *
@@ -1,45 +1,45 @@
-from os.path import exists
-
-from numpy import asarray
 import numpy as np
 
-import h5py
-
-from ..utils import assert_positive_integer, get_middle_point
+from ..utils import get_middle_point
+from .fault_geometry import load_fault_geometry
 
 __all__ = ['FaultFileReader']
 
 class FaultFileReader(object):
+    ''' Read a fault file. The file is read once into a FaultGeometry
+that is shared by all the readers of the file (see load_fault_geometry),
+so that creating a reader is cheap. Arrays are returned as copies.
+'''
     def __init__(self, fault_file):
         self.fault_file = fault_file
-        self.fid = self.open()
-
-    def open(self):
-        ''' 'r' - Readonly, file must exist'''
-        assert exists(self.fault_file), \
-               'File %s does not exist!'%self.fault_file
-        fid = h5py.File(self.fault_file, 'r')
-        return fid
+        self.geometry = load_fault_geometry(fault_file)
 
     def close(self):
-        if self.fid is not None:
-            self.fid.close()
-        self.fid = None
+        pass
+
+    def _get_array(self, name):
+        res = getattr(self.geometry, name)
+        assert res is not None, \
+               '%s is not in %s.'%(name, self.fault_file)
+        return np.array(res)
+
+    def _get_float(self, name):
+        res = getattr(self.geometry, name)
+        assert res is not None, \
+               '%s is not in %s.'%(name, self.fault_file)
+        return res
 
     @property
     def num_subflt_along_strike(self):
-        res = self.fid['num_subflt_along_strike'][...]
-        return int(res)
+        return self.geometry.num_subflt_along_strike
 
     @property
     def num_subflt_along_dip(self):
-        res = self.fid['num_subflt_along_dip'][...]
-        return int(res)
+        return self.geometry.num_subflt_along_dip
 
     @property
     def LLons(self):
-        res = self.fid['meshes/LLons'][...]
-        return np.asarray(res)
+        return self._get_array('LLons')
 
     @property
     def LLons_mid(self):
@@ -47,81 +47,50 @@ class FaultFileReader(object):
 
     @property
     def LLats(self):
-        res = self.fid['meshes/LLats'][...]
-        return np.asarray(res)
+        return self._get_array('LLats')
 
     @property
     def LLats_mid(self):
         return get_middle_point(self.LLats)
-        
 
     @property
     def ddeps(self):
-        res = self.fid['meshes/ddeps'][...]
-        return res
+        return self._get_array('ddeps')
 
     @property
     def ddips(self):
-        res = self.fid['meshes/ddips'][...]
-        return res
+        return self._get_array('ddips')
 
     @property
     def subflt_sz_strike(self):
-        res = self.fid['subflt_sz_strike'][...]
-        return float(res)
+        return self._get_float('subflt_sz_strike')
 
     @property
     def subflt_sz_dip(self):
-        res = self.fid['subflt_sz_dip'][...]
-        return float(res)
+        return self._get_float('subflt_sz_dip')
 
     @property
     def flt_strike(self):
-        assert 'flt_strike' in self.fid
-        res = self.fid['flt_strike'][...]
-        return float(res)
+        return self._get_float('flt_strike')
 
     @property
     def depth_bottom(self):
-        assert 'depth_bottom' in self.fid
-        res = self.fid['depth_bottom'][...]
-        return float(res)
+        return self._get_float('depth_bottom')
 
     @property
     def depth_top(self):
-        assert 'depth_top' in self.fid
-        res = self.fid['depth_top'][...]
-        return float(res)
+        return self._get_float('depth_top')
 
     @property
     def x_f(self):
-        assert 'x_f' in self.fid
-        res = self.fid['x_f'][...]
-        return asarray(res,float)
+        return self._get_array('x_f')
 
     @property
     def y_f(self):
-        assert 'y_f' in self.fid
-        res = self.fid['y_f'][...]
-        return asarray(res,float)
+        return self._get_array('y_f')
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
         self.close()
-
-    def __del__(self):
-        self.close()        
-
-
-    
-
-    
-            
-            
-
-    
-
-    
-        
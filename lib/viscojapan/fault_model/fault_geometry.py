@@ -0,0 +1,68 @@
+from os.path import exists, realpath, getmtime
+
+import numpy as np
+import h5py
+
+__author__ = 'zy'
+
+__all__ = ['FaultGeometry', 'load_fault_geometry', 'clear_fault_geometry_cache']
+
+class FaultGeometry(object):
+    ''' Geometry in a fault file, read at once. It is immutable:
+attributes cannot be set and arrays are read-only, so that one object
+can be shared by all the users of the file.
+Datasets that are not in the file are None.
+'''
+    INTS = ('num_subflt_along_strike', 'num_subflt_along_dip')
+    FLOATS = ('subflt_sz_strike', 'subflt_sz_dip',
+              'flt_strike', 'depth_bottom', 'depth_top')
+    ARRAYS = {'LLons' : 'meshes/LLons',
+              'LLats' : 'meshes/LLats',
+              'ddeps' : 'meshes/ddeps',
+              'ddips' : 'meshes/ddips',
+              'x_f' : 'x_f',
+              'y_f' : 'y_f'}
+
+    def __init__(self, fault_file):
+        assert exists(fault_file), \
+               'File %s does not exist!'%fault_file
+        values = {'fault_file' : fault_file}
+        with h5py.File(fault_file, 'r') as fid:
+            for name in self.INTS:
+                values[name] = int(fid[name][...])
+            for name in self.FLOATS:
+                values[name] = float(fid[name][...]) if name in fid else None
+            for name, path in self.ARRAYS.items():
+                values[name] = None
+                if path in fid:
+                    arr = np.asarray(fid[path][...], float)
+                    arr.setflags(write=False)
+                    values[name] = arr
+
+        for name, val in values.items():
+            object.__setattr__(self, name, val)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FaultGeometry is immutable.')
+
+    @property
+    def num_subflts(self):
+        return self.num_subflt_along_strike * self.num_subflt_along_dip
+
+# realpath -> (modification time, FaultGeometry)
+_cache = {}
+
+def load_fault_geometry(fault_file):
+    ''' FaultGeometry of fault_file, shared by the process. It is read again
+only if the modification time of the file changes.
+'''
+    assert exists(fault_file), \
+           'File %s does not exist!'%fault_file
+    key = realpath(fault_file)
+    mtime = getmtime(fault_file)
+    if key not in _cache or _cache[key][0] != mtime:
+        _cache[key] = (mtime, FaultGeometry(fault_file))
+    return _cache[key][1]
+
+def clear_fault_geometry_cache():
+    _cache.clear()
@@ -1,6 +1,9 @@
 from .occam_deconvolution_separate_co_post import *
 from .occam_deconvolution_separate_co_post2 import *
 from .static_inversion import *
+from .projected_gradient_solver import *
+from .l_curve_sweep import *
+from .regularization_grid_runner import *
 from .occam_deconvolution import *
 from .result_file import *
 from .predict_displacement import *
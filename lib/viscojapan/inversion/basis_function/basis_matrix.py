@@ -1,7 +1,7 @@
-from numpy import arange, asarray, dot, hstack
+from numpy import arange, asarray, dot
 import scipy.sparse as sparse
 
-from viscojapan.fault_model import FaultFileReader
+from viscojapan.fault_model import load_fault_geometry
 from .cubic_b_splines import CubicBSplines
 
 __all__ = ['BasisMatrix','BasisMatrixBSpline']
@@ -20,10 +20,10 @@ class BasisMatrix(object):
 
     @classmethod
     def create_from_fault_file(cls, fault_file, num_epochs = 1):
-        fid = FaultFileReader(fault_file)                
+        fault = load_fault_geometry(fault_file)                
 
         spline_obj = cls(
-            num_subflts = fid.num_subflt_along_strike * fid.num_subflt_along_dip,
+            num_subflts = fault.num_subflt_along_strike * fault.num_subflt_along_dip,
             num_epochs = num_epochs
             )
         return spline_obj
@@ -73,12 +73,12 @@ class BasisMatrixBSpline(BasisMatrix):
         return slip
 
     def gen_basis_matrix(self):
-        res = []
-        for nth, _ in enumerate(self.yf[0:-1]):
-            for mth, _ in enumerate(self.xf[0:-1]):            
-                slip = self.gen_slip_mesh(mth, nth)
-                res.append(slip.reshape([-1,1]))
-        res1 = sparse.csr_matrix(hstack(res))
+        ''' Column n*len(x) + m is gen_slip_mesh(m, n).flatten(), that is
+the Kronecker product of the 1-D bases along dip and strike.
+'''
+        xbasis = CubicBSplines(self.dx_spline).basis_over_sections(self.xf)
+        ybasis = CubicBSplines(self.dy_spline).basis_over_sections(self.yf)
+        res1 = sparse.kron(ybasis, xbasis, format='csr')
         res2 = sparse.block_diag([res1]*self.num_epochs)
         return res2
 
@@ -87,13 +87,13 @@ class BasisMatrixBSpline(BasisMatrix):
 
     @classmethod
     def create_from_fault_file(cls, fault_file, num_epochs = 1):
-        fid = FaultFileReader(fault_file)                
+        fault = load_fault_geometry(fault_file)                
 
-        dx = fid.subflt_sz_strike
-        dy = fid.subflt_sz_dip
+        dx = fault.subflt_sz_strike
+        dy = fault.subflt_sz_dip
         
-        x_f = fid.x_f
-        y_f = fid.y_f
+        x_f = fault.x_f
+        y_f = fault.y_f
 
         spline_obj = cls(
             dx_spline = dx,
@@ -1,4 +1,6 @@
-from numpy import arange, frompyfunc, asarray
+from numpy import arange, asarray
+import numpy as np
+import scipy.sparse as sparse
 
 class CubicBSplines(object):
     def __init__(self, ds):
@@ -23,22 +25,59 @@ class CubicBSplines(object):
             y = 0.
         return y/4./(ds**3)
 
+    def _b_spline_vec(self, s):
+        ''' Vectorized _b_spline_scalar.
+'''
+        ds = self.ds
+        s = asarray(s, float)
+        p4 = s + 4.*ds
+        p3 = s + 3.*ds
+        m1 = -ds - s
+        conds = [(s >= -4.*ds) & (s < -3.*ds),
+                 (s >= -3.*ds) & (s < -2.*ds),
+                 (s >= -2.*ds) & (s < -ds),
+                 (s >= -ds) & (s < 0)]
+        pieces = [p4**3,
+                  p4**2*(-2.*ds - s) + p4*p3*m1 + (-s)*p3**2,
+                  p4*m1**2 + (-s)*p3*m1 + s**2*(s + 2.*ds),
+                  (-s)**3]
+        return np.select(conds, pieces, default=0.)/4./(ds**3)
+
     def b_spline(self, s):
-        fn_vec = frompyfunc(self._b_spline_scalar, 1, 1)
-        res = fn_vec(asarray(s - 2.*self.ds, float))
-        return asarray(res, float)
+        return self._b_spline_vec(asarray(s, float) - 2.*self.ds)
 
-    def b_spline_over_sections(self, sj, j):
-        sms = []
-        for s1, s2 in zip(sj[0:-1],sj[1:]):
-            sm = (s1+s2)/2.
-            sms.append(sm)
+    @staticmethod
+    def _section_midpoints(sj):
+        sj = asarray(sj, float)
+        return (sj[0:-1] + sj[1:])/2.
 
-        sms = asarray(sms)
+    def b_spline_over_sections(self, sj, j):
+        sms = self._section_midpoints(sj)
 
         y = self.b_spline(sms-sms[j])
 
         return sms, y        
+
+    def basis_over_sections(self, sj):
+        ''' Sparse matrix whose jth column is b_spline_over_sections(sj, j)[1].
+Only the sections within the support [-2ds, 2ds) of every spline are
+evaluated, so it is assembled in COO form without any dense column.
+'''
+        sms = self._section_midpoints(sj)
+        num = len(sms)
+        assert np.all(np.diff(sms) > 0), 'Sections should be increasing.'
+
+        lo = np.searchsorted(sms, sms - 2.*self.ds, side='left')
+        hi = np.searchsorted(sms, sms + 2.*self.ds, side='left')
+        counts = hi - lo
+
+        cols = np.repeat(np.arange(num), counts)
+        starts = np.cumsum(counts) - counts
+        rows = np.arange(counts.sum()) - np.repeat(starts - lo, counts)
+
+        vals = self.b_spline(sms[rows] - sms[cols])
+        ch = vals != 0.
+        return sparse.coo_matrix((vals[ch], (rows[ch], cols[ch])), shape=(num, num))
             
             
         
@@ -1,11 +1,97 @@
 import numpy as np
-from cvxopt import matrix, solvers
-
+from cvxopt import matrix, spmatrix, solvers
 import scipy.sparse as sparse
+from scipy.linalg import cho_factor, cho_solve
 
 from ..utils import assert_col_vec_and_get_nrow,\
      assert_square_array_and_get_nrow
 
+def to_cvxopt_spmatrix(mat):
+    ''' Convert a scipy sparse matrix to cvxopt.spmatrix without densifying it.
+'''
+    coo = sparse.coo_matrix(mat)
+    return spmatrix(matrix(np.asarray(coo.data, dtype=float)),
+                    matrix(np.asarray(coo.row, dtype=int)),
+                    matrix(np.asarray(coo.col, dtype=int)),
+                    size = coo.shape)
+
+class NonnegativeKKTSolver(object):
+    ''' KKT solver for constraints  -m <= 0  and  GG m <= 0.
+
+The inequality matrix is [-I; GG]. With the nonnegative orthant scaling
+W = diag(d), the KKT system reduces to
+
+    (P + D1^-2 + GG' D2^-2 GG) ux = bx - D1^-2 bz1 + GG' D2^-2 bz2
+
+The -I block only adds to the diagonal, so the constraint matrix is never
+formed. The work buffer and the sparse GG, GG' are prepared once and
+reused by every interior-point iteration and every solve with the same shape.
+GG_of is the GG object given to set_GG, so that a caller can tell whether
+GG has been replaced since.
+'''
+    def __init__(self, P, GG = None):
+        self.n = P.shape[0]
+        self._H = np.empty((self.n, self.n), dtype=float, order='F')
+        self._diag = np.arange(self.n)
+        self.set_P(P)
+        self.set_GG(GG)
+
+    def set_P(self, P):
+        assert P.shape == (self.n, self.n)
+        self.P = np.asarray(P, dtype=float)
+
+    def set_GG(self, GG):
+        self.GG_of = GG
+        if GG is None:
+            self.GG = None
+            self.GGt = None
+        else:
+            assert GG.shape[1] == self.n
+            self.GG = sparse.csr_matrix(GG)
+            self.GGt = self.GG.T.tocsr()
+
+    def __call__(self, W):
+        n = self.n
+        di2 = np.asarray(W['di'], dtype=float).flatten()**2
+        di2_1 = di2[:n]
+        di2_2 = di2[n:]
+
+        H = self._H
+        H[...] = self.P
+        H[self._diag, self._diag] += di2_1
+
+        if self.GG is not None:
+            GtDG = self.GGt.dot(self.GG.multiply(di2_2.reshape([-1,1])).tocsr()).tocoo()
+            GtDG.sum_duplicates()
+            H[GtDG.row, GtDG.col] += GtDG.data
+
+        factor = cho_factor(H, lower=True, overwrite_a=True, check_finite=False)
+
+        GG = self.GG
+        GGt = self.GGt if GG is not None else None
+        di = np.asarray(W['di'], dtype=float).flatten()
+
+        def solve(x, y, z):
+            bx = np.asarray(x, dtype=float).flatten()
+            bz = np.asarray(z, dtype=float).flatten()
+            bz1 = bz[:n]
+            bz2 = bz[n:]
+
+            rhs = bx - di2_1*bz1
+            if GG is not None:
+                rhs += GGt.dot(di2_2*bz2)
+
+            ux = cho_solve(factor, rhs, check_finite=False)
+
+            Gux = -ux
+            if GG is not None:
+                Gux = np.hstack([Gux, GG.dot(ux)])
+
+            x[:] = matrix(ux)
+            z[:] = matrix(di*(Gux - bz))
+
+        return solve
+
 class CvxoptQpWrapper(object):
     def __init__(self,*,
                  P,
@@ -15,7 +101,9 @@ class CvxoptQpWrapper(object):
         self.P = P
         self.q = q
         self.GG = GG
-        
+
+        self._kktsolver = None
+
         self._check_input()
 
     def _check_input(self):
@@ -23,12 +111,26 @@ class CvxoptQpWrapper(object):
         nrow_q = assert_col_vec_and_get_nrow(self.q)
         assert  nrow_P == nrow_q
         self.nrow_P = nrow_P
+        self.num_pars = nrow_P
 
         if self.GG is not None:
             assert self.GG.shape[1] == nrow_P
 
+    def _get_kktsolver(self):
+        ''' The KKT solver is kept between solves, so are its work buffers.
+GG is converted again only if self.GG is another object. Modifying
+GG in place is not detected; assign a new matrix instead.
+'''
+        if self._kktsolver is None or self._kktsolver.n != self.nrow_P:
+            self._kktsolver = NonnegativeKKTSolver(self.P, self.GG)
+        else:
+            self._kktsolver.set_P(self.P)
+            if self._kktsolver.GG_of is not self.GG:
+                self._kktsolver.set_GG(self.GG)
+        return self._kktsolver
 
-    def invert(self, nonnegative=True):
+    def invert(self, nonnegative=True, initvals=None):
+        self._check_input()
         # non-negative constraint
         if nonnegative:
             GG = -1.0 * sparse.identity(self.nrow_P, dtype='float')
@@ -37,22 +139,38 @@ class CvxoptQpWrapper(object):
 
             h = np.zeros((GG.shape[0], 1), dtype='float')
 
-            self.solution = solvers.qp(matrix(self.P),matrix(self.q),
-                                       matrix(GG.todense()),matrix(h))
+            self.solution = solvers.qp(matrix(np.asarray(self.P, dtype=float)),
+                                       matrix(np.asarray(self.q, dtype=float)),
+                                       to_cvxopt_spmatrix(GG), matrix(h),
+                                       kktsolver = self._get_kktsolver(),
+                                       initvals = initvals)
         else:
             if self.GG is not None:
-                self.GG = matrix(self.GG)
+                GG = to_cvxopt_spmatrix(self.GG)
+                h = matrix(np.zeros((self.GG.shape[0], 1), dtype='float'))
+            else:
+                GG = None
+                h = None
 
             self.solution = solvers.qp(
-                matrix(self.P),
-                matrix(self.q),
-                G = self.GG
+                matrix(np.asarray(self.P, dtype=float)),
+                matrix(np.asarray(self.q, dtype=float)),
+                G = GG,
+                h = h,
+                initvals = initvals
             )
 
+    def update_from_inversion_parameters_set(self, inv_par_set):
+        ''' Replace the inputs, keeping the KKT solver and its buffers.
+'''
+        self.P, self.q = inv_par_set.gen_inputs_for_cvxopt_qp()
+        self.GG = inv_par_set.GG
+        self._check_input()
+
     @classmethod
     def create_from_inversion_parameters_set(cls, inv_par_set):
         P, q = inv_par_set.gen_inputs_for_cvxopt_qp()
         obj = cls(P=P, q=q)
         obj.GG = inv_par_set.GG
         return obj
-        
+
@@ -1,6 +1,7 @@
 from .epoch_g import *
 from .epoch_displacement import *
 from .epoch_slip import *
+from .convolution_g_operator import *
 
 from .utils import *
 
@@ -0,0 +1,146 @@
+import numpy as np
+from scipy.sparse.linalg import LinearOperator
+
+__author__ = 'zy'
+__all__ = ['ConvolutionGOperator', 'group_epoch_pairs_by_lag']
+
+def _as_lag(lag):
+    # keep integral lags as int so that they hit the epochs list exactly.
+    if float(lag).is_integer():
+        return int(lag)
+    return float(lag)
+
+def group_epoch_pairs_by_lag(epochs):
+    ''' Group the blocks (mth, nth), mth >= nth, of the stacked G by lag
+t_m - t_n.
+Return:
+    dict of lag -> (array of mth, array of nth)
+'''
+    pairs = {}
+    for nth in range(0, len(epochs)):
+        t1 = epochs[nth]
+        for mth in range(nth, len(epochs)):
+            t2 = epochs[mth]
+            lag = _as_lag(t2 - t1)
+            mths, nths = pairs.setdefault(lag, ([],[]))
+            mths.append(mth)
+            nths.append(nth)
+
+    # For one lag, both mth and nth appear at most once because epochs
+    # are ascending. This makes fancy-indexed += safe.
+    return {lag:(np.asarray(mths), np.asarray(nths))
+            for lag, (mths, nths) in pairs.items()}
+
+class ConvolutionGOperator(LinearOperator):
+    ''' Matrix-free equivalent of stack_G_for_convolution.
+
+The stacked G is a lower-triangular block matrix whose block (mth, nth)
+is G(t_m - t_n). Instead of copying every block into a dense array,
+this operator stores each distinct lag slab only once and computes
+G @ m and G.T @ r as sums over lags.
+'''
+    def __init__(self, G, epochs):
+        '''
+Arguments:
+    G - object that has method get_data_at_epoch,
+        such as EpochG or DifferentialG.
+    epochs - list of epochs that G is stacked at.
+'''
+        self.G = G
+        self.epochs = list(epochs)
+        self.num_epochs = len(self.epochs)
+
+        self._init_lags()
+
+        sh1, sh2 = self.get_slab(0).shape
+        self.num_rows_per_epoch = sh1
+        self.num_cols_per_epoch = sh2
+
+        super().__init__(dtype=np.dtype(float),
+                         shape=(sh1*self.num_epochs, sh2*self.num_epochs))
+
+    def _init_lags(self):
+        self._pairs = group_epoch_pairs_by_lag(self.epochs)
+
+        self._slabs = {}
+        for lag in self._pairs:
+            self._slabs[lag] = np.asarray(self.G.get_data_at_epoch(lag), dtype=float)
+
+    def get_lags(self):
+        return list(self._slabs.keys())
+
+    def get_num_lags(self):
+        return len(self._slabs)
+
+    def get_slab(self, lag):
+        return self._slabs[_as_lag(lag)]
+
+    @property
+    def nbytes(self):
+        return sum(slab.nbytes for slab in self._slabs.values())
+
+    def _matvec(self, x):
+        return self._matmat(x.reshape([-1,1])).reshape([-1])
+
+    def _rmatvec(self, x):
+        return self._rmatmat(x.reshape([-1,1])).reshape([-1])
+
+    def _matmat(self, X):
+        N = self.num_epochs
+        ncols = X.shape[1]
+        X = np.asarray(X).reshape([N, self.num_cols_per_epoch, ncols])
+        Y = np.zeros([N, self.num_rows_per_epoch, ncols],
+                     dtype=np.result_type(X, float))
+        for lag, (mths, nths) in self._pairs.items():
+            Y[mths] += np.matmul(self._slabs[lag], X[nths])
+        return Y.reshape([-1, ncols])
+
+    def _rmatmat(self, X):
+        N = self.num_epochs
+        ncols = X.shape[1]
+        X = np.asarray(X).reshape([N, self.num_rows_per_epoch, ncols])
+        Y = np.zeros([N, self.num_cols_per_epoch, ncols],
+                     dtype=np.result_type(X, float))
+        for lag, (mths, nths) in self._pairs.items():
+            Y[nths] += np.matmul(self._slabs[lag].T, X[mths])
+        return Y.reshape([-1, ncols])
+
+    def get_col_block(self, nth):
+        ''' Dense columns of the stacked G that belong to the nth epoch.
+'''
+        sh1 = self.num_rows_per_epoch
+        t1 = self.epochs[nth]
+        block = np.zeros([self.shape[0], self.num_cols_per_epoch], dtype=float)
+        for mth in range(nth, self.num_epochs):
+            block[mth*sh1:(mth+1)*sh1,:] = self.get_slab(self.epochs[mth] - t1)
+        return block
+
+    def iter_col_blocks(self):
+        sh2 = self.num_cols_per_epoch
+        for nth in range(self.num_epochs):
+            yield slice(nth*sh2, (nth+1)*sh2), self.get_col_block(nth)
+
+    def get_row_block(self, mth):
+        ''' Dense rows of the stacked G that belong to the mth epoch.
+'''
+        sh2 = self.num_cols_per_epoch
+        t2 = self.epochs[mth]
+        block = np.zeros([self.num_rows_per_epoch, self.shape[1]], dtype=float)
+        for nth in range(0, mth+1):
+            block[:, nth*sh2:(nth+1)*sh2] = self.get_slab(t2 - self.epochs[nth])
+        return block
+
+    def iter_row_blocks(self):
+        sh1 = self.num_rows_per_epoch
+        for mth in range(self.num_epochs):
+            yield slice(mth*sh1, (mth+1)*sh1), self.get_row_block(mth)
+
+    def todense(self):
+        ''' Return the dense stacked G, same as stack_G_for_convolution.
+'''
+        G = np.zeros(self.shape, dtype=float)
+        for sl, block in self.iter_col_blocks():
+            G[:,sl] = block
+        return G
+
+    toarray = todense
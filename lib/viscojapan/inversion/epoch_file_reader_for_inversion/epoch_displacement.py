@@ -2,6 +2,7 @@ import numpy as np
 import h5py
 
 from ...epoch_3d_array import Displacement
+from ...epoch_3d_array.storage import read_array_3d
 from ...utils import as_string
 
 __author__ = 'zy'
@@ -15,10 +16,7 @@ class EpochDisplacement(Displacement):
 
         fid = h5py.File(file_name,'r')
 
-        if memory_mode:
-            array_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, self.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
         sites = as_string(fid['sites'][...])
@@ -29,7 +27,7 @@ class EpochDisplacement(Displacement):
                         mask_sites = mask_sites)
 
     def stack(self, epochs):
-        return np.vstack([self.get_data_at_epoch(epoch).reshape([-1,1]) for epoch in epochs])
+        return self.interp_epochs(epochs).reshape([-1,1])
 
 
 class EpochDisplacementSD(EpochDisplacement):
@@ -38,6 +36,7 @@ class EpochDisplacementSD(EpochDisplacement):
                  memory_mode = False):
         super().__init__(file_name, mask_sites, memory_mode)
 
-    def get_data_at_epoch(self, epoch):
-        assert epoch in self.get_epochs(), "EpochalDisplacementSD doesn't allow interpolation."
-        return super().get_data_at_epoch(epoch)
\ No newline at end of file
+    def interp_epochs(self, epochs):
+        _, _, w = self.get_interp_weights(epochs)
+        assert np.all(w == 0), "EpochalDisplacementSD doesn't allow interpolation."
+        return super().interp_epochs(epochs)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from os.path import exists
+from os.path import exists, realpath, getmtime
 
 import numpy as np
 import h5py
@@ -6,10 +6,14 @@ import h5py
 from ...utils import as_string
 
 from ...epoch_3d_array import G as GClass
+from ...epoch_3d_array.storage import read_array_3d
+from .convolution_g_operator import group_epoch_pairs_by_lag
 
 __author__ = 'zy'
 __all__ = ['stack_G_for_convolution','stack_G_for_no_Raslip',
-           'EpochG','DifferentialG','EpochGNoRaslip', 'DifferentialGNoRaslip']
+           'dot_stacked_G_for_convolution','dot_stacked_G_for_no_Raslip',
+           'EpochG','DifferentialG','EpochGNoRaslip', 'DifferentialGNoRaslip',
+           'LinearizedG']
 
 def stack_G_for_convolution(self, epochs):
     N = len(epochs)
@@ -44,19 +48,51 @@ def stack_G_for_no_Raslip(self, epochs):
 
     return G
 
+def _reshape_by_epochs(m, num_epochs, num_cols_per_epoch):
+    m = np.asarray(m, dtype=float)
+    assert m.shape[0] == num_epochs*num_cols_per_epoch, "Shape doesn't match!"
+    return m.reshape([num_epochs, num_cols_per_epoch, -1])
+
+def dot_stacked_G_for_convolution(self, epochs, m):
+    ''' Same as dot(self.stack(epochs), m), without forming the stacked G.
+Each distinct lag is read once and multiplied with every epoch pair
+of that lag.
+'''
+    N = len(epochs)
+    sh1, sh2 = self.get_data_at_epoch(0).shape
+    X = _reshape_by_epochs(m, N, sh2)
+    Y = np.zeros([N, sh1, X.shape[2]], dtype='float')
+    for lag, (mths, nths) in group_epoch_pairs_by_lag(epochs).items():
+        G_ = np.asarray(self.get_data_at_epoch(lag), dtype='float')
+        Y[mths] += np.matmul(G_, X[nths])
+    return Y.reshape([N*sh1, -1])
+
+def dot_stacked_G_for_no_Raslip(self, epochs, m):
+    ''' Same as dot(self.stack(epochs), m) with stack_G_for_no_Raslip.
+'''
+    N = len(epochs)
+    _G0 = np.asarray(self.get_data_at_epoch(0), dtype='float')
+    sh1, sh2 = _G0.shape
+    X = _reshape_by_epochs(m, N, sh2)
+    Y = np.zeros([N, sh1, X.shape[2]], dtype='float')
+    for mth in range(0, N):
+        G_ = np.asarray(self.get_data_at_epoch(epochs[mth]), dtype='float')
+        Y[mth] = np.dot(G_, X[0])
+    # Blocks (mth, nth) for 1 <= nth <= mth are all G0:
+    Y[1:] += np.matmul(_G0, np.cumsum(X[1:], axis=0))
+    return Y.reshape([N*sh1, -1])
+
 class EpochG(GClass):
     def __init__(self,file_name,
                  mask_sites=None,
-                 memory_mode = False):
+                 memory_mode = False,
+                 use_slab_cache = True):
 
         assert exists(file_name), 'File %s does not exist!'%file_name
 
         fid = h5py.File(file_name,'r')
 
-        if memory_mode:
-            array_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-        else:
-            array_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+        array_3d = read_array_3d(fid, self.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
         epochs = fid['epochs'][...]
         sites = as_string(fid['sites'][...])
@@ -68,12 +104,22 @@ class EpochG(GClass):
 
         self.fid = fid
 
+        if use_slab_cache:
+            # modification time is part of the key so that a rewritten file
+            # is never served from stale slabs.
+            self.enable_slab_cache((realpath(file_name), getmtime(file_name)))
+
     def has_info(self, key):
         return key in self.fid
 
     def get_info(self, key):
         return self.fid[key][...]
 
+    def close(self):
+        ''' Close the file. Datasets that are not in memory can no longer be read.
+'''
+        self.fid.close()
+
     def __getitem__(self, name):
         if isinstance(name, int):
             return super().__getitem__(name)
@@ -83,9 +129,11 @@ class EpochG(GClass):
             raise ValueError('Not recognized type.')
 
     stack = stack_G_for_convolution
+    dot_stacked = dot_stacked_G_for_convolution
 
 class EpochGNoRaslip(EpochG):
     stack = stack_G_for_no_Raslip
+    dot_stacked = dot_stacked_G_for_no_Raslip
 
 class DifferentialG(object):
     ''' This class computes the diffretial of two EpochData objects
@@ -131,6 +179,37 @@ wrt - with respect to, variable that the change WRT.
 
     # Monkey Patch :-)
     stack = stack_G_for_convolution
+    dot_stacked = dot_stacked_G_for_convolution
 
 class DifferentialGNoRaslip(DifferentialG):
-    stack = stack_G_for_no_Raslip
\ No newline at end of file
+    stack = stack_G_for_no_Raslip
+    dot_stacked = dot_stacked_G_for_no_Raslip
+
+class LinearizedG(object):
+    ''' G at other values of the nonlinear parameters, extrapolated from G0
+by differential Gs:
+    G = G0 + sum dG_i*(value_i - dG_i.var1)
+where dG_i.var1 is the value of G0. The stacking of G0 is used.
+'''
+    def __init__(self, G0, dGs, values):
+        assert len(dGs) == len(values)
+        self.G0 = G0
+        self.dGs = list(dGs)
+        self.values = [float(val) for val in values]
+        self.deltas = [val - dG.var1 for dG, val in zip(self.dGs, self.values)]
+
+    def get_data_at_epoch(self, day):
+        G = np.array(self.G0.get_data_at_epoch(day), dtype='float')
+        for dG, delta in zip(self.dGs, self.deltas):
+            if delta != 0.:
+                G += delta*dG.get_data_at_epoch(day)
+        return G
+
+    def get_num_subflts(self):
+        return self.G0.get_num_subflts()
+
+    def stack(self, epochs):
+        return type(self.G0).stack(self, epochs)
+
+    def dot_stacked(self, epochs, m):
+        return type(self.G0).dot_stacked(self, epochs, m)
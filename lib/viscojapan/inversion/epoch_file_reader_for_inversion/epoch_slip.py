@@ -3,6 +3,7 @@ import h5py
 import numpy as np
 
 from ...epoch_3d_array import Slip
+from ...epoch_3d_array.storage import read_array_3d
 
 __author__ = 'zy'
 __al__ = ['EpochSlip']
@@ -19,10 +20,7 @@ class EpochSlip(Slip):
         if cumu_slip_3d is None:
             fid = h5py.File(file_name, 'r')
 
-            if memory_mode:
-                cumu_slip_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY][...]
-            else:
-                cumu_slip_3d = fid[self.HDF5_DATASET_NAME_FOR_3D_ARRAY]
+            cumu_slip_3d = read_array_3d(fid, self.HDF5_DATASET_NAME_FOR_3D_ARRAY, memory_mode)
 
             epochs = list(fid['epochs'][...])
 
@@ -30,6 +28,5 @@ class EpochSlip(Slip):
                          epochs = epochs)
 
     def stack(self):
-        epochs = self.get_epochs()
-        return np.vstack([self.get_incr_slip_at_epoch(epoch).reshape([-1,1]) for epoch in epochs])
+        return np.asarray(self.get_incr_slip_3d()).reshape([-1,1])
 
@@ -1,20 +1,34 @@
+import warnings
+
 import h5py
 import numpy as np
 import scipy.sparse as sparse
 
 from .inversion_parameters_set import InversionParametersSet
 from .cvxopt_qp_wrapper import CvxoptQpWrapper
+from .projected_gradient_solver import ProjectedGradientSolver
 from ..utils import delete_if_exists
 from .result_file.result_file_writer import ResultFileWriter
 
+qp_solvers = {
+    'cvxopt' : CvxoptQpWrapper,
+    'projected_gradient' : ProjectedGradientSolver,
+    }
+
 class Inversion(object):
     def __init__(self,
                  regularization = None,
                  basis = None,
+                 qp_solver = 'cvxopt',
                  ):
         self.regularization = regularization
         self.basis = basis
         self.GG = None
+        self.qp = None
+
+        # name in qp_solvers or a class that has the interface of CvxoptQpWrapper.
+        # It can be changed on the object before invert() is called.
+        self.qp_solver = qp_solver
 
     def set_data_sd(self):
         print('Set data sd ...')
@@ -66,7 +80,12 @@ class Inversion(object):
         for item in items:
             getattr(self, 'set_data_%s'%item)()
         
-    def invert(self, nonnegative=True):
+    def invert(self, nonnegative=True, initvals=None):
+        ''' initvals - starting point passed to the QP solver.
+The solver of the last call is reused if it is of the same class and
+the number of parameters is the same, so that a solver that keeps its
+last solution (ProjectedGradientSolver) starts from it.
+'''
         print('Inverting ...')
 
         self.inv_par_set = InversionParametersSet(
@@ -79,16 +98,28 @@ class Inversion(object):
             GG = self.GG
         )
 
-        self.cvxopt_qp = CvxoptQpWrapper.\
-                         create_from_inversion_parameters_set(self.inv_par_set)        
-        self.cvxopt_qp.invert(nonnegative=nonnegative)
+        qp_solver = self.qp_solver
+        if isinstance(qp_solver, str):
+            qp_solver = qp_solvers[qp_solver]
+
+        if isinstance(self.qp, qp_solver) and \
+           self.qp.num_pars == self.inv_par_set.ncol_B:
+            self.qp.update_from_inversion_parameters_set(self.inv_par_set)
+        else:
+            self.qp = qp_solver.create_from_inversion_parameters_set(self.inv_par_set)
+        self.qp.invert(nonnegative=nonnegative, initvals=initvals)
+        status = self.qp.solution['status']
+        if status != 'optimal':
+            warnings.warn("QP solver %s stopped with status '%s', "
+                          "the solution may not be optimal."%(
+                              type(self.qp).__name__, status))
         
-        self.m = np.asarray(self.cvxopt_qp.solution['x'],float).reshape((-1,1))
+        self.m = np.asarray(self.qp.solution['x'],float).reshape((-1,1))
         self.Bm = self.B.dot(self.m)
 
     def predict(self):
         print('Predicting ...')        
-        self.d_pred = np.dot(self.G, self.Bm)        
+        self.d_pred = self.G.dot(self.Bm)        
 
     def run(self):
         self.invert()
@@ -2,6 +2,8 @@ import warnings
 
 import numpy as np
 import scipy.sparse as sps
+from scipy.sparse.linalg import LinearOperator
+from scipy.linalg.blas import dsyrk
 
 from ..utils import assert_col_vec_and_get_nrow
 
@@ -41,7 +43,7 @@ W, G, B, m, d, L, Bm0
         self._check_shape_for_matrix_operation()
 
     def _check_type_and_get_shape_G(self):
-        assert isinstance(self.G, np.ndarray)
+        assert isinstance(self.G, (np.ndarray, LinearOperator))
         self.nrow_G = self.G.shape[0]
         self.ncol_G = self.G.shape[1]
 
@@ -99,6 +101,13 @@ This means Green's function for bases might not be accurate.
         assert self.nrow_B == self.nrow_Bm0
 
     def gen_inputs_for_cvxopt_qp(self):
+        w = _get_diagonal(self.W)
+        if w is not None:
+            return self._gen_inputs_for_cvxopt_qp_diagonal_W(w)
+
+        if isinstance(self.G, LinearOperator):
+            return self._gen_inputs_for_cvxopt_qp_with_operator()
+
         WG = self.W.dot(self.G)
         WGB = sps.csr_matrix.dot(WG, self.B)        
         Wd = self.W.dot(self.d)
@@ -107,4 +116,169 @@ This means Green's function for bases might not be accurate.
         q = - np.dot(WGB.T,Wd) - LB.T.dot(self.L).dot(self.Bm0)
 
         return P, q
-        
+
+    def _gen_inputs_for_cvxopt_qp_with_operator(self):
+        ''' Same as gen_inputs_for_cvxopt_qp, but G is a LinearOperator.
+G.T W.T W G is formed one column block at a time so that
+the dense G is never materialized.
+'''
+        G = self.G
+        WtW = self.W.T.dot(self.W)
+
+        GtWtWG = np.empty((self.ncol_G, self.ncol_G), dtype=float)
+        for sl, Gcols in _iter_col_blocks(G):
+            GtWtWG[:,sl] = G.rmatmat(WtW.dot(Gcols))
+
+        # B.T GtWtWG B, where GtWtWG is symmetric:
+        GtWtWGB = np.asarray(self.B.T.dot(GtWtWG)).T
+        LB = self.L.dot(self.B)
+        P = np.asarray(self.B.T.dot(GtWtWGB)) + LB.T.dot(LB)
+
+        GtWtWd = G.rmatvec(WtW.dot(self.d)).reshape([-1,1])
+        q = - self.B.T.dot(GtWtWd) - LB.T.dot(self.L).dot(self.Bm0)
+
+        return P, q
+
+    def _gen_inputs_for_cvxopt_qp_diagonal_W(self, w, row_block_size=2000):
+        ''' Same as gen_inputs_for_cvxopt_qp, for the usual case that W is diagonal.
+WGB is formed one row block at a time by scaling the rows of G with w.
+B is skipped if it is the identity. Otherwise its sparsity is used.
+(WGB).T WGB is accumulated by SYRK, which fills only the upper triangle.
+'''
+        B = None if _is_identity(self.B) else self.B.T.tocsr()
+
+        n = self.ncol_B
+        P = np.zeros((n, n), dtype=float, order='F')
+        q = np.zeros((n, 1), dtype=float)
+
+        Wd = w.reshape([-1,1]) * self.d
+
+        for sl, Gi in _iter_row_blocks(self.G, row_block_size):
+            WGB = w[sl].reshape([-1,1]) * Gi
+            if B is not None:
+                WGB = np.asarray(B.dot(WGB.T)).T
+            WGB = np.ascontiguousarray(WGB)
+            # WGB.T in Fortran order is WGB in C order, no copy.
+            P = dsyrk(1., WGB.T, beta=1., c=P, trans=0, lower=0, overwrite_c=1)
+            q -= np.dot(WGB.T, Wd[sl])
+
+        _fill_lower_from_upper(P)
+
+        LB = self.L if B is None else self.L.dot(self.B)
+        LtL = LB.T.dot(LB).tocoo()
+        LtL.sum_duplicates()
+        P[LtL.row, LtL.col] += LtL.data
+
+        q -= LB.T.dot(self.L).dot(self.Bm0)
+
+        return P, q
+
+    def gen_inputs_for_least_squares(self):
+        ''' Return A and b of the equivalent least-squares problem
+    min ||A m - b||,  A = [W G B; L B],  b = [W d; L Bm0]
+A is a LinearOperator, so neither P nor W G B is formed.
+The sign of Bm0 follows the q of gen_inputs_for_cvxopt_qp.
+'''
+        A = LeastSquaresOperator(G = self.G, W = self.W, B = self.B, L = self.L)
+        b = np.vstack([np.asarray(self.W.dot(self.d), dtype=float).reshape([-1,1]),
+                       np.asarray(self.L.dot(self.Bm0), dtype=float).reshape([-1,1])])
+        return A, b
+
+class LeastSquaresOperator(LinearOperator):
+    ''' [W G B; L B] as a LinearOperator.
+'''
+    def __init__(self, *, G, W, B, L):
+        self.G = G
+        self.W = W.tocsr()
+        self.Wt = self.W.T.tocsr()
+        self.B = B.tocsr()
+        self.Bt = self.B.T.tocsr()
+        self.L = L.tocsr()
+        self.Lt = self.L.T.tocsr()
+        self.nrow_G = G.shape[0]
+
+        super().__init__(dtype=np.dtype(float),
+                         shape=(G.shape[0] + L.shape[0], B.shape[1]))
+
+    def _matvec(self, x):
+        return self._matmat(x.reshape([-1,1])).reshape([-1])
+
+    def _rmatvec(self, x):
+        return self._rmatmat(x.reshape([-1,1])).reshape([-1])
+
+    def _matmat(self, X):
+        BX = self.B.dot(X)
+        return np.vstack([self.W.dot(np.asarray(self.G.dot(BX))),
+                          self.L.dot(BX)])
+
+    def _rmatmat(self, X):
+        X1 = X[:self.nrow_G,:]
+        X2 = X[self.nrow_G:,:]
+        GtWtX1 = np.asarray(self.G.T.dot(self.Wt.dot(X1)))
+        return self.Bt.dot(GtWtX1 + self.Lt.dot(X2))
+
+def _get_diagonal(W):
+    ''' Return the diagonal of W as 1D array if W is diagonal, otherwise None.
+'''
+    w = np.asarray(W.diagonal(), dtype=float)
+    # diagonal if all the nonzeros are on the diagonal:
+    if W.count_nonzero() != np.count_nonzero(w):
+        return None
+    return w
+
+def _is_identity(B):
+    if B.shape[0] != B.shape[1]:
+        return False
+    if not np.all(B.diagonal() == 1.):
+        return False
+    return B.count_nonzero() == B.shape[0]
+
+def _fill_lower_from_upper(P, block_size=512):
+    n = P.shape[0]
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        D = P[start:end, start:end]
+        P[start:end, start:end] = np.triu(D) + np.triu(D, 1).T
+        P[end:, start:end] = P[start:end, end:].T
+
+def _iter_row_blocks(G, block_size=2000):
+    if hasattr(G, 'iter_row_blocks'):
+        yield from G.iter_row_blocks()
+        return
+
+    nrow = G.shape[0]
+    for start in range(0, nrow, block_size):
+        end = min(start + block_size, nrow)
+        if isinstance(G, LinearOperator):
+            yield slice(start, end), _get_operator_rows(G, start, end)
+        else:
+            yield slice(start, end), G[start:end,:]
+
+def _get_operator_rows(G, start, end):
+    ''' Rows start to end of a LinearOperator G by G.rmatmat on unit blocks.
+A unit block has as many entries as the rows it gives at most, so
+it is no larger than the output. One buffer is reused for all of them.
+'''
+    nrow, ncol = G.shape
+    width = min(end - start, max(1, (end - start)*ncol//nrow))
+    E = np.zeros((nrow, width), dtype=float)
+    cols = np.arange(width)
+    rows = np.empty((end - start, ncol), dtype=float)
+    for sub in range(start, end, width):
+        n = min(width, end - sub)
+        E[sub + cols[:n], cols[:n]] = 1.
+        rows[sub-start:sub-start+n,:] = G.rmatmat(E[:,:n]).T
+        E[sub + cols[:n], cols[:n]] = 0.
+    return rows
+
+def _iter_col_blocks(G, block_size=500):
+    if hasattr(G, 'iter_col_blocks'):
+        yield from G.iter_col_blocks()
+        return
+
+    ncol = G.shape[1]
+    for start in range(0, ncol, block_size):
+        end = min(start + block_size, ncol)
+        E = np.zeros((ncol, end-start), dtype=float)
+        E[start:end,:] = np.eye(end-start)
+        yield slice(start, end), G.matmat(E)
@@ -0,0 +1,206 @@
+import h5py
+import numpy as np
+import scipy.sparse as sparse
+
+from .inversion_parameters_set import InversionParametersSet
+from .inversion import qp_solvers
+from .regularization import Composite
+from ..utils import delete_if_exists, as_bytes
+
+__author__ = 'zy'
+
+__all__ = ['LCurveSweep']
+
+class LCurveSweep(object):
+    ''' Solve an inversion for a list of regularization parameter tuples.
+
+Every tuple shares W, G, d, B, Bm0 and the regularization components,
+so the following are computed only once:
+    P0 = (W G B)' W G B,    q0 = - (W G B)' W d,
+    (L_i B)' L_i B,   (L_i B)' L_i Bm0    for every component i.
+Since L = [a_1 L_1; a_2 L_2; ...], for parameters (a_1, a_2, ...)
+    P = P0 + sum a_i^2 (L_i B)' L_i B,
+    q = q0 - sum a_i^2 (L_i B)' L_i Bm0.
+With warm_start, each solve starts from the solution of the previous
+tuple in args_list, so list neighbouring tuples next to each other.
+With 'projected_gradient' this cuts the total number of iterations of
+the sweep; the interior-point solver of cvxopt gains little from it.
+Without warm_start, every tuple is solved by a new solver object from
+its default starting point.
+
+All solutions are written to one HDF5 file:
+    arg_names, args                      (num_args, num_components)
+    m, Bm, d_pred                        (num_args, *)
+    misfit/norm, misfit/norm_weighted    (num_args,)
+    regularization/<name>/coef, norm     (num_args,)
+    solved                               (num_args,)
+A run on an existing file resumes: tuples that are solved in it are
+skipped. Warm starts begin again from the first unsolved tuple.
+
+inv - Inversion object with all data but L set (set_data_except_L).
+components - list of regularization objects.
+arg_names - names of the components.
+args_list - list of parameter tuples, one value for each component.
+qp_solver - name in qp_solvers or a class that has the interface of
+    CvxoptQpWrapper and is constructed from P, q and GG.
+'''
+    def __init__(self, *,
+                 inv,
+                 components,
+                 arg_names,
+                 args_list,
+                 qp_solver = 'cvxopt',
+                 warm_start = True,
+                 ):
+        self.inv = inv
+        self.components = list(components)
+        self.arg_names = list(arg_names)
+        self.args_list = np.asarray(args_list, dtype=float)
+        if self.args_list.ndim == 1:
+            self.args_list = self.args_list.reshape([-1,1])
+        if isinstance(qp_solver, str):
+            qp_solver = qp_solvers[qp_solver]
+        self.qp_solver = qp_solver
+        self.warm_start = warm_start
+
+        assert len(self.components) == len(self.arg_names)
+        assert self.args_list.shape[1] == len(self.components), \
+               'Each tuple of args should have one value for each component.'
+
+        self.num_args = self.args_list.shape[0]
+
+        self._P0 = None
+        self._reg = None
+
+    def _precompute(self):
+        ''' Form the parts of P and q that do not depend on args.
+'''
+        print('Precompute normal equations of the L-curve sweep ...')
+        inv = self.inv
+
+        par_set = InversionParametersSet(G = inv.G, d = inv.d, W = inv.W,
+                                         B = inv.B, L = None, Bm0 = inv.Bm0)
+        # with L = None, these are the data terms only.
+        self._P0, self._q0 = par_set.gen_inputs_for_cvxopt_qp()
+        self._P0 = np.asarray(self._P0, dtype=float)
+        self._q0 = np.asarray(self._q0, dtype=float).reshape([-1,1])
+
+        B = par_set.B
+        Bm0 = par_set.Bm0
+
+        self._Ls = []
+        self._LtLs = []
+        self._LtLBm0s = []
+        for reg in self.components:
+            L = sparse.csr_matrix(reg.generate_regularization_matrix())
+            LB = L.dot(B)
+            LtL = LB.T.dot(LB).tocoo()
+            LtL.sum_duplicates()
+            self._Ls.append(L)
+            self._LtLs.append(LtL)
+            self._LtLBm0s.append(np.asarray(LB.T.dot(L.dot(Bm0))).reshape([-1,1]))
+
+    def get_P_q(self, args):
+        if self._P0 is None:
+            self._precompute()
+        P = self._P0.copy()
+        q = self._q0.copy()
+        for arg, LtL, LtLBm0 in zip(args, self._LtLs, self._LtLBm0s):
+            P[LtL.row, LtL.col] += arg**2 * LtL.data
+            q -= arg**2 * LtLBm0
+        return P, q
+
+    def _regularization(self, args):
+        # One composite for all args, so that the stack of the components
+        # is built once and only rescaled.
+        if self._reg is None:
+            self._reg = Composite(components = list(self.components),
+                                  args = list(args),
+                                  arg_names = list(self.arg_names))
+        return self._reg.update_args(args)
+
+    def _init_file(self, fid):
+        inv = self.inv
+        fid['arg_names'] = as_bytes([str(name) for name in self.arg_names])
+        fid['args'] = self.args_list
+
+        num_pars = self._P0.shape[0]
+        fid.create_dataset('m', (self.num_args, num_pars), dtype=float)
+        fid.create_dataset('Bm', (self.num_args, inv.B.shape[0]), dtype=float)
+        fid.create_dataset('d_pred', (self.num_args, len(inv.d)), dtype=float)
+        fid.create_dataset('misfit/norm', (self.num_args,), dtype=float)
+        fid.create_dataset('misfit/norm_weighted', (self.num_args,), dtype=float)
+        for name, arg in zip(self.arg_names, self.args_list.T):
+            fid['regularization/%s/coef'%name] = arg
+            fid.create_dataset('regularization/%s/norm'%name,
+                               (self.num_args,), dtype=float)
+        fid['solved'] = np.zeros(self.num_args, dtype=bool)
+
+    def _check_file(self, fid):
+        fn = fid.filename
+        assert [name.decode() for name in fid['arg_names'][...]] == \
+               [str(name) for name in self.arg_names], \
+               'Regularization components of %s are different.'%fn
+        assert fid['args'].shape == self.args_list.shape and \
+               np.allclose(fid['args'][...], self.args_list), \
+               'Regularization parameters of %s are different.'%fn
+        assert fid['m'].shape[1] == self._P0.shape[0], \
+               'Number of parameters of %s is different.'%fn
+
+    def _save_solution(self, fid, nth):
+        inv = self.inv
+        fid['m'][nth,:] = inv.m.flatten()
+        fid['Bm'][nth,:] = inv.Bm.flatten()
+        fid['d_pred'][nth,:] = np.asarray(inv.d_pred).flatten()
+        fid['misfit/norm'][nth] = inv.get_residual_norm()
+        fid['misfit/norm_weighted'][nth] = inv.get_residual_norm_weighted()
+        for name, L in zip(self.arg_names, self._Ls):
+            tp = L.dot(inv.Bm[0:L.shape[1]])
+            fid['regularization/%s/norm'%name][nth] = np.dot(tp.T, tp)[0,0]
+        fid['solved'][nth] = True
+        fid.flush()
+
+    def run(self, file_name, nonnegative=True, overwrite=False):
+        if overwrite:
+            delete_if_exists(file_name)
+
+        if self._P0 is None:
+            self._precompute()
+
+        inv = self.inv
+        qp = None
+        initvals = None
+        with h5py.File(file_name, 'a') as fid:
+            if 'solved' in fid:
+                self._check_file(fid)
+            else:
+                self._init_file(fid)
+            solved = fid['solved'][...]
+            if np.any(solved):
+                print('Resume L-curve sweep: %d of %d are solved.'%(
+                    np.sum(solved), self.num_args))
+
+            for nth, args in enumerate(self.args_list):
+                if solved[nth]:
+                    continue
+                print('L-curve sweep %d/%d: %s'%(nth+1, self.num_args, args))
+                P, q = self.get_P_q(args)
+                if qp is None or not self.warm_start:
+                    qp = self.qp_solver(P=P, q=q, GG=inv.GG)
+                else:
+                    qp.P = P
+                    qp.q = q
+                qp.invert(nonnegative=nonnegative, initvals=initvals)
+                self.qp = qp
+
+                inv.m = np.asarray(qp.solution['x'], float).reshape((-1,1))
+                inv.Bm = inv.B.dot(inv.m)
+                inv.regularization = self._regularization(args)
+                inv.predict()
+
+                self._save_solution(fid, nth)
+
+                if self.warm_start:
+                    # Only the primal point is reused. The slack of a solution on
+                    # the boundary is not strictly feasible for the interior-point solver.
+                    initvals = {'x' : qp.solution['x']}
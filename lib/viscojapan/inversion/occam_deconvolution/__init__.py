@@ -1,2 +1,3 @@
 from .occam_deconvolution import *
 from .occam_inversion_no_Raslip import *
+from .occam_driver import *
@@ -1,6 +1,14 @@
+import itertools
+
 import numpy as np
 from numpy import dot, hstack
+from scipy.sparse.linalg import LinearOperator
+
+from ..epoch_file_reader_for_inversion import ConvolutionGOperator
 
+# Versions of cached states, unique across objects so that a key made of
+# them never matches that of another state.
+_versions = itertools.count()
 
 def _check_shape_for_matrix_product(A,B):
     sh1 = A.shape
@@ -16,6 +24,10 @@ by a slip0del parameter.
 
 The one-dimension equivalence is derivative of a curve at certain point.
 
+Jacobian vectors are computed by the convolution of dG with slip0
+(dG.dot_stacked) without forming the stacked dG, and are cached
+for each epochs. Assigning dG or slip0 clears the cache and gives
+a new version.
 '''
     def __init__(self,
                  dG,
@@ -28,23 +40,109 @@ Arguments:
         self.dG = dG
         self.slip0 = slip0
 
+    @property
+    def dG(self):
+        return self._dG
+
+    @dG.setter
+    def dG(self, dG):
+        self._dG = dG
+        self.clear_cache()
+
+    @property
+    def slip0(self):
+        return self._slip0
+
+    @slip0.setter
+    def slip0(self, slip0):
+        self._slip0 = slip0
+        self.clear_cache()
+
+    def clear_cache(self):
+        self._cache = {}
+        self.version = next(_versions)
+
     def __call__(self, epochs):
         ''' This function returns Jacobian vector with respect to
 nonlinear parameter wrt at epochs.
 Return:
-    Jacobian vector    
+    Jacobian vector, read-only because it is shared by later calls.
 '''
-        dG_stacked = self.dG.stack(epochs)
-
+        key = tuple(epochs)
+        if key not in self._cache:
+            jac = self._compute(epochs)
+            jac.setflags(write=False)
+            self._cache[key] = jac
+        return self._cache[key]
+
+    def _compute(self, epochs):
         m_stacked = self.slip0.respace(epochs).stack()
 
+        if hasattr(self.dG, 'dot_stacked'):
+            return self.dG.dot_stacked(epochs, m_stacked)
+
+        dG_stacked = self.dG.stack(epochs)
         _check_shape_for_matrix_product(dG_stacked, m_stacked)
-        
-        jac = dot(dG_stacked,m_stacked)
+        return dot(dG_stacked,m_stacked)
+
+class JacobianOperator(LinearOperator):
+    ''' Jacobian matrix [G, J1, J2, ...] where G is a LinearOperator
+of the stacked Green's function and J1, J2, ... are dense Jacobian vectors.
+'''
+    def __init__(self, G, jacobian_vecs):
+        self.G = G
+        self.jacobian_vecs = jacobian_vecs
+        self.num_nlin_pars = jacobian_vecs.shape[1]
 
-        return jac
+        super().__init__(dtype=np.dtype(float),
+                         shape=(G.shape[0], G.shape[1] + self.num_nlin_pars))
+
+    def _matvec(self, x):
+        return self._matmat(x.reshape([-1,1])).reshape([-1])
+
+    def _rmatvec(self, x):
+        return self._rmatmat(x.reshape([-1,1])).reshape([-1])
+
+    def _matmat(self, X):
+        n = self.G.shape[1]
+        return self.G.matmat(X[:n,:]) + dot(self.jacobian_vecs, X[n:,:])
+
+    def _rmatmat(self, X):
+        return np.vstack([self.G.rmatmat(X), dot(self.jacobian_vecs.T, X)])
+
+    def iter_col_blocks(self):
+        n = self.G.shape[1]
+        yield from self.G.iter_col_blocks()
+        yield slice(n, n + self.num_nlin_pars), self.jacobian_vecs
+
+    def iter_row_blocks(self):
+        for sl, block in self.G.iter_row_blocks():
+            yield sl, hstack([block, self.jacobian_vecs[sl]])
 
 class Jacobian(object):
+    ''' The last Jacobian is kept and returned again as long as G, epochs,
+jacobian_vecs and use_convolution_operator are unchanged. Assigning
+another G, jacobian_vecs or use_convolution_operator gives a new version;
+a Jacobian vector has a version of its own.
+'''
+    _versioned = ('G', 'jacobian_vecs', 'use_convolution_operator')
+
+    def __setattr__(self, name, value):
+        if name in self._versioned and not self._is_same(name, value):
+            super().__setattr__('_version', next(_versions))
+        super().__setattr__(name, value)
+
+    def _is_same(self, name, value):
+        if not hasattr(self, name):
+            return False
+        old = getattr(self, name)
+        if name == 'jacobian_vecs':
+            return len(old) == len(value) and \
+                   all(J0 is J1 for J0, J1 in zip(old, value))
+        if name == 'use_convolution_operator':
+            return old == value
+        return old is value
+
     def __init__(self):
         # EpochalData object of Green's functions
         #  computed with current non-linear parameters.
@@ -52,8 +150,28 @@ class Jacobian(object):
         
         self.jacobian_vecs = []
         self.epochs = []
+
+        # If True, return a JacobianOperator instead of a dense matrix.
+        self.use_convolution_operator = False
+
+        self._key = None
+        self._jacobian = None
+
+    def _get_key(self):
+        return (self._version, tuple(self.epochs),
+                tuple(J.version for J in self.jacobian_vecs))
         
     def __call__(self):
+        key = self._get_key()
+        if self._jacobian is None or key != self._key:
+            if self.use_convolution_operator:
+                self._jacobian = self._jacobian_operator()
+            else:
+                self._jacobian = self._dense_jacobian()
+            self._key = key
+        return self._jacobian
+
+    def _dense_jacobian(self):
         jacobian = []
         jacobian.append(
             self.G.stack(self.epochs)
@@ -65,6 +183,14 @@ class Jacobian(object):
         
         return jacobian
 
+    def _jacobian_operator(self):
+        G = ConvolutionGOperator(self.G, self.epochs)
+        if len(self.jacobian_vecs) > 0:
+            jacobian_vecs = hstack([J(self.epochs) for J in self.jacobian_vecs])
+        else:
+            jacobian_vecs = np.zeros([G.shape[0], 0])
+        return JacobianOperator(G, jacobian_vecs)
+
 class D_(object):
     def __init__(self):
 
@@ -84,7 +210,13 @@ class D_(object):
 
     def __call__(self):
         self.disp_obs = self.d.stack(self.epochs)
-        d_ = np.copy(self.disp_obs)
+        return self.linearize(self.disp_obs)
+
+    def linearize(self, disp_obs):
+        ''' d_ = disp_obs + J1*val1 + J2*val2 + ...
+The Jacobian vectors are those cached by JacobianVec.
+'''
+        d_ = np.array(disp_obs, dtype=float)
         for J, val in zip(self.jacobian_vecs, self.nlin_par_values):
             d_ += (J(self.epochs)*val)
         return d_
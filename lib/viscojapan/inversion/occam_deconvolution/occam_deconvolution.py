@@ -2,9 +2,9 @@ import numpy as np
 import scipy.sparse as sparse
 
 from ..epoch_file_reader_for_inversion import EpochG, DifferentialG, EpochDisplacement, EpochDisplacementSD, \
-    EpochSlip
+    EpochSlip, LinearizedG
 
-from .formulate_occam import JacobianVec, Jacobian, D_
+from .formulate_occam import JacobianVec, Jacobian, JacobianOperator, D_
 from ..inversion import Inversion
 from ...sites_db import choose_inland_GPS_cmpts_for_all_epochs
 
@@ -35,6 +35,7 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
                  basis,
                  file_slip0,
                  decreasing_slip_rate = True,
+                 use_convolution_operator = False,
                  ):
 
         super().__init__(
@@ -45,9 +46,13 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
 
         self._init_Gs(file_G0, files_Gs, sites)
         
-        self.d = EpochDisplacement(file_d, sites)
+        # Epochal observation and its sd. self.d and self.sd are
+        # the stacked arrays after set_data_d and set_data_sd.
+        self.epochal_d = EpochDisplacement(file_d, sites)
+        self.d = self.epochal_d
 
-        self.sd = EpochDisplacementSD(file_sd, sites)
+        self.epochal_sd = EpochDisplacementSD(file_sd, sites)
+        self.sd = self.epochal_sd
 
         self.epochs = epochs
 
@@ -61,11 +66,17 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
 
         self.decreasing_slip_rate = decreasing_slip_rate
 
+        # If True, G0 is represented by a ConvolutionGOperator
+        # instead of a dense stacked matrix.
+        self.use_convolution_operator = use_convolution_operator
+
         self._init()
 
     def _init_Gs(self, file_G0, files_Gs, sites):
         self.G0 = EpochG(file_G0, sites)
         self.num_subflts = self.G0.get_num_subflts()
+        # G at the linearization point
+        self.G_lin = self.G0
 
         Gs = [EpochG(f, sites) for f in files_Gs]
 
@@ -78,6 +89,7 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
     def _init(self):
         self._load_nlin_initial_values()
         self._init_jacobian_vecs()
+        self._init_jacobian()
         self._init_decreasing_slip_rate_matrix()
 
 
@@ -101,6 +113,42 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
 
         self.jacobian_vecs = jacobian_vecs
 
+    def set_linearization_point(self, slip0, nlin_par_values):
+        ''' Linearize about slip0 and nlin_par_values instead of the initial
+values. G at nlin_par_values is extrapolated from G0 by the differential Gs,
+so no new G file is needed. Call set_data_G and set_data_d afterwards.
+'''
+        assert len(nlin_par_values) == self.num_nlin_pars
+        self.slip0 = slip0.respace(self.epochs)
+        for J in self.jacobian_vecs:
+            J.slip0 = self.slip0
+
+        self.nlin_par_initial_values = [float(val) for val in nlin_par_values]
+        for name, val in self.iterate_nlin_par_name_val():
+            setattr(self, name,val)
+
+        if all(val == dG.var1 for dG, val in zip(self.dGs, self.nlin_par_initial_values)):
+            self.G_lin = self.G0
+        else:
+            self.G_lin = LinearizedG(self.G0, self.dGs, self.nlin_par_initial_values)
+
+    def get_slip(self):
+        ''' Return the inverted slip (Bm) as an EpochSlip object.
+'''
+        incr_slip = np.asarray(self.Bm[:-self.num_nlin_pars,:]).reshape(
+            [len(self.epochs), self.num_subflt_along_dip, self.num_subflt_along_strike])
+        return EpochSlip.init_with_incr_slip_3d(incr_slip, self.epochs)
+
+    def get_nlin_par_values(self):
+        return list(np.asarray(self.Bm[-self.num_nlin_pars:,:]).flatten())
+
+    def _init_jacobian(self):
+        # Kept between calls of set_data_G and set_data_d, so that the
+        # Jacobian vectors computed by set_data_G are reused by set_data_d
+        # and repeated calls only pay for what has changed.
+        self.jacobian = Jacobian()
+        self.d_ = D_()
+
     def _init_decreasing_slip_rate_matrix(self):
         if self.decreasing_slip_rate:
             mat1 = time_derivative_matrix(self.epochs)
@@ -123,27 +171,28 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
         
     def set_data_G(self):
         super().set_data_G()
-        jacobian = Jacobian()
-        jacobian.G = self.G0
+        jacobian = self.jacobian
+        jacobian.G = self.G_lin
         jacobian.jacobian_vecs = self.jacobian_vecs
         jacobian.epochs = self.epochs
+        jacobian.use_convolution_operator = self.use_convolution_operator
         self.G = jacobian()
 
     def set_data_d(self):
         super().set_data_d()
-        d_ = D_()
+        d_ = self.d_
         d_.jacobian_vecs = self.jacobian_vecs
         d_.nlin_par_values = self.nlin_par_initial_values
         d_.epochs = self.epochs
 
-        d_.d = self.d
+        d_.d = self.epochal_d
         self.d = d_()
         
         self.disp_obs = d_.disp_obs
 
     def set_data_sd(self):
         super().set_data_sd()
-        self.sd = self.sd.stack(self.epochs)
+        self.sd = self.epochal_sd.stack(self.epochs)
         
     def predict(self):
         Bm = self.Bm
@@ -152,15 +201,18 @@ class OccamDeconvolution(Inversion): #TODO: Change this class initializer to acc
 
         npars0 = np.asarray(self.nlin_par_initial_values).reshape([-1,1])
 
-        G = Jac[:,:-num_nlin_pars]
-
-        Jac_ = Jac[:,-num_nlin_pars:]
+        if isinstance(Jac, JacobianOperator):
+            G = Jac.G
+            Jac_ = Jac.jacobian_vecs
+        else:
+            G = Jac[:,:-num_nlin_pars]
+            Jac_ = Jac[:,-num_nlin_pars:]
         
         slip = Bm[:-num_nlin_pars,:]
 
         npars = Bm[-num_nlin_pars:,:]
 
-        d = np.dot(G,slip)
+        d = G.dot(slip)
 
         delta_nlin_pars = npars - npars0
         delta_d = np.dot(Jac_, delta_nlin_pars)
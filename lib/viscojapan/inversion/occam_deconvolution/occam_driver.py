@@ -0,0 +1,199 @@
+import h5py
+import numpy as np
+
+from ...utils import delete_if_exists, as_bytes
+
+__author__ = 'zy'
+
+__all__ = ['OccamDriver']
+
+class OccamDriver(object):
+    ''' Run Occam iterations of an OccamDeconvolution until convergence.
+
+Every iteration linearizes about the slip and the nonlinear parameters
+of the previous one:
+    G_k = G0 + sum dG_i*(p_k,i - p0,i),   J_k,i = dG_i * slip_k
+then solves for slip_(k+1) and p_(k+1). The first iteration is linearized
+about slip0 and the values of G0. It stops when the step
+    ||Bm_k - Bm_lin|| / ||Bm_k||
+between the solution and its linearization point is not larger than tol
+and the step of every nonlinear parameter
+    max_i |p_k,i - p_lin,i| / |p_k,i|
+is not larger than nlin_par_tol. The nonlinear parameters are few
+among Bm, so the first test alone passes while they are still moving.
+
+Only G and d are formed again in an iteration. The slabs of G0 and of
+the differential Gs are read from the slab cache of EpochG, and sd, W, B
+and L are set once. With warm_start, each QP starts from the previous
+solution
+of the same run.
+
+Every iteration is written to one HDF5 file:
+    nlin_par_names, epochs
+    m, Bm, d_pred                        (max_iterations, *)
+    nlin_pars, linearization/nlin_pars   (max_iterations, num_nlin_pars)
+    step_norm, nlin_step, misfit/norm, misfit/norm_weighted    (max_iterations,)
+    solved                               (max_iterations,)
+    converged
+A run on an existing file resumes after its last solved iteration.
+
+inv - OccamDeconvolution object. set_data_all is called by the driver.
+'''
+    def __init__(self,
+                 inv,
+                 max_iterations = 10,
+                 tol = 1e-3,
+                 nlin_par_tol = 1e-3,
+                 warm_start = True,
+                 ):
+        self.inv = inv
+        self.max_iterations = max_iterations
+        self.tol = tol
+        self.nlin_par_tol = nlin_par_tol
+        self.warm_start = warm_start
+
+        self.num_iterations = 0
+        self.converged = False
+        self.step_norms = []
+        self.nlin_steps = []
+
+    def _init_file(self, fid):
+        inv = self.inv
+        num_iters = self.max_iterations
+        fid['nlin_par_names'] = as_bytes([str(name) for name in inv.nlin_par_names])
+        fid['epochs'] = np.asarray(inv.epochs, dtype=float)
+
+        num_pars = inv.B.shape[1]
+        for name, ncols in [('m', num_pars),
+                            ('Bm', inv.B.shape[0]),
+                            ('d_pred', len(inv.disp_obs)),
+                            ('nlin_pars', inv.num_nlin_pars),
+                            ('linearization/nlin_pars', inv.num_nlin_pars)]:
+            fid.create_dataset(name, (num_iters, ncols), maxshape=(None, ncols),
+                               dtype=float)
+        for name in ['step_norm', 'nlin_step', 'misfit/norm', 'misfit/norm_weighted']:
+            fid.create_dataset(name, (num_iters,), maxshape=(None,), dtype=float)
+        fid.create_dataset('solved', data=np.zeros(num_iters, dtype=bool),
+                           maxshape=(None,))
+        fid['converged'] = False
+
+    def _check_file(self, fid):
+        inv = self.inv
+        names = [str(name) for name in inv.nlin_par_names]
+        assert [name.decode() for name in fid['nlin_par_names'][...]] == names, \
+               'Nonlinear parameters of %s are different.'%fid.filename
+        assert np.allclose(fid['epochs'][...], inv.epochs), \
+               'Epochs of %s are different.'%fid.filename
+
+        if fid['solved'].shape[0] < self.max_iterations:
+            for name in ['m', 'Bm', 'd_pred', 'nlin_pars', 'linearization/nlin_pars',
+                         'step_norm', 'nlin_step', 'misfit/norm', 'misfit/norm_weighted', 'solved']:
+                fid[name].resize(self.max_iterations, axis=0)
+
+    def _is_converged(self, step_norm, nlin_step):
+        return bool(step_norm <= self.tol and nlin_step <= self.nlin_par_tol)
+
+    def _nlin_step(self, nlin_pars_lin):
+        p = np.asarray(self.inv.get_nlin_par_values(), dtype=float)
+        dp = np.abs(p - np.asarray(nlin_pars_lin, dtype=float))
+        if len(dp) == 0:
+            return 0.
+        scale = np.abs(p)
+        scale[scale == 0] = 1.
+        return float(np.max(dp / scale))
+
+    def _save_iteration(self, fid, nth, step_norm, nlin_step, nlin_pars_lin):
+        inv = self.inv
+        fid['m'][nth,:] = inv.m.flatten()
+        fid['Bm'][nth,:] = inv.Bm.flatten()
+        fid['d_pred'][nth,:] = np.asarray(inv.d_pred).flatten()
+        fid['nlin_pars'][nth,:] = inv.get_nlin_par_values()
+        fid['linearization/nlin_pars'][nth,:] = nlin_pars_lin
+        fid['step_norm'][nth] = step_norm
+        fid['nlin_step'][nth] = nlin_step
+        fid['misfit/norm'][nth] = inv.get_residual_norm()
+        fid['misfit/norm_weighted'][nth] = inv.get_residual_norm_weighted()
+        fid['solved'][nth] = True
+        fid['converged'][...] = self._is_converged(step_norm, nlin_step)
+        fid.flush()
+
+    def _resume(self, fid):
+        ''' Linearize about the last solved iteration in fid.
+Return:
+    number of solved iterations
+'''
+        inv = self.inv
+        solved = fid['solved'][...]
+        num_solved = int(np.sum(solved))
+        assert np.all(solved[:num_solved]), \
+               'Solved iterations in %s are not contiguous.'%fid.filename
+        if num_solved == 0:
+            return 0
+
+        nth = num_solved - 1
+        inv.m = fid['m'][nth,:].reshape([-1,1])
+        inv.Bm = fid['Bm'][nth,:].reshape([-1,1])
+        self.step_norms = list(fid['step_norm'][:num_solved])
+        self.nlin_steps = list(fid['nlin_step'][:num_solved])
+        self.converged = self._is_converged(self.step_norms[-1], self.nlin_steps[-1])
+        print('Resume Occam iterations after iteration %d.'%nth)
+        return num_solved
+
+    def _linearization_point(self):
+        inv = self.inv
+        return np.vstack([inv.slip0.stack(),
+                          np.asarray(inv.nlin_par_initial_values).reshape([-1,1])])
+
+    def run(self, file_name, nonnegative=True, overwrite=False):
+        if overwrite:
+            delete_if_exists(file_name)
+
+        inv = self.inv
+        inv.set_data_all()
+
+        with h5py.File(file_name, 'a') as fid:
+            if 'solved' in fid:
+                self._check_file(fid)
+                start = self._resume(fid)
+            else:
+                self._init_file(fid)
+                start = 0
+
+            initvals = None
+            if start > 0:
+                if not self.converged:
+                    inv.set_linearization_point(inv.get_slip(), inv.get_nlin_par_values())
+                    inv.set_data_G()
+                    inv.set_data_d()
+
+            for nth in range(start, self.max_iterations):
+                if self.converged:
+                    break
+                print('Occam iteration %d/%d: %s = %s'%(
+                    nth+1, self.max_iterations,
+                    inv.nlin_par_names, inv.nlin_par_initial_values))
+
+                Bm_lin = self._linearization_point()
+                nlin_pars_lin = list(inv.nlin_par_initial_values)
+
+                inv.invert(nonnegative=nonnegative, initvals=initvals)
+                inv.predict()
+
+                step_norm = np.linalg.norm(inv.Bm - Bm_lin) / np.linalg.norm(inv.Bm)
+                nlin_step = self._nlin_step(nlin_pars_lin)
+                self.step_norms.append(step_norm)
+                self.nlin_steps.append(nlin_step)
+                self.converged = self._is_converged(step_norm, nlin_step)
+                self._save_iteration(fid, nth, step_norm, nlin_step, nlin_pars_lin)
+
+                if self.converged:
+                    break
+
+                if self.warm_start:
+                    initvals = {'x' : inv.qp.solution['x']}
+                inv.set_linearization_point(inv.get_slip(), inv.get_nlin_par_values())
+                inv.set_data_G()
+                inv.set_data_d()
+
+            self.num_iterations = len(self.step_norms)
+        return self.converged
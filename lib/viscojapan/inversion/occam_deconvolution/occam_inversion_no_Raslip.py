@@ -36,6 +36,7 @@ class OccamInversionNoRaslip(OccamDeconvolution): #TODO - replace this class wit
     def _init_Gs(self, file_G0, files_Gs, sites):
         self.G0 = EpochGNoRaslip(file_G0, sites)
         self.num_subflts = self.G0.get_num_subflts()
+        self.G_lin = self.G0
 
         Gs = [EpochGNoRaslip(f, sites) for f in files_Gs]
 
@@ -3,5 +3,6 @@ from .deformation_partitioner_for_result_file import *
 from .deformation_partition_file_reader import *
 from .deformation_partitioner_no_Raslip import *
 from .deformation_partitioner_no_differentiation import *
+from .site_chunked_prediction import *
 from .plots import *
 
@@ -9,7 +9,67 @@ from ...epoch_3d_array import Displacement
 __all__ =['DeformPartitioner']
 __author__ = 'zy'
 
+TERMS = ('Ecumu', 'Rco', 'Raslip')
+
+def _kernel_weights(G, lags, sources):
+    ''' Weights on the epochs of G of the kernels of every term.
+
+lags - (M, N) array of t_m - t_n, target epochs t_m and source epochs t_n.
+sources - dict of term -> bool array (N,), sources that contribute to the term.
+
+Kernels of the source n at the target m are
+    Ecumu:        G(0)                      if lag >= 0,
+    Rco, Raslip:  G(lag) - G(0)             if lag > 0,
+and G(lag) is interpolated linearly between the epochs of G at the exact
+lag. The methods at one epoch, e.g. R_nth_epoch, truncate lags to whole
+days instead, so the two differ if epochs are not whole days.
+Return:
+    slabs - sorted indices of the epochs of G that are used,
+    W - dict of term -> (M, len(slabs), N) array, so that the kernel is
+        sum_k W[m,k,n] G[slabs[k]]
+'''
+    M, N = lags.shape
+    mm, nn = np.nonzero(lags > 0)
+    nth1, nth2, w = G.get_interp_weights(lags[mm, nn])
+
+    # G(0) is the first epoch of G.
+    slabs = np.unique(np.hstack([[0], nth1, nth2])).astype(int)
+    k1 = np.searchsorted(slabs, nth1)
+    k2 = np.searchsorted(slabs, nth2)
+
+    W_relax = np.zeros([M, len(slabs), N])
+    np.add.at(W_relax, (mm, k1, nn), 1. - w)
+    np.add.at(W_relax, (mm, k2, nn), w)
+    W_relax[mm, 0, nn] -= 1.
+
+    W = {}
+    for term, ch in sources.items():
+        if term == 'Ecumu':
+            W_ = np.zeros([M, len(slabs), N])
+            W_[:, 0, :] = (lags >= 0)
+        else:
+            W_ = W_relax.copy()
+        W_[:, :, ~np.asarray(ch, bool)] = 0.
+        W[term] = W_
+    return slabs, W
+
 class DeformPartitioner(object):
+    ''' Partition the predicted displacement into
+    Ecumu - elastic deformation of the cumulative slip,
+    Rco - relaxation of the coseismic slip,
+    Raslip - relaxation of the afterslip.
+
+All the epochs are computed at once (*_3d methods and save): every term is
+a contraction of the kernel weights on the epochs of a G file with the
+slip, then with the G file itself, and no DifferentialG slab is formed.
+The first contraction C does not depend on the sites, so it is computed
+once per G file and set of terms. For a chunk of sites, each G file is
+then read slabs_per_block epochs at a time, which bounds the memory to
+slabs_per_block x num_rows x num_subflts per G file.
+The methods at one epoch are kept for reference.
+'''
+    slabs_per_block = 16
+
     def __init__(self,
                  file_G0,
                  epochs,
@@ -30,6 +90,8 @@ class DeformPartitioner(object):
 
         self.sites_for_prediction = sites_for_prediction
 
+        if files_Gs is None:
+            files_Gs = []
         self.Gs = [EpochG(f, mask_sites=sites_for_prediction) for f in files_Gs]
 
         self.slip = slip
@@ -37,11 +99,21 @@ class DeformPartitioner(object):
         self.nlin_par_vals = nlin_pars
         self.nlin_par_names = nlin_par_names
 
+        self.slip0 = None
+        if file_slip0 is not None:
+            self.slip0 = EpochSlip(file_slip0).respace(self.epochs)
 
-        self.slip0 = EpochSlip(file_slip0).respace(self.epochs)
-
-        if files_Gs is not None:
+        self.dGs = []
+        if len(self.Gs) > 0:
+            assert self.slip0 is not None, 'file_slip0 is needed by files_Gs.'
             self._get_delta_nlin_pars()
+            self.dGs = [DifferentialG(ed1=self.G0, ed2=Gi, wrt=par)
+                        for Gi, par in zip(self.Gs, self.nlin_par_names)]
+
+        # kernel weights for each set of epochs of the G files
+        self._weights = {}
+        # (index in _slip_by_G, terms) -> (slabs, C)
+        self._contractions = {}
 
     def _get_delta_nlin_pars(self):
         self.delta_nlin_pars = []
@@ -49,6 +121,14 @@ class DeformPartitioner(object):
             delta = par - self.G0[name]
             self.delta_nlin_pars.append(delta)
 
+    def close(self):
+        ''' Close the G files.
+'''
+        for G in [self.G0] + self.Gs:
+            G.close()
+
+    def get_num_rows(self):
+        return self.G0.get_array_3d_lazy().shape[1]
 
     def E_cumu_slip(self, nth_epoch):
         cumuslip = self.slip.get_cumu_slip_at_nth_epoch(nth_epoch).reshape([-1,1])
@@ -63,17 +143,13 @@ class DeformPartitioner(object):
     def _nlin_correction_E_cumu_slip(self, nth_epoch):
         epoch = self.epochs[nth_epoch]
         slip0 = self.slip0.get_cumu_slip_at_epoch(epoch).reshape([-1,1])
-        dGs = []
-        for Gi, par in zip(self.Gs, self.nlin_par_names):
-            diffG = DifferentialG(ed1=self.G0, ed2=Gi, wrt=par)
-            dGs.append(diffG[0])
 
         corr = None
-        for dG, dpar in zip(dGs, self.delta_nlin_pars):
+        for diffG, dpar in zip(self.dGs, self.delta_nlin_pars):
             if corr is None:
-                corr  = np.dot(dG, slip0)*dpar
+                corr  = np.dot(diffG[0], slip0)*dpar
             else:
-                corr += np.dot(dG, slip0)*dpar
+                corr += np.dot(diffG[0], slip0)*dpar
         return corr
 
 
@@ -108,15 +184,9 @@ class DeformPartitioner(object):
 
         del_epoch = int(to_epoch - from_epoch)
 
-        dGs = []
-        for Gi, par in zip(self.Gs, self.nlin_par_names):
-            diffG = DifferentialG(ed1=self.G0, ed2=Gi, wrt=par)
-            dG0 = diffG[0]
-            dG = diffG[del_epoch]
-            dGs.append(dG-dG0)
-
         corr = None
-        for dG, dpar in zip(dGs, self.delta_nlin_pars):
+        for diffG, dpar in zip(self.dGs, self.delta_nlin_pars):
+            dG = diffG[del_epoch] - diffG[0]
             if corr is None:
                 corr  = np.dot(dG, slip0)*dpar
             else:
@@ -145,18 +215,154 @@ class DeformPartitioner(object):
     def R_aslip_at_nth_epoch(self, nth):
         return self.R_aslip(self.epochs[nth])
 
+    # all epochs at once
+    def _sources(self):
+        ''' Source epochs that contribute to each term.
+'''
+        nths = np.arange(self.num_epochs)
+        return {'Ecumu' : nths >= 0,
+                'Rco' : nths == 0,
+                'Raslip' : nths >= 1}
+
+    def _get_kernel_weights(self, G):
+        key = tuple(G.get_epochs())
+        if key not in self._weights:
+            t = np.asarray(self.epochs, dtype=float)
+            lags = t.reshape([-1,1]) - t.reshape([1,-1])
+            self._weights[key] = _kernel_weights(G, lags, self._sources())
+        return self._weights[key]
+
+    def _slip_by_G(self):
+        ''' Slip that each G file is multiplied with. Since
+    dG_i*dpar_i = (G_i - G0)*c_i,  c_i = dpar_i/(var2 - var1),
+the differential terms are
+    G0 * (slip - sum c_i*slip0) + sum G_i * c_i*slip0
+Return:
+    list of (G, incremental slip in shape (num_epochs, num_subflts))
+'''
+        N = self.num_epochs
+        s = np.array(self.slip.get_incr_slip_3d(), dtype=float).reshape([N, -1])
+        out = [(self.G0, s)]
+        if len(self.Gs) > 0:
+            s0 = np.asarray(self.slip0.get_incr_slip_3d(), dtype=float).reshape([N, -1])
+            for diffG, dpar in zip(self.dGs, self.delta_nlin_pars):
+                c = dpar/(diffG.var2 - diffG.var1)
+                s -= c*s0
+                out.append((diffG.ed2, c*s0))
+        return out
+
+    def _get_contractions(self, terms):
+        ''' Contractions of the kernel weights with the slip of every G file.
+Return:
+    list of (G, slabs, C), C in shape (len(terms)*num_epochs, len(slabs), num_subflts),
+    so that the terms are sum_k C[:,k,:] G[slabs[k]]'
+'''
+        terms = tuple(terms)
+        out = []
+        slip_by_G = None
+        for nth, G in enumerate([self.G0] + [dG.ed2 for dG in self.dGs]):
+            key = (nth, terms)
+            if key not in self._contractions:
+                if slip_by_G is None:
+                    slip_by_G = self._slip_by_G()
+                S = slip_by_G[nth][1]
+                slabs, W = self._get_kernel_weights(G)
+                W = np.vstack([W[term] for term in terms])
+                used = np.any(W != 0, axis=(0,2))
+                self._contractions[key] = (slabs[used],
+                                           np.einsum('pkn,nj->pkj', W[:, used, :], S))
+            slabs, C = self._contractions[key]
+            if len(slabs) > 0:
+                out.append((G, slabs, C))
+        return out
+
+    def _partition(self, terms, rows):
+        ''' Terms at all epochs for the rows of G.
+Return:
+    dict of term -> array in shape (num_epochs, num_rows)
+'''
+        M = self.num_epochs
+        Y = np.zeros([len(terms)*M, rows.stop - rows.start])
+        for G, slabs, C in self._get_contractions(terms):
+            for start in range(0, len(slabs), self.slabs_per_block):
+                block = slice(start, start + self.slabs_per_block)
+                Gk = G.get_array_3d_lazy()[list(slabs[block]), rows, :]
+                if Gk.dtype.kind != 'f':
+                    Gk = Gk.astype(float)
+                Y += np.tensordot(C[:, block, :], Gk, axes=([1,2],[0,2]))
+        return {term : Y[nth*M:(nth+1)*M] for nth, term in enumerate(terms)}
+
+    def partition_sites_3d(self, sites, terms = TERMS):
+        ''' Terms at all epochs for a slice of sites_for_prediction.
+Return:
+    dict of term -> array in shape (num_epochs, num_sites_in_slice, 3)
+'''
+        res = self._partition(terms, slice(sites.start*3, sites.stop*3))
+        return {term : arr.reshape([self.num_epochs, -1, 3])
+                for term, arr in res.items()}
+
+    def iter_site_chunks(self, sites_per_chunk = None):
+        num_sites = self.get_num_rows()//3
+        if sites_per_chunk is None:
+            sites_per_chunk = num_sites
+        assert sites_per_chunk > 0
+        for start in range(0, num_sites, sites_per_chunk):
+            yield slice(start, min(start + sites_per_chunk, num_sites))
+
+    def iter_partition_3d(self, terms = TERMS, sites_per_chunk = None):
+        ''' Iterate over chunks of sites.
+Yield:
+    slice of sites_for_prediction, dict of term -> array in shape
+    (num_epochs, num_sites_in_chunk, 3)
+'''
+        for sites in self.iter_site_chunks(sites_per_chunk):
+            yield sites, self.partition_sites_3d(sites, terms)
+
+    def partition_3d(self, terms = TERMS, sites_per_chunk = None):
+        ''' dict of term -> array in shape (num_epochs, num_sites, 3)
+'''
+        res = {term : np.zeros([self.num_epochs, self.get_num_rows()//3, 3])
+               for term in terms}
+        for sites, chunk in self.iter_partition_3d(terms, sites_per_chunk):
+            for term in terms:
+                res[term][:, sites, :] = chunk[term]
+        return res
+
+    def E_cumu_slip_3d(self):
+        ''' Ecumu at all epochs in shape (num_epochs, num_rows).
+'''
+        return self._partition(['Ecumu'], slice(0, self.get_num_rows()))['Ecumu']
+
+    def R_co_3d(self):
+        ''' Rco at all epochs. Return the same values as R_co_at_nth_epoch
+in shape (num_epochs, num_rows).
+'''
+        return self._partition(['Rco'], slice(0, self.get_num_rows()))['Rco']
+
+    def R_aslip_3d(self):
+        ''' Raslip at all epochs. Return the same values as R_aslip_at_nth_epoch
+in shape (num_epochs, num_rows).
+'''
+        return self._partition(['Raslip'], slice(0, self.get_num_rows()))['Raslip']
+
     # output to displacement object
     def E_cumu_slip_to_disp_obj(self):
-        return self._form_disp_obj(self.E_cumu_slip)
+        res = self.E_cumu_slip_3d().reshape([self.num_epochs, -1, 3])
+        return self._disp_3d_to_disp_obj(res)
 
     def E_aslip_to_disp_obj(self):
-        return self._form_disp_obj(self.R_aslip)
+        # E_aslip at every epoch, i.e. Ecumu - Eco
+        res = self.E_cumu_slip_3d()
+        res = (res - res[0]).reshape([self.num_epochs, -1, 3])
+        return self._disp_3d_to_disp_obj(res)
 
     def R_co_to_disp_obj(self):
-        return self._form_disp_obj(self.R_co_at_nth_epoch)
+        res = self.R_co_3d().reshape([self.num_epochs, -1, 3])
+        return self._disp_3d_to_disp_obj(res)
 
     def R_aslip_to_disp_obj(self):
-        return self._form_disp_obj(self.R_aslip_at_nth_epoch)
+        res = self.R_aslip_3d().reshape([self.num_epochs, -1, 3])
+        return self._disp_3d_to_disp_obj(res)
 
     def _form_disp_obj(self, func):
         res = []
@@ -164,7 +370,9 @@ class DeformPartitioner(object):
             res.append(func(nth).reshape([-1, 3]))
 
         res = np.asarray(res)
+        return self._disp_3d_to_disp_obj(res)
 
+    def _disp_3d_to_disp_obj(self, res):
         sites = [Site(s) for s in self.G0.get_mask_sites()]
         disp = Displacement(cumu_disp_3d=res,
              epochs=self.epochs,
@@ -174,21 +382,20 @@ class DeformPartitioner(object):
         return disp
 
     # save to a file
-    def save(self,fn):
+    def save(self, fn, sites_per_chunk = None):
+        ''' Ecumu, Rco and Raslip are computed together, chunk by chunk
+of sites_per_chunk sites, and written into the file.
+'''
+        shape = (self.num_epochs, self.get_num_rows()//3, 3)
         with h5py.File(fn,'w') as fid:
-            print('Ecumu ...')
-            disp3d_Ecumu = self.E_cumu_slip_to_disp_obj().get_cumu_disp_3d()
-            fid['Ecumu'] = disp3d_Ecumu
-
-            print('Rco ...')
-            disp3d_Rco = self.R_co_to_disp_obj().get_cumu_disp_3d()
-            fid['Rco'] = disp3d_Rco
-
-            print('Raslip ...')
-            disp3d_Raslip = self.R_aslip_to_disp_obj().get_cumu_disp_3d()
-            fid['Raslip'] = disp3d_Raslip
-
-            fid['d_added'] = disp3d_Ecumu + disp3d_Rco + disp3d_Raslip
+            for name in TERMS + ('d_added',):
+                fid.create_dataset(name, shape, dtype=float)
+
+            for sites, res in self.iter_partition_3d(TERMS, sites_per_chunk):
+                print('sites %d - %d ...'%(sites.start, sites.stop))
+                for term in TERMS:
+                    fid[term][:, sites, :] = res[term]
+                fid['d_added'][:, sites, :] = res['Ecumu'] + res['Rco'] + res['Raslip']
 
             print('epochs ...')
             fid['epochs'] = self.epochs
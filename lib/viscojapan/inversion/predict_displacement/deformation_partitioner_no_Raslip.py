@@ -31,3 +31,8 @@ class DeformPartitionerNoRaslip(DeformPartitioner):
         if int(from_nth_epoch) == 0:
             return super().R_nth_epoch(0, to_epoch)
         return np.zeros([self.G0[0].shape[0], 1])
+
+    def _sources(self):
+        sources = super()._sources()
+        sources['Raslip'] = np.zeros(self.num_epochs, dtype=bool)
+        return sources
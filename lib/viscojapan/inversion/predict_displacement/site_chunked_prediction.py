@@ -0,0 +1,165 @@
+from os.path import exists
+import multiprocessing
+
+import h5py
+import numpy as np
+
+from ...utils import delete_if_exists, as_bytes, as_string
+from .deformation_partitioner import TERMS
+
+__author__ = 'zy'
+
+__all__ = ['SiteChunkedPrediction']
+
+# The factory of the partitioner, set before the pool is forked. Every worker
+# creates its own partitioner with it, so that G files are opened by the
+# process that reads them.
+_shared = {}
+
+def _get_partitioner():
+    if 'partitioner' not in _shared:
+        _shared['partitioner'] = _shared['create_partitioner']()
+    return _shared['partitioner']
+
+def _predict_chunk(task):
+    nth, sites, terms = task
+    return nth, _get_partitioner().partition_sites_3d(sites, terms)
+
+class SiteChunkedPrediction(object):
+    ''' Predict displacement at a large number of sites, chunk by chunk of
+sites in a pool of processes.
+
+Each worker reads only the rows of its chunk of sites from the G files,
+slabs_per_block epochs of a G file at a time (see DeformPartitioner). Besides
+the slip and the contractions of the slip with the kernel weights, which are
+computed once per worker, the memory of a worker grows with sites_per_chunk,
+not with the number of sites. Results are written by the main process into file_name:
+    Ecumu, Rco, Raslip, d_added     (num_epochs, num_sites, 3)
+    epochs, sites_for_prediction
+    chunks/sites_per_chunk, chunks/done
+The datasets are chunked by sites_per_chunk. A chunk is marked done after
+it is written, so an interrupted run resumes with the chunks not done.
+
+create_partitioner - create_partitioner() returns a DeformPartitioner object.
+    It is called in the main process to read the epochs and sites, and the
+    partitioner is closed at once. Every worker (or the main process with
+    num_processes = 1) then calls it again to predict.
+terms - terms that are predicted. d_added is written only with all TERMS.
+num_processes - None to use all CPUs, 1 to run in this process.
+
+Workers are started by fork, so create_partitioner doesn't need to be picklable.
+The pool is forked before the output file is opened for writing, so that no
+worker inherits an open G file or the output file.
+'''
+    def __init__(self, *,
+                 create_partitioner,
+                 file_name,
+                 sites_per_chunk = 1000,
+                 terms = TERMS,
+                 num_processes = None,
+                 ):
+        self.create_partitioner = create_partitioner
+        self.file_name = file_name
+        self.sites_per_chunk = sites_per_chunk
+        self.terms = tuple(terms)
+        self.num_processes = num_processes
+
+        assert self.sites_per_chunk > 0
+        for term in self.terms:
+            assert term in TERMS, 'Not recognized term %s.'%term
+
+        partitioner = create_partitioner()
+        try:
+            self.epochs = list(partitioner.epochs)
+            self.sites = [str(site) for site in as_string(partitioner.G0.get_mask_sites())]
+            self.chunks = list(partitioner.iter_site_chunks(self.sites_per_chunk))
+        finally:
+            partitioner.close()
+
+    def _names(self):
+        names = list(self.terms)
+        if set(self.terms) == set(TERMS):
+            names.append('d_added')
+        return names
+
+    def _init_file(self, fid):
+        shape = (len(self.epochs), len(self.sites), 3)
+        chunks = (len(self.epochs), min(self.sites_per_chunk, len(self.sites)), 3)
+        for name in self._names():
+            fid.create_dataset(name, shape, chunks=chunks, dtype=float)
+        fid['epochs'] = self.epochs
+        fid['sites_for_prediction'] = as_bytes(self.sites)
+        fid['chunks/sites_per_chunk'] = self.sites_per_chunk
+        fid['chunks/done'] = np.zeros(len(self.chunks), dtype=bool)
+
+    def _check_file(self, fid):
+        fn = fid.filename
+        assert np.allclose(fid['epochs'][...], self.epochs), \
+               'Epochs of %s are different.'%fn
+        assert list(as_string(fid['sites_for_prediction'][...])) == self.sites, \
+               'Sites of %s are different.'%fn
+        assert int(fid['chunks/sites_per_chunk'][...]) == self.sites_per_chunk, \
+               'Chunks of %s are different.'%fn
+        for name in self._names():
+            assert name in fid, '%s is not in %s.'%(name, fn)
+
+    def _write_chunk(self, fid, nth, res):
+        sites = self.chunks[nth]
+        for term in self.terms:
+            fid[term][:, sites, :] = res[term]
+        if 'd_added' in self._names():
+            fid['d_added'][:, sites, :] = sum(res[term] for term in TERMS)
+        fid['chunks/done'][nth] = True
+        fid.flush()
+
+    def get_tasks(self, fid):
+        done = fid['chunks/done'][...]
+        return [(nth, sites, self.terms) for nth, sites in enumerate(self.chunks)
+                if not done[nth]]
+
+    def run(self, overwrite = False):
+        ''' Return:
+    number of chunks that are predicted by this run.
+'''
+        if overwrite:
+            delete_if_exists(self.file_name)
+
+        with h5py.File(self.file_name, 'a') as fid:
+            if 'chunks' in fid:
+                self._check_file(fid)
+            else:
+                self._init_file(fid)
+            tasks = self.get_tasks(fid)
+
+        if len(tasks) < len(self.chunks):
+            print('Resume: %d of %d chunks are done.'%(
+                len(self.chunks) - len(tasks), len(self.chunks)))
+
+        _shared['create_partitioner'] = self.create_partitioner
+        pool = None
+        try:
+            if self.num_processes == 1 or len(tasks) == 0:
+                results = map(_predict_chunk, tasks)
+            else:
+                ctx = multiprocessing.get_context('fork')
+                pool = ctx.Pool(processes = self.num_processes)
+                results = pool.imap_unordered(_predict_chunk, tasks)
+
+            with h5py.File(self.file_name, 'a') as fid:
+                for num, (nth, res) in enumerate(results, start=1):
+                    self._write_chunk(fid, nth, res)
+                    print('Chunk %d/%d (sites %d - %d) is done.'%(
+                        num, len(tasks), self.chunks[nth].start, self.chunks[nth].stop))
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if 'partitioner' in _shared:
+                _shared['partitioner'].close()
+            _shared.clear()
+        return len(tasks)
+
+    def is_done(self):
+        if not exists(self.file_name):
+            return False
+        with h5py.File(self.file_name, 'r') as fid:
+            return 'chunks' in fid and bool(np.all(fid['chunks/done'][...]))
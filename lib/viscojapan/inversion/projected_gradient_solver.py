@@ -0,0 +1,223 @@
+import numpy as np
+import scipy.sparse as sparse
+
+from ..utils import assert_col_vec_and_get_nrow
+
+__all__ = ['ProjectedGradientSolver']
+
+def _power_iteration(matvec, rmatvec, n, num_iters=30):
+    ''' Estimate the largest eigenvalue of A'A, i.e. ||A||^2.
+'''
+    v = np.random.RandomState(0).rand(n)
+    v /= np.linalg.norm(v)
+    lam = 0.
+    for ii in range(num_iters):
+        w = rmatvec(matvec(v))
+        lam = np.linalg.norm(w)
+        if lam == 0.:
+            return 0.
+        v = w / lam
+    return lam
+
+class ProjectedGradientSolver(object):
+    ''' Solve min 1/2 ||A m - b||^2 s.t. m >= 0, GG m <= 0, using only products
+with A (or P = A'A, q = -A'b), A' and GG. Same interface as CvxoptQpWrapper;
+each invert() starts from the last solution.
+'''
+    def __init__(self,*,
+                 A = None,
+                 b = None,
+                 P = None,
+                 q = None,
+                 GG = None,
+                 max_iter = 20000,
+                 tol = 1e-8
+                 ):
+        self.A = A
+        self.b = b
+        self.P = P
+        self.q = q
+        self.GG = None if GG is None else sparse.csr_matrix(GG)
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self._m = None
+        self._y = None
+        self._lipschitz_A = None
+        self._lipschitz_A_of = None
+        self._lipschitz_GG = None
+
+        self._check_input()
+
+    def _check_input(self):
+        if self.P is not None:
+            assert self.A is None and self.b is None, 'Give either A, b or P, q.'
+            nrow_q = assert_col_vec_and_get_nrow(self.q)
+            assert self.P.shape == (nrow_q, nrow_q)
+            self.num_pars = nrow_q
+        else:
+            nrow_b = assert_col_vec_and_get_nrow(self.b)
+            assert self.A.shape[0] == nrow_b
+            self.num_pars = self.A.shape[1]
+
+        if self.GG is not None:
+            assert self.GG.shape[1] == self.num_pars
+
+    def _Am(self, m):
+        return np.asarray(self.A.dot(m)).reshape([-1])
+
+    def _Atr(self, r):
+        return np.asarray(self.A.T.dot(r)).reshape([-1])
+
+    def _grad(self, m, b):
+        # b is q if P is given
+        if self.P is not None:
+            return np.asarray(self.P.dot(m)).reshape([-1]) + b
+        return self._Atr(self._Am(m) - b)
+
+    def get_lipschitz_A(self):
+        # recomputed if A or P has been replaced since
+        op = self.A if self.P is None else self.P
+        if self._lipschitz_A is None or self._lipschitz_A_of is not op:
+            self._lipschitz_A_of = op
+            if self.P is not None:
+                # ||P|| = ||A||^2 for P = A'A
+                Pm = lambda m: np.asarray(self.P.dot(m)).reshape([-1])
+                self._lipschitz_A = 1.01 * np.sqrt(_power_iteration(
+                    Pm, Pm, self.num_pars))
+            else:
+                self._lipschitz_A = 1.01 * _power_iteration(
+                    self._Am, self._Atr, self.num_pars)
+        return self._lipschitz_A
+
+    def get_lipschitz_GG(self):
+        if self._lipschitz_GG is None:
+            GGt = self.GG.T.tocsr()
+            self._lipschitz_GG = 1.01 * _power_iteration(
+                self.GG.dot, GGt.dot, self.num_pars)
+        return self._lipschitz_GG
+
+    def _initial_m(self, initvals):
+        if initvals is not None:
+            if isinstance(initvals, dict):
+                initvals = initvals['x']
+            return np.asarray(initvals, dtype=float).reshape([-1]).copy()
+        if self._m is not None:
+            return self._m.copy()
+        return np.zeros(self.num_pars)
+
+    def invert(self, nonnegative=True, initvals=None):
+        self._check_input()
+        if self.P is not None:
+            b = np.asarray(self.q, dtype=float).reshape([-1])
+        else:
+            b = np.asarray(self.b, dtype=float).reshape([-1])
+        m0 = self._initial_m(initvals)
+
+        if nonnegative:
+            proj = lambda m: np.maximum(m, 0.)
+        else:
+            proj = lambda m: m
+
+        if self.GG is None:
+            m, num_iters, converged = self._fista(b, m0, proj)
+            y = None
+        else:
+            m, y, num_iters, converged = self._condat_vu(b, m0, proj)
+
+        self._m = m
+        self._y = y
+
+        self.solution = {
+            'x' : m.reshape([-1,1]),
+            'y' : y,
+            'status' : 'optimal' if converged else 'unknown',
+            'iterations' : num_iters,
+            }
+
+    def _fista(self, b, m, proj):
+        # accelerated projected gradient with adaptive restart, without GG
+        step = 1. / self.get_lipschitz_A()
+        m = proj(m)
+        z = m.copy()
+        t = 1.
+        for ii in range(1, self.max_iter+1):
+            m_new = proj(z - step*self._grad(z, b))
+
+            # gradient mapping at z; zero at the solution
+            diff = z - m_new
+            if np.linalg.norm(diff) <= self.tol * max(1., np.linalg.norm(m_new)):
+                return m_new, ii, True
+
+            # adaptive restart when momentum points uphill
+            if np.dot(diff, m_new - m) > 0:
+                t = 1.
+
+            t_new = (1. + np.sqrt(1. + 4.*t*t))/2.
+            z = m_new + ((t - 1.)/t_new)*(m_new - m)
+            m = m_new
+            t = t_new
+        return m, self.max_iter, False
+
+    def _condat_vu(self, b, m, proj):
+        # primal-dual algorithm of Condat and Vu, which only needs projections
+        # onto m >= 0 and onto the dual cone y >= 0
+        GG = self.GG
+        GGt = GG.T.tocsr()
+
+        beta = self.get_lipschitz_A()
+        norm_GG2 = max(self.get_lipschitz_GG(), 1e-30)
+
+        # step sizes satisfy: 1/tau - sigma ||GG||^2 >= beta/2
+        sigma = beta / norm_GG2
+        tau = 0.99 / (beta/2. + sigma*norm_GG2)
+
+        if self._y is not None and self._y.shape[0] == GG.shape[0]:
+            y = self._y.copy()
+        else:
+            y = np.zeros(GG.shape[0])
+
+        m = proj(m)
+        for ii in range(1, self.max_iter+1):
+            m_new = proj(m - tau*(self._grad(m, b) + GGt.dot(y)))
+            y = np.maximum(y + sigma*GG.dot(2.*m_new - m), 0.)
+
+            step = np.linalg.norm(m_new - m)
+            m = m_new
+            # the KKT residuals are only checked once the primal steps are small
+            if step <= self.tol * max(1., np.linalg.norm(m)) and \
+               self._kkt_converged(b, m, y, proj, GG, GGt):
+                return m, y, ii, True
+        return m, y, self.max_iter, False
+
+    def _kkt_converged(self, b, m, y, proj, GG, GGt):
+        # Stationarity, feasibility and complementarity are all below
+        # sqrt(tol), relative to the size of m and of the gradient. They
+        # bound the error of the solution less tightly than tol in FISTA.
+        eps = np.sqrt(self.tol)
+        grad = self._grad(m, b)
+        GGm = GG.dot(m)
+        scale_m = max(1., np.linalg.norm(m))
+        scale_grad = max(1., np.linalg.norm(grad))
+
+        stationarity = np.linalg.norm(m - proj(m - grad - GGt.dot(y)))
+        violation = max(np.max(GGm), 0.)
+        complementarity = abs(np.dot(y, GGm))
+        return stationarity <= eps * scale_m and \
+               violation <= eps * scale_m and \
+               complementarity <= eps * scale_m * scale_grad
+
+    def update_from_inversion_parameters_set(self, inv_par_set):
+        ''' Replace the inputs, keeping the last solution for a warm start.
+'''
+        self.A, self.b = inv_par_set.gen_inputs_for_least_squares()
+        self.P = None
+        self.q = None
+        self.GG = None if inv_par_set.GG is None else sparse.csr_matrix(inv_par_set.GG)
+        self._lipschitz_GG = None
+        self._check_input()
+
+    @classmethod
+    def create_from_inversion_parameters_set(cls, inv_par_set):
+        A, b = inv_par_set.gen_inputs_for_least_squares()
+        return cls(A=A, b=b, GG=inv_par_set.GG)
@@ -1,7 +1,7 @@
 import numpy as np
 import scipy.sparse as sp
 
-from viscojapan.fault_model import FaultFileReader
+from viscojapan.fault_model import load_fault_geometry
 from .regularization import Leaf, Composite
 
 __all__ = ['BoundaryRegDeadNorthAndSouth','NorthBoundary',
@@ -30,10 +30,10 @@ class _BoundaryRegularizationBase(Leaf):
 
     @classmethod
     def create_from_fault_file(cls, fault_file):
-        fid = FaultFileReader(fault_file)        
+        fault = load_fault_geometry(fault_file)        
         reg = cls(
-            ncols_slip = fid.num_subflt_along_strike,
-            nrows_slip = fid.num_subflt_along_dip,
+            ncols_slip = fault.num_subflt_along_strike,
+            nrows_slip = fault.num_subflt_along_dip,
             )
         return reg
 
@@ -112,10 +112,10 @@ class DeadBoundary(Composite):
 
     @classmethod
     def create_from_fault_file(cls, fault_file):
-        fid = FaultFileReader(fault_file)        
+        fault = load_fault_geometry(fault_file)        
         reg = cls(
-            ncols_slip = fid.num_subflt_along_strike,
-            nrows_slip = fid.num_subflt_along_dip,
+            ncols_slip = fault.num_subflt_along_strike,
+            nrows_slip = fault.num_subflt_along_dip,
             )
         return reg
 
@@ -136,10 +136,10 @@ class BoundaryRegDeadNorthAndSouth(Composite):
 
     @classmethod
     def create_from_fault_file(cls, fault_file):
-        fid = FaultFileReader(fault_file)        
+        fault = load_fault_geometry(fault_file)        
         reg = cls(
-            ncols_slip = fid.num_subflt_along_strike,
-            nrows_slip = fid.num_subflt_along_dip,
+            ncols_slip = fault.num_subflt_along_strike,
+            nrows_slip = fault.num_subflt_along_dip,
             )
         return reg
 
@@ -159,10 +159,10 @@ class AllBoundaryReg(Composite):
 
     @classmethod
     def create_from_fault_file(cls, fault_file):
-        fid = FaultFileReader(fault_file)        
+        fault = load_fault_geometry(fault_file)        
         reg = cls(
-            ncols_slip = fid.num_subflt_along_strike,
-            nrows_slip = fid.num_subflt_along_dip,
+            ncols_slip = fault.num_subflt_along_strike,
+            nrows_slip = fault.num_subflt_along_dip,
             )
         return reg
         
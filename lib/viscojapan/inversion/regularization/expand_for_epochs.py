@@ -1,3 +1,4 @@
+import numpy as np
 from scipy import sparse
 
 from .regularization import Leaf
@@ -5,17 +6,10 @@ from .regularization import Leaf
 __all__ = ['ExpandForAllEpochs','ExpandForOnlyFirstEpoch',
            'ExpandExceptFirstEpoch','ExpandForCumulativeSlip']
 
-def stack_to_lower_tri(mat, size):
-    out = []
-    for i in range(size):
-        tp = []
-        for j in range(size):
-            if j>i:
-                tp.append(None)
-            else:
-                tp.append(mat)
-        out.append(tp)
-    return out    
+def expand_by_epochs(mat, epochs_mat):
+    ''' Block (i, j) of the result is epochs_mat[i,j]*mat.
+'''
+    return sparse.kron(epochs_mat, mat, format='csr')
 
 class ExpandForAllEpochs(Leaf):
     def __init__(self,
@@ -26,7 +20,7 @@ class ExpandForAllEpochs(Leaf):
 
     def generate_regularization_matrix(self):
         regmat = self.reg()
-        L = sparse.block_diag([regmat]*self.num_epochs)
+        L = expand_by_epochs(regmat, sparse.eye(self.num_epochs))
         return L
 
 class ExpandForOnlyFirstEpoch(Leaf):
@@ -38,10 +32,9 @@ class ExpandForOnlyFirstEpoch(Leaf):
 
     def generate_regularization_matrix(self):
         regmat = self.reg()
-        shape = regmat.shape
-        shape = (shape[0]*(self.num_epochs-1), shape[1]*(self.num_epochs-1))
-        zero = sparse.csc_matrix(shape)
-        L = sparse.block_diag([regmat, zero])
+        sel = np.zeros(self.num_epochs)
+        sel[0] = 1.
+        L = expand_by_epochs(regmat, sparse.diags(sel))
         return L        
         
 class ExpandExceptFirstEpoch(Leaf):
@@ -53,9 +46,9 @@ class ExpandExceptFirstEpoch(Leaf):
 
     def generate_regularization_matrix(self):
         regmat = self.reg()
-        shape = regmat.shape
-        zero = sparse.csc_matrix(shape)
-        L = sparse.block_diag([zero]+[regmat]*(self.num_epochs-1))
+        sel = np.ones(self.num_epochs)
+        sel[0] = 0.
+        L = expand_by_epochs(regmat, sparse.diags(sel))
         return L  
 
 class ExpandForCumulativeSlip(Leaf):
@@ -67,6 +60,6 @@ class ExpandForCumulativeSlip(Leaf):
 
     def generate_regularization_matrix(self):
         regmat = self.reg()
-        tp = stack_to_lower_tri(regmat, self.num_epochs)
-        L = sparse.bmat(tp)
+        lower_tri = sparse.tril(np.ones((self.num_epochs, self.num_epochs)))
+        L = expand_by_epochs(regmat, lower_tri)
         return L
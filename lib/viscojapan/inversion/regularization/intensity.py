@@ -1,7 +1,7 @@
 from scipy.sparse import eye
 
 from .regularization import Regularization
-from viscojapan.fault_model import FaultFileReader
+from viscojapan.fault_model import load_fault_geometry
 
 __all__=['Intensity']
 
@@ -16,7 +16,7 @@ class Intensity(Regularization):
 
     @staticmethod
     def create_from_fault_file(fault_file):
-        fid = FaultFileReader(fault_file)
-        num_pars = fid.num_subflt_along_strike * fid.num_subflt_along_dip
+        fault = load_fault_geometry(fault_file)
+        num_pars = fault.num_subflt_along_strike * fault.num_subflt_along_dip
         L0 = Intensity(num_pars)
         return L0
@@ -1,18 +1,36 @@
 ''' Composite Pattern
 '''
+import numpy as np
 from numpy import dot
 import scipy.sparse as sparse
 
 def vstack_reg_mat(reg_mats, reg_pars):
     assert len(reg_mats) == len(reg_pars)
-    L_list = []
-    for L, arg in zip(reg_mats, reg_pars):
-        tp = sparse.csr_matrix(L)
-        L_list.append(arg*tp)
-    L_stack = sparse.vstack(L_list)
+    L_stack = scale_rows_by_blocks(stack_reg_mat(reg_mats),
+                                   [L.shape[0] for L in reg_mats],
+                                   reg_pars)
     return L_stack
 
-class Regularization(object):        
+def stack_reg_mat(reg_mats):
+    ''' Stack regularization matrices in a single CSR matrix.
+'''
+    return sparse.vstack(reg_mats, format='csr')
+
+def scale_rows_by_blocks(L, block_nrows, args):
+    ''' Return a copy of CSR matrix L with the rows of nth block
+multiplied by args[nth].
+'''
+    assert len(block_nrows) == len(args)
+    assert sum(block_nrows) == L.shape[0]
+    L = L.copy()
+    row_args = np.repeat(np.asarray(args, float), block_nrows)
+    L.data *= np.repeat(row_args, np.diff(L.indptr))
+    return L
+
+class Regularization(object):
+    # Incremented whenever the matrix generated by the object changes.
+    version = 0
+
     def __call__(self):
         return self.generate_regularization_matrix()        
 
@@ -23,6 +41,13 @@ class Regularization(object):
     def reg_vec(self, m):
         return self().dot(m)
 
+    def _matrix_key(self):
+        ''' Identify the regularization matrix this object generates.
+The key holds the object itself, so that it is never confused with
+another object that happens to get the same id.
+'''
+        return (self, self.version)
+
     def solution_norm(self, m):
         L = self()
         npar = L.shape[1]
@@ -55,12 +80,40 @@ class Composite(Regularization):
             self.arg_names = []
         else:
             self.arg_names = arg_names
+
+        self.clear_cache()
+
+    def clear_cache(self):
+        ''' Forget the stacked matrix of the components.
+Call it after changing the components in place.
+'''
+        self.version += 1
+        self._stack = None
+        self._stack_key = None
+        self._block_nrows = None
+
+    def _matrix_key(self):
+        return (self, self.version, self._components_key())
+
+    def _components_key(self):
+        return tuple(reg._matrix_key() for reg in self.components)
+
+    def _stacked_components(self):
+        ''' Unscaled stack of the component matrices, built once and
+reused as long as the components are unchanged.
+'''
+        key = self._components_key()
+        if self._stack is None or self._stack_key != key:
+            mats = [sparse.csr_matrix(reg.generate_regularization_matrix())
+                    for reg in self.components]
+            self._stack = stack_reg_mat(mats)
+            self._block_nrows = [L.shape[0] for L in mats]
+            self._stack_key = key
+        return self._stack
         
     def generate_regularization_matrix(self):
-        mats = []
-        for reg in self.components:
-            mats.append(reg.generate_regularization_matrix())
-        L = vstack_reg_mat(mats, self.args)
+        L = self._stacked_components()
+        L = scale_rows_by_blocks(L, self._block_nrows, self.args)
         return L
 
     def components_solution_norms(self,m):    
@@ -74,11 +127,13 @@ class Composite(Regularization):
         self.components.append(component)
         self.args.append(arg)
         self.arg_names.append(arg_name)
+        self.clear_cache()
         return self
 
     def update_args(self,args):
-        assert len(args) == self.args
-        self.args = args
+        assert len(args) == len(self.args)
+        self.args = list(args)
+        self.version += 1
         return self
         
         
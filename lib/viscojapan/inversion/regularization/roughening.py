@@ -1,8 +1,7 @@
-from scipy.sparse import eye, bmat, block_diag, coo_matrix, vstack
-import scipy.sparse as sparse
+from scipy.sparse import eye, kron
 from numpy import sqrt
 
-from viscojapan.fault_model import FaultFileReader
+from viscojapan.fault_model import load_fault_geometry
 from .regularization import Leaf, Composite
 
 __all__=['Roughening']
@@ -35,22 +34,10 @@ class RowRoughening(Leaf):
         
     def row_roughening(self):
         ''' Roughening between rows.
+Block (n, n:n+3) is [I, -2I, I], i.e. roughening along dip of every column.
 '''
-        A = eye(self.ncols_slip, dtype='float')
-        B = -2. * eye(self.ncols_slip, dtype='float')
-
-        block = []
-        for nth in range(0, self.nrows_slip-2):
-            block.append([None]*self.nrows_slip)
-        
-        for n in range(0,self.nrows_slip-2):
-            block[n][n] = A
-        for n in range(0,self.nrows_slip-2):
-            block[n][n+1] = B
-        for n in range(0,self.nrows_slip-2):
-            block[n][n+2] = A
-
-        mat = bmat(block, dtype='float')
+        mat = kron(roughening_matrix(self.nrows_slip),
+                   eye(self.ncols_slip, dtype='float'), format='csr')
         return mat
     
     def generate_regularization_matrix(self):
@@ -70,8 +57,8 @@ class ColRoughening(Leaf):
     def col_roughening(self):
         ''' Roughening between columns.
 '''
-        mat = roughening_matrix(self.ncols_slip)
-        mat = block_diag([mat]*self.nrows_slip)
+        mat = kron(eye(self.nrows_slip, dtype='float'),
+                   roughening_matrix(self.ncols_slip), format='csr')
         return mat
 
     def generate_regularization_matrix(self):
@@ -91,18 +78,10 @@ class RowColRoughening(Leaf):
         self.norm_length_dip = norm_length_dip
 
     def row_col_roughening(self):
-        B = finite_difference_matrix(self.ncols_slip)
-        A = -B
-
-        block = []
-        for nth in range(0, self.nrows_slip-1):
-            block.append([None]*self.nrows_slip)
-            
-        for n in range(0,self.nrows_slip-1):
-            block[n][n] = A
-        for n in range(0,self.nrows_slip-1):
-            block[n][n+1] = B
-        mat =  bmat(block, dtype='float')  
+        ''' Block (n, n:n+2) is [-B, B], B the finite difference along strike.
+'''
+        mat = kron(finite_difference_matrix(self.nrows_slip),
+                   finite_difference_matrix(self.ncols_slip), format='csr')
         return mat
 
     def generate_regularization_matrix(self):
@@ -149,14 +128,14 @@ class Roughening(Composite):
 
     @classmethod
     def create_from_fault_file(cls, fault_file):
-        fid = FaultFileReader(fault_file)
+        fault = load_fault_geometry(fault_file)
         
         L2 = cls(
-            ncols_slip = fid.num_subflt_along_strike,
-            nrows_slip = fid.num_subflt_along_dip,
+            ncols_slip = fault.num_subflt_along_strike,
+            nrows_slip = fault.num_subflt_along_dip,
             norm_length_strike = 1.,
             norm_length_dip = \
-                fid.subflt_sz_dip/fid.subflt_sz_strike,
+                fault.subflt_sz_dip/fault.subflt_sz_strike,
             )
         return L2
 
@@ -1,6 +1,7 @@
-from scipy.sparse import coo_matrix
+import numpy as np
+from scipy.sparse import coo_matrix, kron, eye
 
-from viscojapan.fault_model import FaultFileReader
+from viscojapan.fault_model import load_fault_geometry
 from ...utils import assert_nonnegative_integer, assert_assending_order
 
 from .regularization import Leaf
@@ -11,41 +12,23 @@ def time_derivative_matrix(epochs):
     assert num_epochs >= 3, \
            'In order to compute time derivative, # of epochs must be equal or greater than 3.'
 
-    nth_row = 0
-    data = []
-    I = []
-    J = []
-    for ith, epoch in enumerate(epochs[0:-1]):
-        if epoch == 0:
-            continue
-        
-        data += [-1./(epoch - epochs[ith-1]), 1./(epochs[ith+1] - epoch)]
-        I    += [nth_row,  nth_row]
-        J    += [ith, ith+1]
-        
-        nth_row += 1
+    epochs = np.asarray(epochs, float)
+    # Row for every epoch except epoch 0 and the last one:
+    ith = np.nonzero(epochs[0:-1] != 0)[0]
+    nth_row = np.arange(len(ith))
+
+    data = np.vstack([-1./(epochs[ith] - epochs[ith-1]),
+                      1./(epochs[ith+1] - epochs[ith])]).T.flatten()
+    I = np.repeat(nth_row, 2)
+    J = np.vstack([ith, ith+1]).T.flatten()
 
     res = coo_matrix((data,(I,J)),dtype=float)
     return res
 
 def inflate_time_derivative_matrix_by_num_subflts( time_derivative_mat, num_subflts):
-    data0 = time_derivative_mat.data
-    row0 = time_derivative_mat.row
-    col0 = time_derivative_mat.col
-
-    data = []
-    row = []
-    col = []
-    for di, ri, ci in zip(data0, row0, col0):
-        _data = [di]*num_subflts
-        _row = [ri*num_subflts + ii for ii in range(num_subflts)]
-        _col = [ci*num_subflts + ii for ii in range(num_subflts)]
-
-        data += _data
-        row += _row
-        col += _col
-
-    res = coo_matrix((data, (row, col)),dtype=float)
+    ''' Entry (i, j) is expanded to the diagonal block (i, j) of all subfaults.
+'''
+    res = kron(time_derivative_mat, eye(num_subflts), format='coo')
     return res
 
 class TemporalRegularization(Leaf):
@@ -67,8 +50,8 @@ class TemporalRegularization(Leaf):
 
     @staticmethod
     def create_from_fault_file(fault_file, epochs):
-        fid = FaultFileReader(fault_file)
-        num_subflts = fid.num_subflt_along_strike * fid.num_subflt_along_dip
+        fault = load_fault_geometry(fault_file)
+        num_subflts = fault.num_subflt_along_strike * fault.num_subflt_along_dip
 
         L = TemporalRegularization(
             num_subflts = num_subflts,
@@ -0,0 +1,161 @@
+import os
+from os.path import exists, join
+import multiprocessing
+import tempfile
+
+import h5py
+import numpy as np
+import scipy.sparse as sparse
+
+from ..utils import delete_if_exists
+
+__author__ = 'zy'
+
+__all__ = ['RegularizationGridRunner']
+
+# The inversion shared by the worker processes. It is set before the pool
+# is forked, so it is inherited by the workers and never pickled.
+_shared = {}
+
+def _run_one(task):
+    inv = _shared['inv']
+    create_regularization = _shared['create_regularization']
+
+    outfname, args = task
+    if exists(outfname):
+        print("Skip %s !"%outfname)
+        return outfname
+
+    inv.regularization = create_regularization(*args)
+    inv.set_data_L()
+    inv.run()
+
+    # A file is either complete or absent, so an interrupted run can be resumed.
+    tmpfname = outfname + '.part'
+    inv.save(tmpfname, overwrite=True)
+    os.rename(tmpfname, outfname)
+    return outfname
+
+def _memmap_dataset(fid, name):
+    ''' Read-only memory map of a dataset. A dataset that has no contiguous
+bytes in the file to map, i.e. one that is chunked, compressed or empty,
+is read into memory instead.
+'''
+    dset = fid[name]
+    offset = dset.id.get_offset()
+    if offset is None or dset.size == 0:
+        return dset[...]
+    return np.memmap(fid.filename, mode='r', dtype=dset.dtype,
+                     shape=dset.shape, offset=offset)
+
+class RegularizationGridRunner(object):
+    ''' Run an inversion at every point of a regularization grid
+in a pool of processes.
+
+inv - Inversion object. set_data_except(excepts=['L']) should have been called.
+create_regularization - create_regularization(*args) returns
+    the regularization object of a grid point.
+grid - list of (outfname, args).
+    Grid points whose outfname exists are skipped.
+num_processes - None to use all CPUs.
+shared_attrs - large attributes of inv shared by the workers.
+    Dense arrays and sparse matrices are written once to an HDF5 file and
+    replaced by read-only memory maps of it, so the workers read the same
+    pages instead of getting a copy each.
+tmp_dir - directory of the shared HDF5 file.
+
+Workers are started by fork, so inv doesn't need to be picklable.
+'''
+    def __init__(self, *,
+                 inv,
+                 create_regularization,
+                 grid,
+                 num_processes = None,
+                 shared_attrs = ('G', 'd', 'W', 'disp_obs'),
+                 tmp_dir = None,
+                 ):
+        self.inv = inv
+        self.create_regularization = create_regularization
+        self.grid = [(outfname, tuple(args)) for outfname, args in grid]
+        self.num_processes = num_processes
+        self.shared_attrs = shared_attrs
+        self.tmp_dir = tmp_dir
+
+        self._shared_file = None
+
+    def get_tasks(self):
+        tasks = []
+        for outfname, args in self.grid:
+            if exists(outfname):
+                print("Skip %s !"%outfname)
+                continue
+            tasks.append((outfname, args))
+        return tasks
+
+    def _share_arrays(self):
+        fd, self._shared_file = tempfile.mkstemp(suffix='.h5', dir=self.tmp_dir)
+        os.close(fd)
+
+        inv = self.inv
+        names = []
+        with h5py.File(self._shared_file, 'w') as fid:
+            for name in self.shared_attrs:
+                val = getattr(inv, name, None)
+                if isinstance(val, np.ndarray):
+                    fid[name] = val
+                    names.append(name)
+                elif sparse.isspmatrix(val):
+                    val = val.tocsr()
+                    for key in 'data', 'indices', 'indptr':
+                        fid['%s/%s'%(name, key)] = getattr(val, key)
+                    fid[name].attrs['shape'] = val.shape
+                    names.append(name)
+
+        fid = h5py.File(self._shared_file, 'r')
+        for name in names:
+            if isinstance(fid[name], h5py.Dataset):
+                setattr(inv, name, _memmap_dataset(fid, name))
+            else:
+                mat = sparse.csr_matrix(
+                    tuple(_memmap_dataset(fid, join(name, key))
+                          for key in ('data', 'indices', 'indptr')),
+                    shape = tuple(fid[name].attrs['shape']), copy=False)
+                setattr(inv, name, mat)
+        fid.close()
+        self._shared_names = names
+
+    def _unshare_arrays(self):
+        inv = self.inv
+        for name in self._shared_names:
+            val = getattr(inv, name)
+            if sparse.isspmatrix(val):
+                setattr(inv, name, val.copy())
+            else:
+                setattr(inv, name, np.array(val))
+        delete_if_exists(self._shared_file)
+        self._shared_file = None
+
+    def run(self):
+        tasks = self.get_tasks()
+        if len(tasks) == 0:
+            return []
+
+        _shared['inv'] = self.inv
+        _shared['create_regularization'] = self.create_regularization
+        try:
+            if self.num_processes == 1:
+                return [_run_one(task) for task in tasks]
+
+            self._share_arrays()
+            try:
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(processes = self.num_processes) as pool:
+                    outs = []
+                    for outfname in pool.imap_unordered(_run_one, tasks):
+                        print('Finished %s'%outfname)
+                        outs.append(outfname)
+                    return outs
+            finally:
+                self._unshare_arrays()
+        finally:
+            _shared.clear()
@@ -30,9 +30,9 @@ class StaticInversion(Inversion):
         self.num_epochs = len(self.epochs)
         self.nlin_par_names = []
 
-        reader = vj.fm.FaultFileReader(fault_file)
-        self.num_subflt_along_dip = reader.num_subflt_along_dip
-        self.num_subflt_along_strike = reader.num_subflt_along_strike
+        fault = vj.fm.load_fault_geometry(fault_file)
+        self.num_subflt_along_dip = fault.num_subflt_along_dip
+        self.num_subflt_along_strike = fault.num_subflt_along_strike
 
         
         
@@ -1,6 +1,6 @@
 import numpy as np
 
-from ..fault_model import FaultFileReader
+from ..fault_model import load_fault_geometry
 from ..earth_model import EarthModelFileReader
 
 from .utils import mo_to_mw
@@ -14,8 +14,8 @@ class MomentCalculator(object):
         self.earth_model_file = earth_file
 
     def get_shear(self):
-        reader = FaultFileReader(self.fault_model_file)
-        ddeps = reader.ddeps[1:, 1:]
+        fault = load_fault_geometry(self.fault_model_file)
+        ddeps = fault.ddeps[1:, 1:]
         reader = EarthModelFileReader(self.earth_model_file)
         return reader.get_shear_by_dep(ddeps)
         
@@ -23,10 +23,10 @@ class MomentCalculator(object):
     def compute_moment(self, slip2d):
         ''' Compute moment.
 '''
-        reader = FaultFileReader(self.fault_model_file)
+        fault = load_fault_geometry(self.fault_model_file)
         
-        fl = reader.subflt_sz_dip
-        fw = reader.subflt_sz_strike
+        fl = fault.subflt_sz_dip
+        fw = fault.subflt_sz_strike
         
         shr = self.get_shear()
         mos = shr.flatten()*slip2d.flatten()*fl*1e3*fw*1e3
@@ -1,13 +1,37 @@
 from os.path import join, basename, exists
 import os
 import subprocess
+from tempfile import mkdtemp
+from shutil import rmtree
 
 from viscojapan.pollitz.pollitz_wrapper import stat2gA, strainA
+from viscojapan.pollitz.pollitz_wrapper.pollitz_wrapper import DEFAULT_TMP_DIR
+from viscojapan.utils import create_dir_if_not_exists
 from dpool2 import Task, DPool
 
 __all__ = ['ComputeGreensFunction']
 
 class ComputeGreensFunction(object):
+    ''' Run stat2gA and strainA for all subfaults and epochs in a DPool.
+
+tmp_dir - root of the working directories of the commands.
+link_mode - how earth model outputs are deployed, see PollitzWrapper.
+    'symlink' or 'hardlink' saves copying the large decay.out, vsph.out ...
+reuse_cwd - If True, each pool process deploys the earth model outputs once
+    into a working directory per command and runs all its subfaults there,
+    instead of deploying them for every subfault. The directories are made
+    in a directory of the run, which is removed when the pool is done,
+    also if a process of it was killed.
+subflts_per_task - number of subfaults run one after another by a task.
+    Fewer, larger tasks cut the scheduling overhead of DPool.
+    Each subfault still needs its own stat2gA or strainA run, because
+    the programs sum up the displacements of all patches in a fault file.
+journal_file - task journal of DPool. The key of a task lists the keys
+    of its subfaults. Subfaults whose outputs exist are skipped when tasks
+    are loaded, with or without a journal, so a run can be resumed with
+    another subflts_per_task.
+max_retries, retry_backoff - retry of failed tasks, see DPool.
+'''
     def __init__(self,
                  epochs,
                  file_sites,
@@ -18,6 +42,13 @@ class ComputeGreensFunction(object):
                  controller_file,
                  stdout = subprocess.DEVNULL,
                  stderr = subprocess.STDOUT,
+                 tmp_dir = None,
+                 link_mode = 'copy',
+                 reuse_cwd = False,
+                 subflts_per_task = 1,
+                 journal_file = None,
+                 max_retries = 0,
+                 retry_backoff = 10.,
                  ):
         self.epochs = epochs
         self.file_sites = file_sites
@@ -28,10 +59,26 @@ class ComputeGreensFunction(object):
         self.outputs_dir = outputs_dir
         self.stdout = stdout
         self.stderr = stderr
+        self.tmp_dir = tmp_dir
+        self.link_mode = link_mode
+        self.reuse_cwd = reuse_cwd
+        assert subflts_per_task >= 1
+        self.subflts_per_task = subflts_per_task
+        self.journal_file = journal_file
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
 
         self.tasks = []
         self.output_files = []
 
+        # root of the working directories of a run with reuse_cwd
+        self._run_tmp_dir = None
+
+    def _get_tmp_dir(self):
+        if self._run_tmp_dir is not None:
+            return self._run_tmp_dir
+        return self.tmp_dir
+
     def _gen_out_file(self, file_flt, epoch):
         outf = join(self.outputs_dir,
                     'day_%04d_'%epoch + basename(file_flt) + '.out')
@@ -47,6 +94,9 @@ class ComputeGreensFunction(object):
             if_skip_on_existing_output = True,
             stdout = self.stdout,
             stderr = self.stderr,
+            tmp_dir = self._get_tmp_dir(),
+            link_mode = self.link_mode,
+            reuse_cwd = self.reuse_cwd,
             )
         cmd()
 
@@ -68,28 +118,54 @@ class ComputeGreensFunction(object):
             if_skip_on_existing_output = True,
             stdout = self.stdout,
             stderr = self.stderr,
+            tmp_dir = self._get_tmp_dir(),
+            link_mode = self.link_mode,
+            reuse_cwd = self.reuse_cwd,
             )
         cmd()
         
+    def _subflt_key(self, file_flt, epoch):
+        if epoch == 0:
+            return '_stat2gA(file_flt=%s)'%file_flt
+        return '_straina(epoch=%s, file_flt=%s)'%(epoch, file_flt)
+
+    def _run_subflts(self, files_flt, epoch):
+        for file_flt in files_flt:
+            if epoch == 0:
+                self._stat2gA(file_flt)
+            else:
+                self._straina(file_flt, epoch)
+        
     def _load_tasks(self, epoch):
         assert len(self.subflts_files)>0, "No faults files found."
+        files = []
         for f in self.subflts_files:
             output_file_name = self._gen_out_file(f,epoch)
             if not exists(output_file_name):
-                if epoch == 0:                        
-                    self.tasks.append(
-                        Task(target = self._stat2gA,
-                             kwargs = {'file_flt':f})
-                        )
-                else:
-                    self.tasks.append(
-                        Task(target = self._straina,
-                             kwargs = {'file_flt':f,
-                                       'epoch':epoch})
-                        )
+                files.append(f)
             else:
                 print('File %s exists!'%output_file_name)                    
-        self.output_files.append(output_file_name)
+            self.output_files.append(output_file_name)
+
+        K = self.subflts_per_task
+        for nth in range(0, len(files), K):
+            key = '; '.join(self._subflt_key(f, epoch) for f in files[nth:nth+K])
+            if K == 1:
+                if epoch == 0:
+                    task = Task(target = self._stat2gA,
+                                kwargs = {'file_flt':files[nth]},
+                                key = key)
+                else:
+                    task = Task(target = self._straina,
+                                kwargs = {'file_flt':files[nth],
+                                          'epoch':epoch},
+                                key = key)
+            else:
+                task = Task(target = self._run_subflts,
+                            kwargs = {'files_flt':files[nth:nth+K],
+                                      'epoch':epoch},
+                            key = key)
+            self.tasks.append(task)
 
     def load_tasks(self):
         for epoch in self.epochs:
@@ -99,9 +175,24 @@ class ComputeGreensFunction(object):
         self.load_tasks()
         dp = DPool(
             tasks = self.tasks,
-            controller_file = self.controller_file)
+            controller_file = self.controller_file,
+            journal_file = self.journal_file,
+            max_retries = self.max_retries,
+            retry_backoff = self.retry_backoff)
 
-        dp.run()
+        if self.reuse_cwd:
+            # A pool process removes its working directories when it exits,
+            # but not when it is killed. The pool has joined all of them
+            # when it returns, so what is left is removed here.
+            tmp_dir = DEFAULT_TMP_DIR if self.tmp_dir is None else self.tmp_dir
+            create_dir_if_not_exists(tmp_dir)
+            self._run_tmp_dir = mkdtemp(dir=tmp_dir)
+        try:
+            dp.run()
+        finally:
+            if self._run_tmp_dir is not None:
+                rmtree(self._run_tmp_dir, ignore_errors=True)
+                self._run_tmp_dir = None
 
     def __call__(self):
         self.run()
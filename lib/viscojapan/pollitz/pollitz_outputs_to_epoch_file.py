@@ -1,11 +1,33 @@
 from os.path import join, exists
+from multiprocessing import Pool
 
+import numpy as np
 from numpy import NaN, loadtxt, asarray, zeros
 import h5py
 
 from ..utils import delete_if_exists, as_bytes
+from ..epoch_3d_array.storage import create_data3d, write_epoch_slice
 
-__all__ = ['PollitzOutputsToEpochalData']
+__all__ = ['PollitzOutputsToEpochalData', 'read_pollitz_output']
+
+def read_pollitz_output(fn, num_sites):
+    ''' Read the e, n, u columns (the 3rd to 5th) of a STATIC1D/VISCO1D output.
+A row that is cut or has a value that is not a number raises ValueError,
+and the number of rows should be num_sites.
+'''
+    vals = loadtxt(fn, usecols=(2,3,4), ndmin=2)
+    assert vals.shape[0] == num_sites, \
+           'File %s has %d rows, but there are %d sites.'%(fn, vals.shape[0], num_sites)
+    return vals.flatten()
+
+def _read_files(args):
+    ''' Read files as columns of a block.
+'''
+    files, num_sites = args
+    block = np.empty((num_sites*3, len(files)), dtype=float)
+    for nth, fn in enumerate(files):
+        block[:,nth] = read_pollitz_output(fn, num_sites)
+    return block
 
 class PollitzOutputsToEpochalData(object):
     ''' This class reform the original outputs by STATIC1D & VISCO1D
@@ -19,6 +41,10 @@ green's function: These properties are highly recommended:
         lmax_VISCO1D : lmax used in VISCO1D
 
     etc.
+
+Storage of data3d is set by layout ('epoch', 'site' or 'both'), compression
+(None, 'gzip' or 'lzf'), storage_dtype ('float64' or 'float32') and
+error_bound (needed by float32). See epoch_3d_array.create_data3d.
 '''
     def __init__(self,
                  epochs,
@@ -30,6 +56,12 @@ green's function: These properties are highly recommended:
                  G_file_overwrite = True,
                  extra_info = None,
                  extra_info_attrs = None,
+                 num_processes = None,
+                 block_size = 50,
+                 layout = 'epoch',
+                 compression = None,
+                 storage_dtype = 'float64',
+                 error_bound = None,
                  ):
 
         # initialize the following variables!
@@ -65,6 +97,13 @@ green's function: These properties are highly recommended:
         else:
             self.extra_info_attrs = extra_info_attrs
 
+        self.num_processes = num_processes
+        self.block_size = block_size
+
+        self.layout = layout
+        self.compression = compression
+        self.storage_dtype = storage_dtype
+        self.error_bound = error_bound
         
     def _check_pollitz_outputs_existence(self):
         for day in self.epochs:
@@ -83,36 +122,54 @@ green's function: These properties are highly recommended:
 
         self.G_fid = h5py.File(self.G_file,'w')
         shape = (self.num_epochs, len(self.sites)*3, self.num_subflts)
-        self.G_fid.create_dataset(name='data3d', shape=shape, dtype='float')
-        self.G = self.G_fid['data3d']
+        self.G = create_data3d(self.G_fid, shape,
+                               name = 'data3d',
+                               layout = self.layout,
+                               compression = self.compression,
+                               dtype = self.storage_dtype,
+                               error_bound = self.error_bound)
 
     def _form_file_name(self, day, fltno):
         fn1 = 'day_%04d_flt_%04d.out'%(day,fltno)
         fn2 = join(self.pollitz_outputs_dir, fn1)
         return fn2
     
-    def _read_a_day(self, day):        
-        read_file = lambda fn : loadtxt(fn, usecols=(2,3,4)).flatten()
-
-        num_sites = len(self.sites)
-        G = zeros((num_sites*3, self.num_subflts))
-        for fltno in range(0, self.num_subflts):
-            fn = self._form_file_name(day, fltno)
-            # print("Reading file %s ..."%fn)
-            col = read_file(fn)
-            assert col.shape[0] == G.shape[0]
-            G[:,fltno] = col
-        return G
-
-    def _write_G_to_hdf5(self):    
+    def _iter_blocks(self):
         for nth, day in enumerate(self.epochs):
-            print("Read files at day = %04d ..."%day)
-            G = self._read_a_day(day)
+            for fltno1 in range(0, self.num_subflts, self.block_size):
+                fltno2 = min(fltno1 + self.block_size, self.num_subflts)
+                yield nth, day, fltno1, fltno2
+
+    def _write_blocks(self, blocks, results):
+        num_rows = len(self.sites)*3
+        G0 = zeros((num_rows, self.num_subflts))
+        G = zeros((num_rows, self.num_subflts))
+        # Blocks come in order. A day is written at once as a whole
+        # epoch slice, which is a set of whole chunks with layout 'epoch'.
+        for (nth, day, fltno1, fltno2), block in zip(blocks, results):
+            if fltno1 == 0:
+                print("Read files at day = %04d ..."%day)
+            G[:,fltno1:fltno2] = block
+            if fltno2 < self.num_subflts:
+                continue
+
             if day == 0:
-                self.G[0,:,:] = G
+                G0[...] = G
+                write_epoch_slice(self.G, 0, G)
             else:
-                G0 = self.G[0,:,:]
-                self.G[nth,:,:] = G + G0
+                write_epoch_slice(self.G, nth, G + G0)
+
+    def _write_G_to_hdf5(self):
+        num_sites = len(self.sites)
+        blocks = list(self._iter_blocks())
+        tasks = [([self._form_file_name(day, fltno) for fltno in range(fltno1, fltno2)],
+                  num_sites) for nth, day, fltno1, fltno2 in blocks]
+
+        if self.num_processes == 1:
+            self._write_blocks(blocks, map(_read_files, tasks))
+        else:
+            with Pool(processes = self.num_processes) as pool:
+                self._write_blocks(blocks, pool.imap(_read_files, tasks))
 
         self.G_fid['epochs'] = self.epochs
 
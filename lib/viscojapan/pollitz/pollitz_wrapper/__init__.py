@@ -1,3 +1,5 @@
+from .pollitz_wrapper import PollitzWrapper, WorkingDirectory, \
+     get_working_directory, link_file
 from .stat0A import stat0A
 from .stat2gA import stat2gA
 from .decay import decay
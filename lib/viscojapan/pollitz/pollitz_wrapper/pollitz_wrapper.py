@@ -1,18 +1,81 @@
-from os.path import exists,join,basename, dirname
+from os.path import exists,join,basename, dirname, realpath, abspath
 from os import makedirs
 import os
-from subprocess import Popen, check_output
-from tempfile import mkdtemp
+from subprocess import Popen, PIPE
+from tempfile import mkdtemp, gettempdir, TemporaryFile
 from shutil import copyfile, rmtree
+from multiprocessing.util import Finalize
 import warnings
 
 from ...utils import delete_if_exists, create_dir_if_not_exists
 
+# Root of temporary working directories.
+DEFAULT_TMP_DIR = os.environ.get('VISCOJAPAN_TMP_DIR', gettempdir())
+
+LINK_MODES = ('copy', 'symlink', 'hardlink')
 
 def _close_file(fid):
     if (fid is not None) and (not fid.closed):
         fid.close()
 
+def link_file(src, dst, link_mode = 'copy'):
+    ''' Deploy src as dst by copy, symbolic link or hard link.
+A hard link falls back to a symbolic link across file systems.
+'''
+    assert link_mode in LINK_MODES, 'link_mode should be one of %s.'%str(LINK_MODES)
+    delete_if_exists(dst)
+    if link_mode == 'copy':
+        copyfile(src, dst)
+    elif link_mode == 'hardlink':
+        try:
+            os.link(src, dst)
+        except OSError:
+            os.symlink(abspath(src), dst)
+    else:
+        os.symlink(abspath(src), dst)
+
+class WorkingDirectory(object):
+    ''' A temporary working directory with input files deployed once.
+Commands with the same input files run one after another in it.
+Input files should be read-only to the commands if they are linked.
+The directory is deleted when the process exits normally, but not when
+it is killed; a caller that runs it in workers that may be killed should
+give a tmp_dir of its own and remove it afterwards, as
+ComputeGreensFunction does.
+'''
+    def __init__(self, input_files, tmp_dir = None, link_mode = 'symlink'):
+        self.input_files = dict(input_files)
+        self.tmp_dir = DEFAULT_TMP_DIR if tmp_dir is None else tmp_dir
+        self.link_mode = link_mode
+
+        create_dir_if_not_exists(self.tmp_dir)
+        self.cwd = mkdtemp(dir=self.tmp_dir)
+        for f_target, f_real in self.input_files.items():
+            assert exists(f_real), "Input file %s doesn't not exist!"%f_real
+            link_file(f_real, join(self.cwd, basename(f_target)), link_mode)
+
+        # Finalizers, unlike atexit, also run when a multiprocessing
+        # worker process exits.
+        self._finalizer = Finalize(self, rmtree, args=(self.cwd,),
+                                   kwargs={'ignore_errors':True}, exitpriority=10)
+
+    def close(self):
+        self._finalizer()
+
+# working directories of this process, see get_working_directory.
+_working_directories = {}
+
+def get_working_directory(input_files, tmp_dir = None, link_mode = 'symlink'):
+    ''' Return the working directory of this process for input_files.
+It is created at the first call and reused afterwards.
+'''
+    key = (os.getpid(),
+           tuple(sorted((basename(t), realpath(f)) for t, f in input_files.items())),
+           tmp_dir, link_mode)
+    if key not in _working_directories or not exists(_working_directories[key].cwd):
+        _working_directories[key] = WorkingDirectory(input_files, tmp_dir, link_mode)
+    return _working_directories[key]
+
 class PollitzWrapper(object):
     def __init__(self,
                  input_files = {},
@@ -21,11 +84,21 @@ class PollitzWrapper(object):
                  stdout = None,
                  stderr = None,
                  cwd = None,
-                 if_keep_cwd = False
+                 if_keep_cwd = False,
+                 tmp_dir = None,
+                 link_mode = 'copy',
+                 reuse_cwd = False,
                  ):
         '''
 "input_files" and "output_files" format:
     file_target : file_real
+tmp_dir - root of the temporary working directory.
+    Default is DEFAULT_TMP_DIR.
+link_mode - 'copy', 'symlink' or 'hardlink', how input files are deployed.
+reuse_cwd - If True, the working directory of this process for the same
+    input files is used, see get_working_directory. Input files are deployed
+    only once, and the directory is kept for the next command until the
+    process exits, so if_keep_cwd is implied.
 '''
         self.input_files = input_files        
         self.output_files = output_files
@@ -37,9 +110,12 @@ class PollitzWrapper(object):
 
         # Change cwd for the command. See Popen page.
         # cwd is a temporary directory.
-        self._tmp_dir = '/home/zy/tmp/'
+        self._tmp_dir = DEFAULT_TMP_DIR if tmp_dir is None else tmp_dir
+        self.link_mode = link_mode
+        self.reuse_cwd = reuse_cwd
+        self.if_keep_cwd = if_keep_cwd or reuse_cwd
+        self._working_directory = None
         self._set_cwd(cwd)
-        self.if_keep_cwd = if_keep_cwd
         
         
         self._cmd = None
@@ -49,8 +125,12 @@ class PollitzWrapper(object):
             assert exists(f_real), "Input file %s doesn't not exist!"%f_real
 
     def _set_cwd(self, cwd):
-        '''cwd == None - means temperary directory is used.'''
-        if cwd is None:
+        '''cwd == None - means temperary directory is used.
+The shared working directory is set when the command runs.'''
+        if self.reuse_cwd:
+            assert cwd is None, 'cwd cannot be set with reuse_cwd.'
+            self.cwd = None
+        elif cwd is None:
             create_dir_if_not_exists(self._tmp_dir)
             self.cwd = mkdtemp(dir=self._tmp_dir)
         else:
@@ -58,10 +138,18 @@ class PollitzWrapper(object):
             self.cwd = cwd
         
     def _deploy_working_directory(self):
-        ''' Copy earth files to temporary working directory.
+        ''' Deploy earth files to temporary working directory.
 '''
+        if self.reuse_cwd:
+            self._working_directory = get_working_directory(
+                self.input_files, self._tmp_dir, self.link_mode)
+            self.cwd = self._working_directory.cwd
+            # outputs of the last command shouldn't be taken as ours:
+            for f_target in self.output_files:
+                delete_if_exists(join(self.cwd, f_target))
+            return
         for f_target, f_real in self.input_files.items():
-            copyfile(f_real, join(self.cwd, basename(f_target)))
+            link_file(f_real, join(self.cwd, basename(f_target)), self.link_mode)
 
     def _run_command(self, nice=False):
         assert self._cmd != None, "Assign command _cmd."
@@ -69,10 +157,10 @@ class PollitzWrapper(object):
         if nice:
             cmd = ['nice']
         cmd.append(self._cmd)
-        with self.gen_stdin() as fin:
-            fin.seek(0)
-            Popen(cmd, stdout=self.stdout, stderr=self.stderr,
-                  stdin=fin, cwd=self.cwd).wait()
+        # stdin is piped to the command, not written to a file first.
+        Popen(cmd, stdout=self.stdout, stderr=self.stderr,
+              stdin=PIPE, cwd=self.cwd,
+              universal_newlines=True).communicate(self.gen_stdin_text())
         #_close_file(self.stdout)
         #_close_file(self.stderr)
 
@@ -91,13 +179,27 @@ class PollitzWrapper(object):
                 delete_if_exists(self.cwd)
 
     def gen_stdin(self):
-        raise NotImplementedError()
+        ''' stdin as a file. Subclasses override gen_stdin or gen_stdin_text.
+'''
+        if type(self).gen_stdin_text is PollitzWrapper.gen_stdin_text:
+            raise NotImplementedError()
+        stdin = TemporaryFile('r+')
+        stdin.write(self.gen_stdin_text())
+        stdin.seek(0)
+        return stdin
+
+    def gen_stdin_text(self):
+        ''' stdin as a string.
+'''
+        if type(self).gen_stdin is PollitzWrapper.gen_stdin:
+            raise NotImplementedError()
+        with self.gen_stdin() as fid:
+            fid.seek(0)
+            return fid.read()
 
     def stdin_to_file(self, file_name):
-        fout = open(file_name, 'wt')
-        with self.gen_stdin() as fid:
-            fout.write(fid.read())
-        fout.close()
+        with open(file_name, 'wt') as fout:
+            fout.write(self.gen_stdin_text())
 
     def run(self,nice=False):
         ''' Start to run the program.
@@ -1,5 +1,3 @@
-from tempfile import TemporaryFile
-
 from .pollitz_wrapper import PollitzWrapper
 from .utils import read_flt_file_for_stdin, read_sites_file_for_stdin
 
@@ -16,7 +14,10 @@ class stat2gA(PollitzWrapper):
                  stdout = None,
                  stderr = None,
                  cwd = None,
-                 if_keep_cwd = False
+                 if_keep_cwd = False,
+                 tmp_dir = None,
+                 link_mode = 'copy',
+                 reuse_cwd = False,
                  ):
         self.file_flt = file_flt
         self.file_sites = file_sites
@@ -30,20 +31,20 @@ class stat2gA(PollitzWrapper):
             stdout = stdout,
             stderr = stderr,
             cwd = cwd,
-            if_keep_cwd = if_keep_cwd
+            if_keep_cwd = if_keep_cwd,
+            tmp_dir = tmp_dir,
+            link_mode = link_mode,
+            reuse_cwd = reuse_cwd,
             )
 
         self._cmd = 'stat2gA'
 
-    def gen_stdin(self):
+    def gen_stdin_text(self):
         ''' Form the stdin for command strainA.
 '''
-        # temporary file:
-        stdin = TemporaryFile('r+')
-        stdin.write(read_flt_file_for_stdin(self.file_flt, 'whole'))
-        stdin.write(read_sites_file_for_stdin(self.file_sites))
-        stdin.write("out")
-        stdin.seek(0)
+        stdin = read_flt_file_for_stdin(self.file_flt, 'whole')
+        stdin += read_sites_file_for_stdin(self.file_sites)
+        stdin += "out"
         return stdin
 
 
@@ -1,5 +1,3 @@
-from tempfile import TemporaryFile
-
 from date_conversion.date_conversion import asdyr
 
 from .pollitz_wrapper import PollitzWrapper
@@ -28,7 +26,10 @@ Output file: out
                  if_skip_on_existing_output = True,
                  stdout = None,
                  stderr = None,
-                 if_keep_cwd = False
+                 if_keep_cwd = False,
+                 tmp_dir = None,
+                 link_mode = 'copy',
+                 reuse_cwd = False,
                  ):
 
         self.file_flt = file_flt
@@ -50,27 +51,26 @@ Output file: out
             if_skip_on_existing_output = if_skip_on_existing_output,
             stdout = stdout,
             stderr = stderr,
-            if_keep_cwd = if_keep_cwd
+            if_keep_cwd = if_keep_cwd,
+            tmp_dir = tmp_dir,
+            link_mode = link_mode,
+            reuse_cwd = reuse_cwd,
             )
         self._cmd = 'strainA'
 
-    def gen_stdin(self):
+    def gen_stdin_text(self):
         ''' Form the stdin for command strainA.
 '''
         t1 = asdyr(self.t_eq)
         t2 = asdyr(self.t_eq+self.days_after)
-        # temporary file:
-        stdin=TemporaryFile('r+')
-        stdin.write('Comment Line.\n')
-        stdin.write(read_flt_file_for_stdin(self.file_flt, 'head'))
-        stdin.write("%f %f %f 1.\n"%(t1,t1,t2))
-        stdin.write(read_flt_file_for_stdin(self.file_flt, 'body'))
-        sites = read_sites_file_for_stdin(self.file_sites)
-        stdin.write(sites)
-        stdin.write("0\n")
-        stdin.write("0\n")
-        stdin.write("out\n")
-        stdin.seek(0)
+        stdin = 'Comment Line.\n'
+        stdin += read_flt_file_for_stdin(self.file_flt, 'head')
+        stdin += "%f %f %f 1.\n"%(t1,t1,t2)
+        stdin += read_flt_file_for_stdin(self.file_flt, 'body')
+        stdin += read_sites_file_for_stdin(self.file_sites)
+        stdin += "0\n"
+        stdin += "0\n"
+        stdin += "out\n"
         return stdin
 
     
@@ -3,9 +3,13 @@ from os.path import join, exists
 from os import makedirs
 import shutil
 
+import numpy as np
+import h5py
+
 from .utils import overrides, get_this_script_dir
+from .epoch_3d_array import Slip
 
-__all__ = ['MyTestCase']
+__all__ = ['MyTestCase', 'gen_G_file', 'gen_slip']
 
 class MyTestCase(unittest.TestCase):
     @overrides(unittest.TestCase)
@@ -26,4 +30,23 @@ class MyTestCase(unittest.TestCase):
     def clean_outs_dir(self):
         if exists(self.outs_dir):
             shutil.rmtree(self.outs_dir)
-    
+
+def gen_G_file(fn, epochs, num_sites, num_subflts, seed=0, nlin_par=None):
+    ''' Write a random G file with sites S000, S001, ... Its nonlinear
+parameter log10(visM) is nlin_par, by default 18.8 + seed.
+'''
+    np.random.seed(seed)
+    if nlin_par is None:
+        nlin_par = 18.8 + seed
+    with h5py.File(fn, 'w') as fid:
+        fid['data3d'] = np.random.rand(len(epochs), num_sites*3, num_subflts)
+        fid['epochs'] = epochs
+        fid['sites'] = [('S%03d'%ii).encode() for ii in range(num_sites)]
+        fid['log10(visM)'] = nlin_par
+
+def gen_slip(epochs, num_dip, num_stk, seed=0):
+    ''' Random slip of a fault of num_dip x num_stk subfaults.
+'''
+    np.random.seed(seed)
+    incr = np.random.rand(len(epochs), num_dip, num_stk)
+    return Slip.init_with_incr_slip_3d(incr, epochs)
@@ -59,8 +59,41 @@ class Test_Epoch3DArray(vj.MyTestCase):
 
             #print(data)
 
-
-
+    def test_interp_epochs(self):
+        np.random.seed(0)
+        arr3d = np.random.rand(6, 4, 3)
+        epochs = [0, 10, 30, 60, 100, 200]
+        arr = vj.epoch_3d_array.Epoch3DArray(array_3d = arr3d, epochs = epochs)
+
+        ts = [0, 5, 10, 11, 30, 45.5, 199, 200, 3, 60]
+        res = arr.interp_epochs(ts)
+        self.assertEqual(res.shape, (len(ts), 4, 3))
+
+        for t, val in zip(ts, res):
+            ref = np.asarray([np.interp(t, epochs, arr3d[:,ii,jj])
+                              for ii in range(4) for jj in range(3)]).reshape([4,3])
+            np.testing.assert_allclose(val, ref, rtol=1e-12)
+            np.testing.assert_allclose(arr.get_data_at_epoch(t), ref, rtol=1e-12)
+
+        # exact epochs return the data without blending
+        np.testing.assert_array_equal(arr.interp_epochs(epochs), arr3d)
+
+        with self.assertRaises(AssertionError):
+            arr.interp_epochs([201])
+
+    def test_interp_epochs_hdf5(self):
+        np.random.seed(0)
+        arr3d = np.random.rand(6, 4, 3)
+        epochs = [0, 10, 30, 60, 100, 200]
+        fn = join(self.outs_dir, 'interp.h5')
+        vj.epoch_3d_array.Epoch3DArray(array_3d = arr3d, epochs = epochs).save(fn)
+
+        ts = [100, 5, 45.5, 100]
+        with h5py.File(fn,'r') as fid:
+            arr = vj.epoch_3d_array.Epoch3DArray.load(fid, False)
+            res = arr.interp_epochs(ts)
+        ref = vj.epoch_3d_array.Epoch3DArray(array_3d = arr3d, epochs = epochs).interp_epochs(ts)
+        np.testing.assert_array_equal(res, ref)
 
 
 
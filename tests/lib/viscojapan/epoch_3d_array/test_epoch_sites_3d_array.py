@@ -37,6 +37,25 @@ class Test_EpochSites3DArray(vj.MyTestCase):
 
             print(out.shape)
 
+    def test_get_indices(self):
+        sites = ['S%02d'%ii for ii in range(10)]
+        arr = vj.epoch_3d_array.EpochSites3DArray(
+            array_3d = np.random.rand(3, 10, 3),
+            epochs = [0, 1, 2],
+            sites = sites,
+            mask_sites = ['S07', 'S02', 'S05'])
+
+        np.testing.assert_array_equal(arr.get_indices(['S05', 'S00', 'S05']), [5, 0, 5])
+        np.testing.assert_array_equal(arr.get_mask(), [7, 2, 5])
+        self.assertEqual(arr.get_index_in_sites('S09'), 9)
+        self.assertEqual(arr.get_index_in_mask_sites('S05'), 2)
+        np.testing.assert_array_equal(arr.get_indices_in_mask_sites(['S02', 'S07']), [1, 0])
+
+        with self.assertRaises(AssertionError):
+            arr.get_indices(['S10'])
+        with self.assertRaises(AssertionError):
+            arr.set_mask_sites(['S10'])
+
 
 
 if __name__ == '__main__':
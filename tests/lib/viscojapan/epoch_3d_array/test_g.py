@@ -36,11 +36,13 @@ class Test_G(vj.MyTestCase):
 
             print(arr.get_array_3d())
 
-
-
-
-
-
+    def test_get_mask(self):
+        sites = ['S%02d'%ii for ii in range(4)]
+        G = vj.epoch_3d_array.G(g_3d = np.random.rand(2, 12, 5),
+                                epochs = [0, 1],
+                                sites = sites,
+                                mask_sites = ['S03', 'S01'])
+        np.testing.assert_array_equal(G.get_mask(), [9, 10, 11, 3, 4, 5])
 
 if __name__ == '__main__':
     unittest.main()
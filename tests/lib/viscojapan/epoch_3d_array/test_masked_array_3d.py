@@ -0,0 +1,81 @@
+from os.path import join
+import unittest
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+from viscojapan.epoch_3d_array import MaskedArray3D, mask_array_3d
+
+class CountReads(object):
+    def __init__(self, dset):
+        self.dset = dset
+        self.shape = dset.shape
+        self.dtype = dset.dtype
+        self.num_reads = 0
+
+    def __getitem__(self, key):
+        self.num_reads += 1
+        return self.dset[key]
+
+class Test_MaskedArray3D(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.arr3d = np.random.rand(5, 20, 4)
+        self.fn = join(self.outs_dir, 'arr.h5')
+        with h5py.File(self.fn, 'w') as fid:
+            fid['data3d'] = self.arr3d
+            fid['epochs'] = [0, 10, 20, 30, 40]
+            fid['sites'] = [('S%02d'%ii).encode() for ii in range(20)]
+
+    def test_indexing(self):
+        mask = [3, 4, 5, 9, 1, 2, 15, 4]
+        ref = self.arr3d[:, mask, :]
+        with h5py.File(self.fn, 'r') as fid:
+            view = MaskedArray3D(fid['data3d'], mask)
+            self.assertEqual(view.shape, ref.shape)
+
+            np.testing.assert_array_equal(view[...], ref)
+            np.testing.assert_array_equal(view[2], ref[2])
+            np.testing.assert_array_equal(view[2,:,:], ref[2,:,:])
+            np.testing.assert_array_equal(view[:,3,1], ref[:,3,1])
+            np.testing.assert_array_equal(view[[4,0,4]], ref[[4,0,4]])
+            np.testing.assert_array_equal(view[1:4, 2:6, ::2], ref[1:4, 2:6, ::2])
+            np.testing.assert_array_equal(view[-1, ..., 3], ref[-1, ..., 3])
+
+            np.testing.assert_array_equal(view - ref[0], ref - ref[0])
+            np.testing.assert_array_equal(np.diff(view, axis=0), np.diff(ref, axis=0))
+
+    def test_runs_are_coalesced(self):
+        with h5py.File(self.fn, 'r') as fid:
+            dset = CountReads(fid['data3d'])
+            view = MaskedArray3D(dset, [7, 2, 3, 4, 8, 12, 13])
+            self.assertEqual(dset.num_reads, 0)
+            view[1]
+            # runs: 2-4, 7-8, 12-13
+            self.assertEqual(dset.num_reads, 3)
+
+    def test_in_memory(self):
+        out = mask_array_3d(self.arr3d, [3, 4, 5])
+        self.assertIs(out.base, self.arr3d)
+        np.testing.assert_array_equal(out, self.arr3d[:, 3:6, :])
+
+        out = mask_array_3d(self.arr3d, [5, 3])
+        np.testing.assert_array_equal(out, self.arr3d[:, [5, 3], :])
+
+    def test_epoch_sites_3d_array(self):
+        mask_sites = ['S07', 'S02', 'S03']
+        with h5py.File(self.fn, 'r') as fid:
+            arr = vj.epoch_3d_array.EpochSites3DArray.load(
+                fid, mask_sites = mask_sites, memory_mode = False)
+            self.assertIsInstance(arr.get_array_3d_lazy(), MaskedArray3D)
+            self.assertIsInstance(arr.get_array_3d(), np.ndarray)
+            np.testing.assert_array_equal(arr.get_array_3d(), self.arr3d[:, [7,2,3], :])
+            np.testing.assert_allclose(arr.get_data_at_epoch(15),
+                                       0.5*(self.arr3d[1] + self.arr3d[2])[[7,2,3]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+from os.path import join
+import unittest
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+
+class Test_SlabCache(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+    def test_lru(self):
+        cache = vj.epoch_3d_array.SlabCache(max_bytes = 2*8*10)
+        token = cache.register('file', ['J550'])
+
+        for ii in range(3):
+            cache.get((token, ii), lambda: np.ones(10))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.misses, 3)
+
+        # epoch 0 was evicted, 2 is still there.
+        cache.get((token, 2), lambda: np.ones(10))
+        self.assertEqual(cache.hits, 1)
+        cache.get((token, 0), lambda: np.ones(10))
+        self.assertEqual(cache.misses, 4)
+
+    def test_too_large_slab_is_not_cached(self):
+        cache = vj.epoch_3d_array.SlabCache(max_bytes = 10)
+        cache.get(('file', 0), lambda: np.ones(10))
+        self.assertEqual(len(cache), 0)
+
+    def test_register(self):
+        cache = vj.epoch_3d_array.SlabCache()
+        t1 = cache.register('file', ['J550', 'J551'])
+        t2 = cache.register('file', ['J551', 'J550'])
+        t3 = cache.register('file', ['J550', 'J551'])
+        self.assertNotEqual(t1, t2)
+        self.assertEqual(t1, t3)
+
+    def test_register_is_bounded(self):
+        cache = vj.epoch_3d_array.SlabCache(max_tokens = 2)
+        t1 = cache.register('file1', [])
+        cache.get((t1, 0), lambda: np.ones(10))
+        t2 = cache.register('file2', [])
+        t3 = cache.register('file3', [])
+        self.assertEqual(len(cache._tokens), 2)
+        # slabs of a dropped token are dropped too
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+        # it is issued anew, never as a token in use
+        t4 = cache.register('file1', [])
+        self.assertEqual(len(set([t1, t2, t3, t4])), 4)
+
+    def test_slabs_are_read_only(self):
+        cache = vj.epoch_3d_array.SlabCache(max_bytes = 8*10)
+        for slab in (cache.get(('file', 0), lambda: np.ones(10)),
+                     cache.get(('file', 0), lambda: np.ones(10)),
+                     cache.get(('file', 1), lambda: np.ones(20))):
+            with self.assertRaises(ValueError):
+                slab[0] = 2.
+
+class Test_GWithSlabCache(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+        self.file_G = join(self.outs_dir, 'G_slab_cache.h5')
+        with h5py.File(self.file_G, 'w') as fid:
+            fid['data3d'] = np.random.rand(5, 3*3, 2)
+            fid['epochs'] = [0, 10, 20, 30, 40]
+            fid['sites'] = [b'S001', b'S002', b'S003']
+
+    def test_stack(self):
+        cache = vj.epoch_3d_array.SlabCache()
+        G = vj.inv.ep.EpochG(self.file_G, use_slab_cache=False)
+        stacked = G.stack([0, 10, 20, 25])
+
+        G.enable_slab_cache(self.file_G, cache)
+        np.testing.assert_array_equal(G.stack([0, 10, 20, 25]), stacked)
+        stats = G.get_slab_cache_stats()
+        # 10 pairs plus one call for the shape; lags: 0,10,20,25,15,5
+        self.assertEqual(stats['misses'], 6)
+        self.assertEqual(stats['hits'], 5)
+
+    def test_mask_sites(self):
+        cache = vj.epoch_3d_array.SlabCache()
+        G1 = vj.inv.ep.EpochG(self.file_G, mask_sites=['S001'], use_slab_cache=False)
+        G1.enable_slab_cache(self.file_G, cache)
+        G2 = vj.inv.ep.EpochG(self.file_G, mask_sites=['S002'], use_slab_cache=False)
+        G2.enable_slab_cache(self.file_G, cache)
+
+        self.assertFalse(np.array_equal(G1[10], G2[10]))
+        self.assertEqual(cache.misses, 2)
+
+if __name__ == '__main__':
+    unittest.main()
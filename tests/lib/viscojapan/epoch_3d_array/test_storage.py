@@ -0,0 +1,82 @@
+from os.path import join
+import unittest
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+from viscojapan.epoch_3d_array import get_chunks, create_data3d, \
+     write_epoch_slice, read_array_3d
+
+class Test_Storage(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.arr3d = np.random.rand(6, 30, 8)
+
+    def test_get_chunks(self):
+        shape = (20, 3000, 500)
+        self.assertEqual(get_chunks(shape, 'epoch'), (1, 261, 500))
+        self.assertEqual(get_chunks(shape, 'site'), (20, 12, 500))
+        self.assertEqual(get_chunks(shape, 'both'), (4, 63, 500))
+
+        # chunks are never larger than the array:
+        self.assertEqual(get_chunks((2, 6, 4), 'both'), (2, 6, 4))
+
+    def test_round_trip(self):
+        for compression in None, 'gzip', 'lzf':
+            for layout in 'epoch', 'site', 'both':
+                fn = join(self.outs_dir, 'arr_%s_%s.h5'%(layout, compression))
+                with h5py.File(fn, 'w') as fid:
+                    dset = create_data3d(fid, self.arr3d.shape,
+                                         layout = layout,
+                                         compression = compression)
+                    for nth in range(self.arr3d.shape[0]):
+                        write_epoch_slice(dset, nth, self.arr3d[nth])
+
+                with h5py.File(fn, 'r') as fid:
+                    dset = fid['data3d']
+                    self.assertEqual(dset.attrs['layout'], layout)
+                    self.assertEqual(dset.compression, compression)
+                    self.assertEqual(dset.shuffle, compression is not None)
+                    np.testing.assert_array_equal(read_array_3d(fid, memory_mode=True),
+                                                  self.arr3d)
+
+    def test_float32(self):
+        fn = join(self.outs_dir, 'arr_float32.h5')
+        with h5py.File(fn, 'w') as fid:
+            with self.assertRaises(AssertionError):
+                create_data3d(fid, self.arr3d.shape, dtype='float32')
+
+            dset = create_data3d(fid, self.arr3d.shape, dtype='float32',
+                                 compression='gzip', error_bound=1e-6)
+            for nth in range(self.arr3d.shape[0]):
+                write_epoch_slice(dset, nth, self.arr3d[nth])
+            with self.assertRaises(AssertionError):
+                write_epoch_slice(dset, 0, self.arr3d[0]*1e6)
+
+        with h5py.File(fn, 'r') as fid:
+            self.assertEqual(fid['data3d'].dtype, np.float32)
+            self.assertLessEqual(fid['data3d'].attrs['max_error'], 1e-6)
+            arr = read_array_3d(fid, memory_mode=True)
+            self.assertEqual(arr.dtype, np.float64)
+            np.testing.assert_allclose(arr, self.arr3d, atol=1e-6)
+
+    def test_epoch_3d_array(self):
+        epochs = [0, 10, 20, 30, 40, 50]
+        arr = vj.epoch_3d_array.Epoch3DArray(self.arr3d, epochs)
+        fn = join(self.outs_dir, 'epoch_3d_array.h5')
+        arr.save(fn, layout='site', compression='lzf')
+
+        with h5py.File(fn, 'r') as fid:
+            self.assertEqual(fid['data3d'].chunks[0], 6)
+            for memory_mode in False, True:
+                arr1 = vj.epoch_3d_array.Epoch3DArray.load(fid, memory_mode=memory_mode)
+                np.testing.assert_array_equal(arr1.get_data_at_epoch(20), self.arr3d[2])
+                np.testing.assert_allclose(arr1.get_data_at_epoch(25),
+                                           0.5*(self.arr3d[2] + self.arr3d[3]))
+
+if __name__ == '__main__':
+    unittest.main()
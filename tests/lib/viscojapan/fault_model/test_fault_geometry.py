@@ -0,0 +1,73 @@
+import unittest
+from os.path import join
+import os
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+from viscojapan.fault_model import FaultFileReader, \
+     load_fault_geometry, clear_fault_geometry_cache
+from viscojapan.test_utils import MyTestCase
+
+def gen_fault_file(fn, num_stk, num_dip, subflt_sz=20.):
+    with h5py.File(fn, 'w') as fid:
+        fid['num_subflt_along_strike'] = num_stk
+        fid['num_subflt_along_dip'] = num_dip
+        fid['subflt_sz_strike'] = subflt_sz
+        fid['subflt_sz_dip'] = 1.5*subflt_sz
+        fid['x_f'] = np.arange(num_stk+1)*subflt_sz
+        fid['y_f'] = np.arange(num_dip+1)*1.5*subflt_sz
+        fid['meshes/ddeps'] = np.random.rand(num_dip+1, num_stk+1)
+
+class Test_FaultGeometry(MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+        clear_fault_geometry_cache()
+        self.fault_file = join(self.outs_dir, 'fault.h5')
+        gen_fault_file(self.fault_file, 5, 4)
+
+    def test_reader(self):
+        with FaultFileReader(self.fault_file) as reader:
+            self.assertEqual(reader.num_subflt_along_strike, 5)
+            self.assertEqual(reader.num_subflt_along_dip, 4)
+            self.assertEqual(reader.subflt_sz_dip, 30.)
+            np.testing.assert_array_equal(reader.x_f, np.arange(6)*20.)
+            # copies, which can be changed:
+            x_f = reader.x_f
+            x_f[0] = -1.
+            self.assertEqual(reader.x_f[0], 0.)
+            with self.assertRaises(AssertionError):
+                reader.depth_top
+
+    def test_immutable(self):
+        fault = load_fault_geometry(self.fault_file)
+        self.assertEqual(fault.num_subflts, 20)
+        with self.assertRaises(AttributeError):
+            fault.num_subflt_along_dip = 3
+        with self.assertRaises(ValueError):
+            fault.x_f[0] = 1.
+        self.assertIsNone(fault.LLons)
+
+    def test_cache(self):
+        fault = load_fault_geometry(self.fault_file)
+        self.assertIs(load_fault_geometry(self.fault_file), fault)
+        self.assertIs(FaultFileReader(self.fault_file).geometry, fault)
+
+        vj.inv.reg.Roughening.create_from_fault_file(self.fault_file)
+        vj.inv.reg.TemporalRegularization.create_from_fault_file(
+            self.fault_file, [0, 10, 100])
+        self.assertIs(load_fault_geometry(self.fault_file), fault)
+
+        # A rewritten file is read again:
+        gen_fault_file(self.fault_file, 6, 4)
+        st = os.stat(self.fault_file)
+        os.utime(self.fault_file, (st.st_atime, st.st_mtime + 10.))
+        fault2 = load_fault_geometry(self.fault_file)
+        self.assertIsNot(fault2, fault)
+        self.assertEqual(fault2.num_subflt_along_strike, 6)
+        self.assertEqual(fault.num_subflt_along_strike, 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,12 @@ import unittest
 from os.path import join
 
 from numpy import arange, asarray
+import numpy as np
+import scipy.sparse as sparse
 
 import viscojapan as vj
 #from viscojapan.basis_function.basis_matrix import BasisMatrix
+from viscojapan.inversion.basis_function.cubic_b_splines import CubicBSplines
 from viscojapan.plots import MapPlotFault, plt
 from viscojapan.test_utils import MyTestCase
 
@@ -56,6 +59,38 @@ class Test_BasisMatrix(MyTestCase):
 
         self.plot_slip(asarray(basis_mat.todense())[:,40],
                        'test_gen_basis_matrix_sparse.png')
+
+
+    def test_b_spline(self):
+        spl = CubicBSplines(ds = 25.)
+        s = np.linspace(-120., 120., 1001)
+        ref = [spl._b_spline_scalar(si - 50.) for si in s]
+        np.testing.assert_allclose(spl.b_spline(s), ref, atol=1e-15)
+
+        # sections of varying lengths:
+        sj = np.cumsum(np.hstack([[0.], np.random.rand(20)*30. + 10.]))
+        ref = np.asarray([spl.b_spline_over_sections(sj, j)[1] for j in range(20)]).T
+        np.testing.assert_array_equal(spl.basis_over_sections(sj).toarray(), ref)
+
+    def test_gen_basis_matrix_against_slip_mesh(self):
+        xf = arange(0,701, 25)
+        yf = arange(0,301, 25)
+        bm = vj.inv.basis.BasisMatrixBSpline(
+            dx_spline = 25.,
+            xf = xf,
+            dy_spline = 25.,
+            yf = yf,
+            num_epochs = 2,
+            )
+        ref = []
+        for nth in range(len(yf) - 1):
+            for mth in range(len(xf) - 1):
+                ref.append(bm.gen_slip_mesh(mth, nth).reshape([-1,1]))
+        ref = sparse.block_diag([sparse.csr_matrix(np.hstack(ref))]*2)
+
+        basis_mat = bm.gen_basis_matrix_sparse()
+        self.assertEqual(basis_mat.nnz, ref.nnz)
+        np.testing.assert_array_equal(basis_mat.toarray(), ref.toarray())
         
 
 if __name__=='__main__':
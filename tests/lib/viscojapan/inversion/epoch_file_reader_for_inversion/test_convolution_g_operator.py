@@ -0,0 +1,73 @@
+import unittest
+from os.path import join
+
+import numpy as np
+import scipy.sparse as sps
+import h5py
+
+import viscojapan as vj
+from viscojapan.test_utils import gen_G_file
+from viscojapan.inversion.inversion_parameters_set import InversionParametersSet
+
+class Test_ConvolutionGOperator(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        self.file_G = join(self.outs_dir, 'G_conv_op.h5')
+        gen_G_file(self.file_G, epochs=list(range(0,1201,60)),
+                   num_sites=5, num_subflts=4)
+
+    def check_against_stack(self, G, epochs):
+        G_stacked = G.stack(epochs)
+        G_op = vj.inv.ep.ConvolutionGOperator(G, epochs)
+
+        self.assertEqual(G_op.shape, G_stacked.shape)
+        np.testing.assert_allclose(G_op.todense(), G_stacked)
+
+        m = np.random.rand(G_op.shape[1], 1)
+        np.testing.assert_allclose(G_op.dot(m), np.dot(G_stacked, m))
+
+        r = np.random.rand(G_op.shape[0], 2)
+        np.testing.assert_allclose(G_op.T.dot(r), np.dot(G_stacked.T, r))
+        return G_op
+
+    def test_evenly_spaced_epochs(self):
+        G = vj.inv.ep.EpochG(self.file_G)
+        epochs = [0, 60, 120, 180, 240]
+        G_op = self.check_against_stack(G, epochs)
+        self.assertEqual(G_op.get_num_lags(), len(epochs))
+
+    def test_unevenly_spaced_epochs(self):
+        G = vj.inv.ep.EpochG(self.file_G, mask_sites=['S003','S001'])
+        self.check_against_stack(G, [0, 1, 13, 100, 500, 1200])
+
+    def test_differential_G(self):
+        file_G2 = join(self.outs_dir, 'G_conv_op2.h5')
+        gen_G_file(file_G2, epochs=list(range(0,1201,60)),
+                   num_sites=5, num_subflts=4, seed=1)
+        dG = vj.inv.ep.DifferentialG(ed1=vj.inv.ep.EpochG(self.file_G),
+                                     ed2=vj.inv.ep.EpochG(file_G2),
+                                     wrt='log10(visM)')
+        self.check_against_stack(dG, [0, 60, 300, 310])
+
+    def test_inversion_parameters_set(self):
+        G = vj.inv.ep.EpochG(self.file_G)
+        epochs = [0, 60, 120]
+        G_op = vj.inv.ep.ConvolutionGOperator(G, epochs)
+        G_stacked = G_op.todense()
+
+        d = np.random.rand(G_op.shape[0], 1)
+        W = sps.diags(np.random.rand(G_op.shape[0]), offsets=0)
+        B = sps.eye(G_op.shape[1]).tocsr()
+        L = sps.eye(G_op.shape[1]).tocsr()
+
+        P1, q1 = InversionParametersSet(G=G_op, d=d, W=W, B=B, L=L).gen_inputs_for_cvxopt_qp()
+        P2, q2 = InversionParametersSet(G=G_stacked, d=d, W=W, B=B, L=L).gen_inputs_for_cvxopt_qp()
+
+        np.testing.assert_allclose(P1, P2)
+        np.testing.assert_allclose(q1, q2)
+
+
+if __name__== '__main__':
+    unittest.main()
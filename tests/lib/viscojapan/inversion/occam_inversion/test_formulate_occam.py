@@ -0,0 +1,121 @@
+import unittest
+from os.path import join
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+from viscojapan.test_utils import gen_G_file
+from viscojapan.inversion.occam_deconvolution.formulate_occam import \
+     JacobianVec, Jacobian, JacobianOperator, D_
+
+class CountingDifferentialG(vj.inv.ep.DifferentialG):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_reads = 0
+
+    def get_data_at_epoch(self, day):
+        self.num_reads += 1
+        return super().get_data_at_epoch(day)
+
+class Test_FormulateOccam(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        G_epochs = list(range(0,1201,60))
+        self.file_G0 = join(self.outs_dir, 'G0.h5')
+        gen_G_file(self.file_G0, G_epochs, num_sites=5, num_subflts=6, seed=0)
+        self.file_G1 = join(self.outs_dir, 'G1.h5')
+        gen_G_file(self.file_G1, G_epochs, num_sites=5, num_subflts=6, seed=1)
+
+        np.random.seed(2)
+        slip_epochs = [0, 100, 600, 1200]
+        cumu_slip = np.cumsum(np.random.rand(len(slip_epochs), 2, 3), axis=0)
+        self.slip0 = vj.inv.ep.EpochSlip(cumu_slip_3d = cumu_slip,
+                                         epochs = slip_epochs)
+        self.epochs = [0, 60, 300, 310, 1200]
+
+    def new_dG(self, cls = CountingDifferentialG):
+        return cls(ed1 = vj.inv.ep.EpochG(self.file_G0),
+                   ed2 = vj.inv.ep.EpochG(self.file_G1),
+                   wrt = 'log10(visM)')
+
+    def test_dot_stacked(self):
+        m = np.random.rand(6*len(self.epochs), 2)
+        for cls in (vj.inv.ep.DifferentialG, vj.inv.ep.DifferentialGNoRaslip):
+            dG = self.new_dG(cls)
+            np.testing.assert_allclose(dG.dot_stacked(self.epochs, m),
+                                       np.dot(dG.stack(self.epochs), m),
+                                       err_msg = cls.__name__)
+
+    def test_jacobian_vec(self):
+        dG = self.new_dG()
+        J = JacobianVec(dG, self.slip0)
+        jac = J(self.epochs)
+        m = self.slip0.respace(self.epochs).stack()
+        np.testing.assert_allclose(jac, np.dot(dG.stack(self.epochs), m))
+
+        # cached per epochs:
+        num_reads = dG.num_reads
+        self.assertIs(J(list(self.epochs)), jac)
+        self.assertEqual(dG.num_reads, num_reads)
+        self.assertFalse(jac.flags.writeable)
+
+        # and per slip0:
+        J.slip0 = vj.inv.ep.EpochSlip(
+            cumu_slip_3d = 2.*self.slip0.get_cumu_slip_3d(),
+            epochs = self.slip0.get_epochs())
+        np.testing.assert_allclose(J(self.epochs), 2.*jac)
+
+        # and per dG:
+        jac = J(self.epochs)
+        J.dG = self.new_dG(vj.inv.ep.DifferentialGNoRaslip)
+        m = J.slip0.respace(self.epochs).stack()
+        np.testing.assert_allclose(J(self.epochs),
+                                   np.dot(J.dG.stack(self.epochs), m))
+        self.assertIsNot(J(self.epochs), jac)
+
+    def assert_new(self, jacobian, jac):
+        new = jacobian()
+        self.assertIsNot(new, jac)
+        self.assertIs(jacobian(), new)
+        return new
+
+    def test_jacobian_reused_by_D_(self):
+        dG = self.new_dG()
+        Js = [JacobianVec(dG, self.slip0)]
+
+        for use_op in (False, True):
+            jacobian = Jacobian()
+            jacobian.G = vj.inv.ep.EpochG(self.file_G0)
+            jacobian.jacobian_vecs = Js
+            jacobian.epochs = self.epochs
+            jacobian.use_convolution_operator = use_op
+            jac = jacobian()
+            self.assertIs(jacobian(), jac)
+            # the same objects assigned again
+            jacobian.G = jacobian.G
+            jacobian.jacobian_vecs = list(Js)
+            self.assertIs(jacobian(), jac)
+            if use_op:
+                self.assertIsInstance(jac, JacobianOperator)
+
+            # another G, or a Jacobian vector of a new slip0
+            jacobian.G = vj.inv.ep.EpochG(self.file_G0)
+            jac = self.assert_new(jacobian, jac)
+            Js[0].slip0 = Js[0].slip0
+            jac = self.assert_new(jacobian, jac)
+
+        num_reads = dG.num_reads
+        d_ = D_()
+        d_.jacobian_vecs = Js
+        d_.nlin_par_values = [0.5]
+        d_.epochs = self.epochs
+        disp_obs = np.random.rand(len(self.epochs)*15, 1)
+        res = d_.linearize(disp_obs)
+        self.assertEqual(dG.num_reads, num_reads)
+        np.testing.assert_allclose(res, disp_obs + 0.5*Js[0](self.epochs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+from os.path import join
+
+import numpy as np
+import scipy.sparse as sps
+import h5py
+
+import viscojapan as vj
+from viscojapan.epoch_3d_array import Displacement
+from viscojapan.inversion.regularization.regularization import Leaf
+
+class MatrixReg(Leaf):
+    def __init__(self, L):
+        self.L = L
+
+    def generate_regularization_matrix(self):
+        return self.L
+
+class Test_OccamDriver(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.sites = ['S%03d'%ii for ii in range(6)]
+        self.epochs = [0, 60, 300]
+        self.num_subflts = 6
+        G_epochs = list(range(0,1201,60))
+        num_obs = len(self.sites)*3
+
+        # G is linear in rake, so the Occam iterations can fit exactly.
+        decay = np.exp(-np.asarray(G_epochs, float)/300.).reshape([-1,1,1])
+        Ga = np.random.rand(1, num_obs, self.num_subflts) * (2. - decay)
+        Gb = 0.3*np.random.rand(1, num_obs, self.num_subflts) * (2. - decay)
+        self.rake0 = 80.
+        self.rake_true = 86.
+        self.files_G = []
+        # Files are named after the test, since EpochG keeps them open.
+        prefix = join(self.outs_dir, self._testMethodName)
+        for name, rake in [('G0.h5', self.rake0), ('G1.h5', 90.), ('G_true.h5', self.rake_true)]:
+            fn = prefix + '_' + name
+            with h5py.File(fn, 'w') as fid:
+                fid['data3d'] = Ga + Gb*(rake - self.rake0)/10.
+                fid['epochs'] = G_epochs
+                fid['sites'] = [site.encode() for site in self.sites]
+                fid['rake'] = rake
+            self.files_G.append(fn)
+
+        incr_slip = np.random.rand(len(self.epochs), 2, 3) + 0.5
+        self.slip_true = vj.inv.ep.EpochSlip.init_with_incr_slip_3d(incr_slip, self.epochs)
+        self.file_slip0 = prefix + '_slip0.h5'
+        vj.inv.ep.EpochSlip.init_with_incr_slip_3d(0.7*incr_slip, self.epochs).save(self.file_slip0)
+
+        G_true = vj.inv.ep.EpochG(self.files_G[2])
+        d = G_true.dot_stacked(self.epochs, self.slip_true.stack())
+        self.file_d = prefix + '_d.h5'
+        Displacement(cumu_disp_3d = d.reshape([len(self.epochs), -1, 3]),
+                     epochs = self.epochs, sites = self.sites).save(self.file_d)
+        self.file_sd = prefix + '_sd.h5'
+        Displacement(cumu_disp_3d = np.ones([len(self.epochs), len(self.sites), 3]),
+                     epochs = self.epochs, sites = self.sites).save(self.file_sd)
+
+    def new_inversion(self):
+        num_pars = self.num_subflts*len(self.epochs)
+        inv = vj.inv.OccamDeconvolution(
+            file_G0 = self.files_G[0],
+            files_Gs = [self.files_G[1]],
+            nlin_par_names = ['rake'],
+            file_d = self.file_d,
+            file_sd = self.file_sd,
+            file_slip0 = self.file_slip0,
+            sites = self.sites,
+            epochs = self.epochs,
+            regularization = MatrixReg(1e-6*sps.eye(num_pars).tocsr()),
+            basis = lambda : sps.eye(num_pars).tocsr(),
+            decreasing_slip_rate = False,
+            )
+        inv.qp_solver = 'projected_gradient'
+        return inv
+
+    def test_linearized_G(self):
+        inv = self.new_inversion()
+        G = vj.inv.ep.LinearizedG(inv.G0, inv.dGs, [self.rake_true])
+        G_true = vj.inv.ep.EpochG(self.files_G[2])
+        np.testing.assert_allclose(G.stack(self.epochs), G_true.stack(self.epochs))
+
+    def test_converge(self):
+        fn = join(self.outs_dir, 'occam.h5')
+        driver = vj.inv.OccamDriver(self.new_inversion(), max_iterations = 20, tol = 1e-5)
+        self.assertTrue(driver.run(fn, overwrite = True))
+
+        inv = driver.inv
+        self.assertAlmostEqual(inv.get_nlin_par_values()[0], self.rake_true, places=2)
+        np.testing.assert_allclose(inv.get_slip().stack(), self.slip_true.stack(),
+                                   rtol=1e-2)
+
+        with h5py.File(fn, 'r') as fid:
+            n = driver.num_iterations
+            self.assertTrue(np.all(fid['solved'][:n]))
+            self.assertFalse(np.any(fid['solved'][n:]))
+            self.assertTrue(fid['converged'][...])
+            self.assertEqual(fid['linearization/nlin_pars'][0,0], self.rake0)
+            # each iteration is linearized about the previous one:
+            np.testing.assert_allclose(fid['linearization/nlin_pars'][1:n,0],
+                                       fid['nlin_pars'][0:n-1,0])
+            self.assertLess(fid['step_norm'][n-1], fid['step_norm'][0])
+            self.assertLessEqual(fid['nlin_step'][n-1], driver.nlin_par_tol)
+
+    def test_nlin_par_tol(self):
+        # Bm alone would stop at once, the rake is still moving.
+        fn = join(self.outs_dir, 'occam_nlin_tol.h5')
+        driver = vj.inv.OccamDriver(self.new_inversion(), max_iterations = 20,
+                                    tol = np.inf, nlin_par_tol = 1e-6)
+        self.assertTrue(driver.run(fn, overwrite = True))
+        self.assertGreater(driver.num_iterations, 1)
+        self.assertGreater(driver.nlin_steps[0], 1e-6)
+        self.assertLessEqual(driver.nlin_steps[-1], 1e-6)
+        self.assertAlmostEqual(driver.inv.get_nlin_par_values()[0], self.rake_true, places=2)
+
+    def test_resume(self):
+        fn = join(self.outs_dir, 'occam_resume.h5')
+        driver = vj.inv.OccamDriver(self.new_inversion(), max_iterations = 2, tol = 1e-5)
+        self.assertFalse(driver.run(fn, overwrite = True))
+        with h5py.File(fn, 'r') as fid:
+            nlin_pars = fid['nlin_pars'][...]
+
+        driver = vj.inv.OccamDriver(self.new_inversion(), max_iterations = 20, tol = 1e-5)
+        self.assertTrue(driver.run(fn))
+        with h5py.File(fn, 'r') as fid:
+            np.testing.assert_array_equal(fid['nlin_pars'][0:2], nlin_pars)
+            self.assertEqual(fid['linearization/nlin_pars'][2,0], nlin_pars[1,0])
+        self.assertGreater(driver.num_iterations, 2)
+        self.assertAlmostEqual(driver.inv.get_nlin_par_values()[0], self.rake_true, places=2)
+
+if __name__ == '__main__':
+    unittest.main()
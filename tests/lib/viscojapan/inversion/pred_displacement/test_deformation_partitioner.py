@@ -3,7 +3,11 @@ __author__ = 'zy'
 import unittest
 from os.path import join
 
+import numpy as np
+import h5py
+
 import viscojapan as vj
+from viscojapan.test_utils import gen_G_file, gen_slip
 
 class Test_DeformPartitioner(vj.MyTestCase):
     def setUp(self):
@@ -48,6 +52,131 @@ class Test_DeformPartitioner(vj.MyTestCase):
 
 
 
+class Test_DeformPartitionerRaslip(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        G_epochs = list(range(0, 601, 60))
+        self.file_G0 = join(self.outs_dir, 'G0.h5')
+        gen_G_file(self.file_G0, G_epochs, 4, 6, nlin_par=18.8, seed=0)
+        self.file_G1 = join(self.outs_dir, 'G1.h5')
+        gen_G_file(self.file_G1, G_epochs, 4, 6, nlin_par=19., seed=1)
+
+        self.epochs = [0, 30, 60, 200, 600]
+        self.file_slip0 = join(self.outs_dir, 'slip0.h5')
+        gen_slip(self.epochs, 2, 3, seed=2).save(self.file_slip0)
+
+    def new_partitioner(self):
+        return vj.inv.DeformPartitioner(
+            file_G0 = self.file_G0,
+            epochs = self.epochs,
+            slip = gen_slip(self.epochs, 2, 3, seed=3),
+            files_Gs = [self.file_G1],
+            nlin_pars = [18.9],
+            nlin_par_names = ['log10(visM)'],
+            file_slip0 = self.file_slip0
+            )
+
+    def test_R_aslip_3d(self):
+        pred = self.new_partitioner()
+        Raslip = pred.R_aslip_3d()
+        for nth in range(len(self.epochs)):
+            np.testing.assert_allclose(Raslip[nth,:],
+                                       pred.R_aslip_at_nth_epoch(nth).flatten(),
+                                       atol=1e-12)
+
+    def test_R_co_3d(self):
+        pred = self.new_partitioner()
+        Rco = pred.R_co_3d()
+        for nth in range(len(self.epochs)):
+            np.testing.assert_allclose(Rco[nth,:],
+                                       pred.R_co_at_nth_epoch(nth).flatten(),
+                                       atol=1e-12)
+
+    def test_E_cumu_slip_3d(self):
+        pred = self.new_partitioner()
+        Ecumu = pred.E_cumu_slip_3d()
+        for nth in range(len(self.epochs)):
+            np.testing.assert_allclose(Ecumu[nth,:],
+                                       pred.E_cumu_slip(nth).flatten(),
+                                       atol=1e-12)
+
+    def test_fractional_epochs(self):
+        # G is interpolated at the exact lag, not at the lag in whole days
+        self.epochs = [0, 30.5, 60.25, 200.9, 600]
+        slip = gen_slip(self.epochs, 2, 3, seed=3)
+        pred = vj.inv.DeformPartitioner(
+            file_G0 = self.file_G0,
+            epochs = self.epochs,
+            slip = slip)
+        res = pred.partition_3d(['Rco', 'Raslip'])
+        G0 = pred.G0
+        incr = slip.get_incr_slip_3d().reshape([len(self.epochs), -1])
+        for m, t in enumerate(self.epochs):
+            R = np.zeros([len(self.epochs), G0[0].shape[0]])
+            for n, tn in enumerate(self.epochs[:m]):
+                R[n] = np.dot(G0.get_data_at_epoch(t - tn) - G0[0], incr[n])
+            np.testing.assert_allclose(res['Rco'][m].flatten(), R[0], atol=1e-12)
+            np.testing.assert_allclose(res['Raslip'][m].flatten(),
+                                       R[1:].sum(axis=0), atol=1e-12)
+
+    def test_E_aslip_to_disp_obj(self):
+        pred = self.new_partitioner()
+        disp = pred.E_aslip_to_disp_obj().get_cumu_disp_3d()
+        for nth in range(len(self.epochs)):
+            np.testing.assert_allclose(disp[nth].flatten(),
+                                       pred.E_aslip(nth).flatten(),
+                                       atol=1e-12)
+
+    def test_save_by_chunks(self):
+        pred = self.new_partitioner()
+        res = pred.partition_3d()
+        for term, func in [('Ecumu', pred.E_cumu_slip_3d),
+                           ('Rco', pred.R_co_3d),
+                           ('Raslip', pred.R_aslip_3d)]:
+            np.testing.assert_allclose(res[term].reshape([len(self.epochs), -1]),
+                                       func(), atol=1e-12)
+
+        fn = join(self.outs_dir, 'deformation_partition_chunks.h5')
+        pred.save(fn, sites_per_chunk=3)
+        with h5py.File(fn, 'r') as fid:
+            for term in ['Ecumu', 'Rco', 'Raslip']:
+                np.testing.assert_allclose(fid[term][...], res[term], atol=1e-12)
+            np.testing.assert_allclose(fid['d_added'][...],
+                                       res['Ecumu'] + res['Rco'] + res['Raslip'],
+                                       atol=1e-12)
+
+    def test_slab_blocks(self):
+        pred = self.new_partitioner()
+        res = pred.partition_3d()
+
+        pred = self.new_partitioner()
+        pred.slabs_per_block = 1
+        calls = []
+        slip_by_G = pred._slip_by_G
+        pred._slip_by_G = lambda : calls.append(1) or slip_by_G()
+        res1 = pred.partition_3d(sites_per_chunk=2)
+        # the contractions with the slip are shared by all the chunks
+        self.assertEqual(len(calls), 1)
+        for term in ['Ecumu', 'Rco', 'Raslip']:
+            np.testing.assert_allclose(res1[term], res[term], atol=1e-12)
+
+    def test_no_Raslip(self):
+        pred = vj.inv.DeformPartitionerNoRaslip(
+            file_G0 = self.file_G0,
+            epochs = self.epochs,
+            slip = gen_slip(self.epochs, 2, 3, seed=3),
+            files_Gs = [self.file_G1],
+            nlin_pars = [18.9],
+            nlin_par_names = ['log10(visM)'],
+            file_slip0 = self.file_slip0
+            )
+        res = pred.partition_3d(sites_per_chunk=3)
+        np.testing.assert_array_equal(res['Raslip'], 0.)
+        np.testing.assert_allclose(res['Rco'],
+                                   self.new_partitioner().partition_3d()['Rco'],
+                                   atol=1e-12)
 
 if __name__ == '__main__':
     unittest.main()
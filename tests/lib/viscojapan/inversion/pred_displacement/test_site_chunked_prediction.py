@@ -0,0 +1,105 @@
+__author__ = 'zy'
+
+import unittest
+from os.path import join
+
+import numpy as np
+import h5py
+
+import viscojapan as vj
+from viscojapan.inversion.predict_displacement.site_chunked_prediction import _shared
+
+from viscojapan.test_utils import gen_G_file, gen_slip
+
+class InterruptedPartitioner(vj.inv.DeformPartitioner):
+    ''' Raise after num_chunks chunks are predicted.
+'''
+    num_chunks = 2
+
+    def partition_sites_3d(self, sites, terms):
+        if self.num_chunks == 0:
+            raise RuntimeError('Interrupted.')
+        self.num_chunks -= 1
+        return super().partition_sites_3d(sites, terms)
+
+class Test_SiteChunkedPrediction(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        G_epochs = list(range(0, 601, 60))
+        self.file_G0 = join(self.outs_dir, 'G0.h5')
+        gen_G_file(self.file_G0, G_epochs, 7, 6, nlin_par=18.8, seed=0)
+        self.file_G1 = join(self.outs_dir, 'G1.h5')
+        gen_G_file(self.file_G1, G_epochs, 7, 6, nlin_par=19., seed=1)
+
+        self.epochs = [0, 30, 60, 200, 600]
+        self.file_slip0 = join(self.outs_dir, 'slip0.h5')
+        gen_slip(self.epochs, 2, 3, seed=2).save(self.file_slip0)
+
+        self.sites = ['S006', 'S001', 'S002', 'S004', 'S005']
+
+    def new_partitioner(self, cls = vj.inv.DeformPartitioner):
+        return cls(
+            file_G0 = self.file_G0,
+            epochs = self.epochs,
+            slip = gen_slip(self.epochs, 2, 3, seed=3),
+            files_Gs = [self.file_G1],
+            nlin_pars = [18.9],
+            nlin_par_names = ['log10(visM)'],
+            file_slip0 = self.file_slip0,
+            sites_for_prediction = self.sites
+            )
+
+    def check_file(self, fn):
+        res = self.new_partitioner().partition_3d()
+        with h5py.File(fn, 'r') as fid:
+            self.assertTrue(np.all(fid['chunks/done'][...]))
+            for term in ['Ecumu', 'Rco', 'Raslip']:
+                np.testing.assert_allclose(fid[term][...], res[term], atol=1e-12)
+            np.testing.assert_allclose(fid['d_added'][...],
+                                       res['Ecumu'] + res['Rco'] + res['Raslip'],
+                                       atol=1e-12)
+            self.assertEqual(vj.utils.as_string(fid['sites_for_prediction'][...]),
+                             self.sites)
+
+    def test_pool(self):
+        fn = join(self.outs_dir, 'pred_pool.h5')
+        partitioners = []
+        def create_partitioner():
+            partitioners.append(self.new_partitioner())
+            return partitioners[-1]
+        pred = vj.inv.SiteChunkedPrediction(
+            create_partitioner = create_partitioner,
+            file_name = fn,
+            sites_per_chunk = 2,
+            num_processes = 2)
+        # the partitioner for epochs and sites is closed before any fork
+        self.assertEqual(len(partitioners), 1)
+        self.assertFalse(partitioners[0].G0.fid)
+        self.assertEqual(pred.run(overwrite=True), 3)
+        self.assertTrue(pred.is_done())
+        self.check_file(fn)
+
+    def test_resume(self):
+        fn = join(self.outs_dir, 'pred_resume.h5')
+        pred = vj.inv.SiteChunkedPrediction(
+            create_partitioner = lambda : self.new_partitioner(InterruptedPartitioner),
+            file_name = fn,
+            sites_per_chunk = 2,
+            num_processes = 1)
+        with self.assertRaises(RuntimeError):
+            pred.run(overwrite=True)
+        self.assertFalse(pred.is_done())
+        self.assertEqual(_shared, {})
+
+        pred = vj.inv.SiteChunkedPrediction(
+            create_partitioner = self.new_partitioner,
+            file_name = fn,
+            sites_per_chunk = 2,
+            num_processes = 1)
+        self.assertEqual(pred.run(), 1)
+        self.check_file(fn)
+
+if __name__ == '__main__':
+    unittest.main()
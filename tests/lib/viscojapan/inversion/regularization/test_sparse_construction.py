@@ -0,0 +1,146 @@
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+import viscojapan as vj
+from viscojapan.inversion.regularization.roughening import \
+     RowRoughening, ColRoughening, RowColRoughening, \
+     roughening_matrix, finite_difference_matrix
+from viscojapan.inversion.regularization.expand_for_epochs import \
+     ExpandForAllEpochs, ExpandForOnlyFirstEpoch, \
+     ExpandExceptFirstEpoch, ExpandForCumulativeSlip
+from viscojapan.inversion.regularization.temporal_regularization import \
+     time_derivative_matrix
+
+from viscojapan.test_utils import MyTestCase
+
+def dense(mat):
+    return np.asarray(mat.todense())
+
+class Test_SparseConstruction(MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+        self.ncols = 5
+        self.nrows = 4
+
+    def test_row_roughening(self):
+        nc, nr = self.ncols, self.nrows
+        I = sparse.eye(nc)
+        block = [[None]*nr for ii in range(nr-2)]
+        for n in range(nr-2):
+            block[n][n] = I
+            block[n][n+1] = -2.*I
+            block[n][n+2] = I
+        ref = sparse.bmat(block)
+        mat = RowRoughening(ncols_slip = nc, nrows_slip = nr)()
+        np.testing.assert_array_equal(dense(mat), dense(ref))
+
+    def test_col_roughening(self):
+        nc, nr = self.ncols, self.nrows
+        ref = sparse.block_diag([roughening_matrix(nc)]*nr)
+        mat = ColRoughening(ncols_slip = nc, nrows_slip = nr)()
+        np.testing.assert_array_equal(dense(mat), dense(ref))
+
+    def test_row_col_roughening(self):
+        nc, nr = self.ncols, self.nrows
+        B = finite_difference_matrix(nc)
+        block = [[None]*nr for ii in range(nr-1)]
+        for n in range(nr-1):
+            block[n][n] = -B
+            block[n][n+1] = B
+        ref = sparse.bmat(block)
+        mat = RowColRoughening(ncols_slip = nc, nrows_slip = nr,
+                               norm_length_dip = 2.)()
+        np.testing.assert_array_equal(dense(mat), dense(ref)/2.)
+
+    def test_expand_for_epochs(self):
+        reg = vj.inv.reg.Roughening(
+            ncols_slip = self.ncols, nrows_slip = self.nrows,
+            norm_length_strike = 1., norm_length_dip = 1.5)
+        R = reg()
+        Z = sparse.csr_matrix(R.shape)
+        n = 3
+        refs = {
+            ExpandForAllEpochs : [[R, Z, Z], [Z, R, Z], [Z, Z, R]],
+            ExpandForOnlyFirstEpoch : [[R, Z, Z], [Z, Z, Z], [Z, Z, Z]],
+            ExpandExceptFirstEpoch : [[Z, Z, Z], [Z, R, Z], [Z, Z, R]],
+            ExpandForCumulativeSlip : [[R, Z, Z], [R, R, Z], [R, R, R]],
+            }
+        for cls, block in refs.items():
+            mat = cls(reg = reg, num_epochs = n)()
+            np.testing.assert_array_equal(dense(mat), dense(sparse.bmat(block)),
+                                          err_msg = cls.__name__)
+
+    def test_temporal_regularization(self):
+        num_subflts = 3
+        for epochs in ([0, 2, 5, 9], [1, 2, 5]):
+            D = dense(time_derivative_matrix(epochs))
+            ref = np.zeros_like(D)
+            nth = 0
+            for ith in range(len(epochs)-1):
+                if epochs[ith] == 0:
+                    continue
+                ref[nth, ith] = -1./(epochs[ith] - epochs[ith-1])
+                ref[nth, ith+1] = 1./(epochs[ith+1] - epochs[ith])
+                nth += 1
+            np.testing.assert_array_equal(D, ref)
+
+            mat = vj.inv.reg.TemporalRegularization(
+                num_subflts = num_subflts, epochs = epochs)()
+            np.testing.assert_array_equal(dense(mat),
+                                          np.kron(ref, np.eye(num_subflts)))
+
+    def test_composite_cache(self):
+        reg = vj.inv.reg.Roughening(
+            ncols_slip = self.ncols, nrows_slip = self.nrows,
+            norm_length_strike = 1., norm_length_dip = 1.)
+        comps = [dense(c()) for c in reg.components]
+
+        L1 = reg()
+        stack = reg._stack
+        reg.update_args([2., 3., 4.])
+        L2 = reg()
+        # Changing the args only rescales the cached stack:
+        self.assertIs(reg._stack, stack)
+        np.testing.assert_allclose(dense(L2),
+                                   np.vstack([2.*comps[0], 3.*comps[1], 4.*comps[2]]))
+        np.testing.assert_allclose(dense(L1),
+                                   np.vstack([comps[0], comps[1], np.sqrt(2)*comps[2]]))
+
+        north = vj.inv.reg.NorthBoundary(self.ncols, self.nrows)
+        reg.add_component(north, 5.)
+        L3 = reg()
+        np.testing.assert_allclose(dense(L3), np.vstack([dense(L2), 5.*dense(north())]))
+
+    def test_nested_composite(self):
+        reg = vj.inv.reg.AllBoundaryReg(
+            ncols_slip = self.ncols, nrows_slip = self.nrows,
+            arg_for_dead_boundary = 10.)
+        L1 = dense(reg())
+        dead = reg.components[0]
+        dead.update_args([1., 2., 3.])
+        L2 = dense(reg())
+        # The outer stack is rebuilt after an inner composite changes:
+        ref = np.vstack([10.*dense(dead()), dense(reg.components[1]())])
+        np.testing.assert_allclose(L2, ref)
+        self.assertFalse(np.allclose(L1, L2))
+
+    def test_composite_key_is_not_an_id(self):
+        north = vj.inv.reg.NorthBoundary(self.ncols, self.nrows)
+        south = vj.inv.reg.SouthBoundary(self.ncols, self.nrows)
+        reg = vj.inv.reg.Composite(components = [north], args = [1.])
+        reg()
+        # another component, even at the same address, rebuilds the stack
+        reg.components[0] = south
+        self.assertNotEqual(reg._components_key(), reg._stack_key)
+        np.testing.assert_allclose(dense(reg()), dense(south()))
+
+        # args changed in place of a shared composite change its key
+        key = reg._matrix_key()
+        reg.update_args([2.])
+        self.assertNotEqual(reg._matrix_key(), key)
+
+if __name__ == '__main__':
+    unittest.main()
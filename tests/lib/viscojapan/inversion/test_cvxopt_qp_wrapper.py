@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+from cvxopt import matrix, solvers
+
+import viscojapan as vj
+from viscojapan.inversion.cvxopt_qp_wrapper import CvxoptQpWrapper
+
+solvers.options['show_progress'] = False
+
+def dense_reference(P, q, GG):
+    G = -1.0 * sps.identity(P.shape[0])
+    if GG is not None:
+        G = sps.vstack([G, GG])
+    h = np.zeros((G.shape[0], 1))
+    sol = solvers.qp(matrix(P), matrix(q), matrix(G.toarray()), matrix(h))
+    return np.asarray(sol['x']).flatten()
+
+class Test_CvxoptQpWrapper(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        A = np.random.randn(40, 12)
+        self.P = np.dot(A.T, A) + 0.1*np.eye(12)
+        self.q = np.random.randn(12, 1)*10
+
+    def test_nonnegative(self):
+        qp = CvxoptQpWrapper(P=self.P, q=self.q)
+        qp.invert()
+        x = np.asarray(qp.solution['x']).flatten()
+        np.testing.assert_allclose(x, dense_reference(self.P, self.q, None), atol=1e-5)
+        self.assertTrue(np.all(x > -1e-8))
+
+    def test_nonnegative_with_GG(self):
+        # slip at the second half is not larger than at the first half
+        GG = sps.hstack([-sps.eye(6), sps.eye(6)]).tocsr()
+        qp = CvxoptQpWrapper(P=self.P, q=self.q, GG=GG)
+        qp.invert()
+        x = np.asarray(qp.solution['x']).flatten()
+        np.testing.assert_allclose(x, dense_reference(self.P, self.q, GG), atol=1e-5)
+
+    def test_reuse(self):
+        qp = CvxoptQpWrapper(P=self.P, q=self.q)
+        qp.invert()
+        kkt = qp._kktsolver
+
+        qp.q = -self.q
+        qp.invert()
+        self.assertIs(qp._kktsolver, kkt)
+        x = np.asarray(qp.solution['x']).flatten()
+        np.testing.assert_allclose(x, dense_reference(self.P, -self.q, None), atol=1e-5)
+
+    def test_change_GG(self):
+        GG0 = sps.hstack([-sps.eye(6), sps.eye(6)]).tocsr()
+        qp = CvxoptQpWrapper(P=self.P, q=self.q, GG=GG0)
+        qp.invert()
+        kkt = qp._kktsolver
+
+        # the same shape, a constraint of the opposite sign, then none, then fewer rows
+        for GG in [-GG0, None, GG0[:3]]:
+            qp.GG = GG
+            qp.invert()
+            self.assertIs(qp._kktsolver, kkt)
+            x = np.asarray(qp.solution['x']).flatten()
+            np.testing.assert_allclose(x, dense_reference(self.P, self.q, GG), atol=1e-5)
+
+if __name__ == '__main__':
+    unittest.main()
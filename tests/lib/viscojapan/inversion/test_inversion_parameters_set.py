@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+from scipy.sparse.linalg import aslinearoperator
+
+import viscojapan as vj
+from viscojapan.inversion.inversion_parameters_set import InversionParametersSet, \
+     _iter_row_blocks, _get_diagonal, _is_identity
+
+def reference_P_q(G, d, W, B, L, Bm0):
+    WGB = W.dot(G).dot(B.toarray())
+    Wd = W.dot(d)
+    LB = L.dot(B).toarray()
+    P = np.dot(WGB.T, WGB) + np.dot(LB.T, LB)
+    q = - np.dot(WGB.T, Wd) - LB.T.dot(L.toarray()).dot(Bm0)
+    return P, q
+
+class Test_InversionParametersSet(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.G = np.random.rand(60, 20)
+        self.d = np.random.rand(60, 1)
+        self.W = sps.diags(np.random.rand(60), offsets=0)
+        self.L = sps.rand(15, 20, density=0.3, format='csr', random_state=1)
+        self.Bm0 = np.random.rand(20, 1)
+
+    def check(self, G, W, B, L=None, Bm0=None):
+        if L is None:
+            L = sps.rand(15, B.shape[0], density=0.3, format='csr', random_state=1)
+        if Bm0 is None:
+            Bm0 = np.zeros([B.shape[0], 1])
+
+        par_set = InversionParametersSet(G=G, d=self.d, W=W, B=B, L=L, Bm0=Bm0)
+        P, q = par_set.gen_inputs_for_cvxopt_qp()
+
+        if not isinstance(G, np.ndarray):
+            G = G.matmat(np.eye(G.shape[1]))
+        P0, q0 = reference_P_q(G, self.d, W, B, L, Bm0)
+        np.testing.assert_allclose(P, P0)
+        np.testing.assert_allclose(q, q0)
+
+    def test_identity_B(self):
+        self.check(self.G, self.W, sps.eye(20).tocsr(), self.L, self.Bm0)
+
+    def test_sparse_B(self):
+        B = sps.rand(20, 8, density=0.2, format='csr', random_state=2)
+        self.check(self.G, self.W, B)
+
+    def test_non_diagonal_W(self):
+        W = self.W + sps.diags(np.ones(59), offsets=1)
+        self.check(self.G, W, sps.eye(20).tocsr(), self.L, self.Bm0)
+
+    def test_linear_operator(self):
+        self.check(aslinearoperator(self.G), self.W, sps.eye(20).tocsr(), self.L, self.Bm0)
+
+    def test_operator_row_blocks(self):
+        widths = []
+        class RecordingOperator(type(aslinearoperator(self.G))):
+            def _rmatmat(self, X):
+                widths.append(X.shape[1])
+                return super()._rmatmat(X)
+
+        G = RecordingOperator(self.G)
+        blocks = list(_iter_row_blocks(G, block_size=7))
+        self.assertEqual([sl.start for sl, _ in blocks], list(range(0, 60, 7)))
+        for sl, rows in blocks:
+            np.testing.assert_allclose(rows, self.G[sl,:])
+        # a unit block is no larger than the rows of the block
+        self.assertEqual(max(widths), 2)
+
+    def test_get_diagonal(self):
+        np.testing.assert_array_equal(_get_diagonal(self.W), self.W.diagonal())
+        self.assertIsNone(_get_diagonal(self.W + sps.diags(np.ones(59), offsets=1)))
+        self.assertTrue(_is_identity(sps.eye(20).tocsr()))
+        self.assertFalse(_is_identity(sps.eye(20) + sps.diags(np.ones(19), offsets=-1)))
+        self.assertFalse(_is_identity(2*sps.eye(20)))
+
+if __name__ == '__main__':
+    unittest.main()
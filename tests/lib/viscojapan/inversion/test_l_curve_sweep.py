@@ -0,0 +1,174 @@
+import unittest
+from os.path import join
+
+import h5py
+import numpy as np
+import scipy.sparse as sps
+from cvxopt import solvers
+
+import viscojapan as vj
+from viscojapan.inversion.inversion import Inversion
+from viscojapan.inversion.cvxopt_qp_wrapper import CvxoptQpWrapper
+from viscojapan.inversion.projected_gradient_solver import ProjectedGradientSolver
+from viscojapan.inversion.regularization import Composite
+from viscojapan.inversion.regularization.regularization import Leaf
+
+solvers.options['show_progress'] = False
+
+class MatrixReg(Leaf):
+    def __init__(self, L):
+        self.L = L
+
+    def generate_regularization_matrix(self):
+        return self.L
+
+class Test_LCurveSweep(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.G = np.random.randn(50, 12)
+        self.d = np.random.randn(50, 1)
+        self.W = sps.diags(np.random.rand(50) + 0.5, offsets=0)
+        self.B = sps.eye(12).tocsr()
+        self.Bm0 = np.random.rand(12, 1)
+
+        self.regs = [MatrixReg(sps.eye(12).tocsr()),
+                     MatrixReg(sps.diags([-np.ones(12), np.ones(11)],
+                                        offsets=[0,1]).tocsr())]
+        self.arg_names = ['damping', 'roughening']
+
+    def new_inversion(self):
+        inv = Inversion()
+        inv.G = self.G
+        inv.d = self.d
+        inv.W = self.W
+        inv.B = self.B
+        inv.Bm0 = self.Bm0
+        return inv
+
+    args_list = [(a, b) for a in (0.1, 1.) for b in np.logspace(-2, 1, 4)]
+
+    def new_sweep(self, args_list, **kwargs):
+        return vj.inv.LCurveSweep(inv = self.new_inversion(),
+                                  components = self.regs,
+                                  arg_names = self.arg_names,
+                                  args_list = args_list,
+                                  **kwargs)
+
+    def test_sweep(self):
+        args_list = self.args_list
+        sweep = self.new_sweep(args_list, warm_start=False)
+        fn = join(self.outs_dir, 'sweep.h5')
+        sweep.run(fn, overwrite=True)
+
+        with h5py.File(fn, 'r') as fid:
+            self.assertTrue(np.all(fid['solved'][...]))
+            np.testing.assert_allclose(fid['args'][...], args_list)
+            for nth, args in enumerate(args_list):
+                inv = self.new_inversion()
+                inv.regularization = Composite(components=list(self.regs),
+                                               args=list(args),
+                                               arg_names=list(self.arg_names))
+                inv.set_data_L()
+                inv.run()
+                np.testing.assert_allclose(fid['Bm'][nth], inv.Bm.flatten(), atol=1e-5)
+                self.assertAlmostEqual(fid['misfit/norm'][nth],
+                                       inv.get_residual_norm(), places=5)
+                nrough = inv.regularization.components_solution_norms(inv.Bm)[1]
+                self.assertAlmostEqual(fid['regularization/roughening/norm'][nth],
+                                       nrough, places=5)
+
+    def run_projected_gradient(self, fn, warm_start):
+        calls = []
+        class RecordingSolver(ProjectedGradientSolver):
+            def invert(self, nonnegative=True, initvals=None):
+                super().invert(nonnegative=nonnegative, initvals=initvals)
+                calls.append((self, initvals, self.solution['x'].copy(),
+                              self.solution['iterations']))
+
+        sweep = self.new_sweep(self.args_list, qp_solver=RecordingSolver,
+                               warm_start=warm_start)
+        sweep.run(fn, overwrite=True)
+        return calls
+
+    def test_warm_start_projected_gradient(self):
+        fn0 = join(self.outs_dir, 'sweep_cvxopt.h5')
+        self.new_sweep(self.args_list, warm_start=False).run(fn0, overwrite=True)
+
+        fn_warm = join(self.outs_dir, 'sweep_pg_warm.h5')
+        warm = self.run_projected_gradient(fn_warm, warm_start=True)
+        fn_cold = join(self.outs_dir, 'sweep_pg_cold.h5')
+        cold = self.run_projected_gradient(fn_cold, warm_start=False)
+
+        with h5py.File(fn0, 'r') as fid0:
+            for fn in fn_warm, fn_cold:
+                with h5py.File(fn, 'r') as fid:
+                    # within the default accuracy of the interior-point solver
+                    np.testing.assert_allclose(fid['Bm'][...], fid0['Bm'][...],
+                                               atol=5e-4)
+
+        # warm: one solver, every solve starts from the previous solution
+        self.assertEqual(len(warm), len(self.args_list))
+        self.assertEqual(len(set(id(c[0]) for c in warm)), 1)
+        self.assertIsNone(warm[0][1])
+        for (_, initvals, _, _), (_, _, x_prev, _) in zip(warm[1:], warm[:-1]):
+            np.testing.assert_array_equal(initvals['x'], x_prev)
+
+        # cold: a new solver from the default start for every tuple
+        self.assertEqual(len(set(id(c[0]) for c in cold)), len(self.args_list))
+        self.assertTrue(all(c[1] is None for c in cold))
+
+        # same solver, same tolerance: the warm sweep takes fewer iterations
+        self.assertLess(sum(c[3] for c in warm), sum(c[3] for c in cold))
+
+    def test_resume(self):
+        fn = join(self.outs_dir, 'sweep_resume.h5')
+        self.new_sweep(self.args_list, warm_start=False).run(fn, overwrite=True)
+        with h5py.File(fn, 'r') as fid:
+            Bm = fid['Bm'][...]
+
+        # as if the sweep had stopped after three tuples:
+        with h5py.File(fn, 'a') as fid:
+            fid['solved'][3:] = False
+            fid['Bm'][3:] = 0.
+
+        calls = []
+        class RecordingSolver(CvxoptQpWrapper):
+            def invert(self, nonnegative=True, initvals=None):
+                super().invert(nonnegative=nonnegative, initvals=initvals)
+                calls.append(initvals)
+
+        self.new_sweep(self.args_list, qp_solver=RecordingSolver,
+                       warm_start=False).run(fn)
+        self.assertEqual(len(calls), len(self.args_list) - 3)
+        with h5py.File(fn, 'r') as fid:
+            self.assertTrue(np.all(fid['solved'][...]))
+            np.testing.assert_allclose(fid['Bm'][...], Bm, atol=1e-5)
+
+        # a file of another sweep is not resumed
+        with self.assertRaises(AssertionError):
+            self.new_sweep(self.args_list[:4]).run(fn)
+
+    def test_get_P_q(self):
+        args = (0.3, 2.)
+        sweep = vj.inv.LCurveSweep(inv = self.new_inversion(),
+                                   components = self.regs,
+                                   arg_names = self.arg_names,
+                                   args_list = [args])
+        P, q = sweep.get_P_q(args)
+
+        inv = self.new_inversion()
+        inv.regularization = Composite(components=list(self.regs),
+                                       args=list(args),
+                                       arg_names=list(self.arg_names))
+        inv.set_data_L()
+        par_set = vj.inv.inversion_parameters_set.InversionParametersSet(
+            G=inv.G, d=inv.d, W=inv.W, B=inv.B, L=inv.L, Bm0=inv.Bm0)
+        P0, q0 = par_set.gen_inputs_for_cvxopt_qp()
+        np.testing.assert_allclose(P, P0)
+        np.testing.assert_allclose(q, q0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+from cvxopt import solvers
+
+import viscojapan as vj
+from viscojapan.inversion.inversion import Inversion
+from viscojapan.inversion.cvxopt_qp_wrapper import CvxoptQpWrapper
+from viscojapan.inversion.inversion_parameters_set import InversionParametersSet
+
+solvers.options['show_progress'] = False
+
+def solve(qp_solver, inv_par_set, nonnegative=True):
+    qp = qp_solver.create_from_inversion_parameters_set(inv_par_set)
+    qp.invert(nonnegative=nonnegative)
+    return qp, np.asarray(qp.solution['x']).flatten()
+
+class Test_ProjectedGradientSolver(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.G = np.random.randn(50, 12)
+        self.d = np.random.randn(50, 1)
+        self.W = sps.diags(np.random.rand(50) + 0.5, offsets=0)
+        self.L = sps.eye(12).tocsr()*0.3
+
+    def inv_par_set(self, GG = None):
+        return InversionParametersSet(G=self.G, d=self.d, W=self.W,
+                                      B=sps.eye(12).tocsr(), L=self.L, GG=GG)
+
+    def test_nonnegative(self):
+        _, x0 = solve(CvxoptQpWrapper, self.inv_par_set())
+        qp, x1 = solve(vj.inv.ProjectedGradientSolver, self.inv_par_set())
+        self.assertEqual(qp.solution['status'], 'optimal')
+        np.testing.assert_allclose(x1, x0, atol=1e-5)
+
+    def test_unconstrained(self):
+        _, x0 = solve(CvxoptQpWrapper, self.inv_par_set(), False)
+        _, x1 = solve(vj.inv.ProjectedGradientSolver, self.inv_par_set(), False)
+        np.testing.assert_allclose(x1, x0, atol=1e-5)
+
+    def test_with_GG(self):
+        GG = sps.hstack([-sps.eye(6), sps.eye(6)]).tocsr()
+        _, x0 = solve(CvxoptQpWrapper, self.inv_par_set(GG))
+        qp, x1 = solve(vj.inv.ProjectedGradientSolver, self.inv_par_set(GG))
+        self.assertEqual(qp.solution['status'], 'optimal')
+        np.testing.assert_allclose(x1, x0, atol=1e-4)
+
+    def test_warm_start(self):
+        qp, _ = solve(vj.inv.ProjectedGradientSolver, self.inv_par_set())
+        num_iters_cold = qp.solution['iterations']
+        qp.invert()
+        self.assertLess(qp.solution['iterations'], num_iters_cold)
+
+    def test_inversion_with_qp_solver(self):
+        inv = Inversion(qp_solver='projected_gradient')
+        inv.G = self.G
+        inv.d = self.d
+        inv.W = self.W
+        inv.B = sps.eye(12).tocsr()
+        inv.L = self.L
+        inv.Bm0 = None
+        inv.invert()
+        _, x0 = solve(CvxoptQpWrapper, self.inv_par_set())
+        np.testing.assert_allclose(inv.m.flatten(), x0, atol=1e-5)
+
+    def test_inversion_warns_if_not_optimal(self):
+        class ShortSolver(vj.inv.ProjectedGradientSolver):
+            @classmethod
+            def create_from_inversion_parameters_set(cls, inv_par_set):
+                qp = super().create_from_inversion_parameters_set(inv_par_set)
+                qp.max_iter = 2
+                return qp
+
+        inv = Inversion(qp_solver=ShortSolver)
+        inv.G = self.G
+        inv.d = self.d
+        inv.W = self.W
+        inv.B = sps.eye(12).tocsr()
+        inv.L = self.L
+        inv.Bm0 = None
+        with self.assertWarnsRegex(UserWarning, "status 'unknown'"):
+            inv.invert()
+        self.assertEqual(inv.qp.solution['status'], 'unknown')
+
+    def test_inversion_reuses_solver(self):
+        inv = Inversion(qp_solver='projected_gradient')
+        inv.G = self.G
+        inv.d = self.d
+        inv.W = self.W
+        inv.B = sps.eye(12).tocsr()
+        inv.L = self.L
+        inv.Bm0 = None
+        inv.invert()
+        qp = inv.qp
+        num_iters_cold = qp.solution['iterations']
+
+        # a slightly different regularization starts from the last solution
+        inv.L = self.L*1.05
+        inv.invert()
+        self.assertIs(inv.qp, qp)
+        self.assertLess(qp.solution['iterations'], num_iters_cold)
+        _, x0 = solve(CvxoptQpWrapper, InversionParametersSet(
+            G=self.G, d=self.d, W=self.W, B=sps.eye(12).tocsr(), L=inv.L))
+        np.testing.assert_allclose(inv.m.flatten(), x0, atol=1e-5)
+
+        # another solver class or another number of parameters: a new solver
+        inv.qp_solver = 'cvxopt'
+        inv.invert()
+        self.assertIsInstance(inv.qp, CvxoptQpWrapper)
+        qp = inv.qp
+        inv.G = self.G[:,:10]
+        inv.B = sps.eye(10).tocsr()
+        inv.L = self.L[:10,:10]
+        inv.invert()
+        self.assertIsNot(inv.qp, qp)
+
+    def test_with_GG_kkt(self):
+        GG = sps.hstack([-sps.eye(6), sps.eye(6)]).tocsr()
+        qp, m = solve(vj.inv.ProjectedGradientSolver, self.inv_par_set(GG))
+        self.assertEqual(qp.solution['status'], 'optimal')
+        y = qp.solution['y']
+        grad = qp._grad(m, qp.b.flatten())
+        # dual feasibility and complementarity at the returned point
+        self.assertTrue(np.all(y >= 0))
+        self.assertLess(np.max(GG.dot(m)), 1e-4)
+        self.assertLess(abs(np.dot(y, GG.dot(m))), 1e-4*max(1., np.linalg.norm(grad)))
+        self.assertLess(np.linalg.norm(m - np.maximum(m - grad - GG.T.dot(y), 0.)), 1e-4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from os.path import join, exists
+
+import h5py
+import numpy as np
+import scipy.sparse as sps
+from cvxopt import solvers
+
+import viscojapan as vj
+from viscojapan.inversion.inversion import Inversion
+from viscojapan.inversion.regularization import Composite
+from viscojapan.inversion.regularization_grid_runner import _memmap_dataset
+from viscojapan.inversion.regularization.regularization import Leaf
+from viscojapan.utils import delete_if_exists
+
+solvers.options['show_progress'] = False
+
+class Damping(Leaf):
+    def generate_regularization_matrix(self):
+        return sps.eye(12).tocsr()
+
+def create_regularization(reg_damping):
+    return Composite().add_component(Damping(), arg=reg_damping, arg_name='damping')
+
+class SimpleInversion(Inversion):
+    def save(self, fn, overwrite = False):
+        if overwrite:
+            delete_if_exists(fn)
+        with h5py.File(fn, 'w') as fid:
+            fid['Bm'] = self.Bm
+            fid['shared'] = isinstance(self.G, np.memmap)
+
+class Test_RegularizationGridRunner(vj.MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        np.random.seed(0)
+        self.G = np.random.randn(50, 12)
+        self.d = np.random.randn(50, 1)
+        self.W = sps.diags(np.random.rand(50) + 0.5, offsets=0)
+
+    def new_inversion(self):
+        inv = SimpleInversion()
+        inv.G = self.G
+        inv.d = self.d
+        inv.W = self.W
+        inv.B = sps.eye(12).tocsr()
+        inv.Bm0 = None
+        return inv
+
+    def test_run(self):
+        regs = np.logspace(-2, 1, 4)
+        grid = [(join(self.outs_dir, 'ndamp_%02d.h5'%nth), (reg,))
+                for nth, reg in enumerate(regs)]
+        for fn, _ in grid:
+            delete_if_exists(fn)
+
+        # finished before, shouldn't be touched:
+        with h5py.File(grid[0][0], 'w') as fid:
+            fid['Bm'] = np.zeros((12,1))
+
+        inv = self.new_inversion()
+        runner = vj.inv.RegularizationGridRunner(
+            inv = inv,
+            create_regularization = create_regularization,
+            grid = grid,
+            num_processes = 2,
+            tmp_dir = self.outs_dir)
+        outs = runner.run()
+        self.assertEqual(sorted(outs), sorted(fn for fn, _ in grid[1:]))
+
+        # attributes are restored
+        self.assertNotIsInstance(inv.G, np.memmap)
+        np.testing.assert_array_equal(inv.G, self.G)
+
+        with h5py.File(grid[0][0], 'r') as fid:
+            np.testing.assert_array_equal(fid['Bm'][...], 0.)
+
+        for fn, args in grid[1:]:
+            self.assertFalse(exists(fn + '.part'))
+            inv = self.new_inversion()
+            inv.regularization = create_regularization(*args)
+            inv.set_data_L()
+            inv.run()
+            with h5py.File(fn, 'r') as fid:
+                self.assertTrue(fid['shared'][()])
+                np.testing.assert_allclose(fid['Bm'][...], inv.Bm, atol=1e-8)
+
+        self.assertEqual(runner.run(), [])
+
+    def test_memmap_dataset(self):
+        fn = join(self.outs_dir, 'memmap.h5')
+        val = np.random.rand(20, 3).astype('float32')
+        with h5py.File(fn, 'w') as fid:
+            fid['contiguous'] = val
+            fid.create_dataset('chunked', data=val, chunks=(5, 3),
+                               compression='gzip')
+            fid['empty'] = np.zeros((0, 3))
+        with h5py.File(fn, 'r') as fid:
+            arr = _memmap_dataset(fid, 'contiguous')
+            self.assertIsInstance(arr, np.memmap)
+            np.testing.assert_array_equal(arr, val)
+
+            arr = _memmap_dataset(fid, 'chunked')
+            self.assertNotIsInstance(arr, np.memmap)
+            np.testing.assert_array_equal(arr, val)
+
+            self.assertEqual(_memmap_dataset(fid, 'empty').shape, (0, 3))
+
+if __name__ == '__main__':
+    unittest.main()
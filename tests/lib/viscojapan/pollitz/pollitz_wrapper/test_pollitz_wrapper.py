@@ -0,0 +1,74 @@
+import unittest
+from os.path import join, exists, islink
+import os
+import stat
+
+from viscojapan.pollitz.pollitz_wrapper import PollitzWrapper, get_working_directory
+from viscojapan.test_utils import MyTestCase
+from viscojapan.utils import delete_if_exists
+
+class Echo(PollitzWrapper):
+    ''' Write stdin and then the input file into out.
+'''
+    def __init__(self, cmd, text, earth_file, file_out, **kwargs):
+        self.text = text
+        super().__init__(input_files = {'earth.model':earth_file},
+                         output_files = {'out':file_out},
+                         **kwargs)
+        self._cmd = cmd
+
+    def gen_stdin_text(self):
+        return self.text
+
+class Test_PollitzWrapper(MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        self.cmd = join(self.outs_dir, 'echo.sh')
+        with open(self.cmd, 'wt') as fid:
+            fid.write('#!/bin/sh\ncat > out\ncat earth.model >> out\n')
+        os.chmod(self.cmd, os.stat(self.cmd).st_mode | stat.S_IEXEC)
+
+        self.earth_file = join(self.outs_dir, 'earth.model')
+        with open(self.earth_file, 'wt') as fid:
+            fid.write('earth\n')
+
+        self.tmp_dir = join(self.outs_dir, 'tmp')
+
+    def run_echo(self, text, file_out, **kwargs):
+        delete_if_exists(file_out)
+        Echo(self.cmd, text, self.earth_file, file_out,
+             tmp_dir = self.tmp_dir, **kwargs)()
+        with open(file_out, 'rt') as fid:
+            return fid.read()
+
+    def test_copy(self):
+        out = self.run_echo('a\n', join(self.outs_dir, 'out_copy'))
+        self.assertEqual(out, 'a\nearth\n')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_reuse_cwd(self):
+        for link_mode in 'symlink', 'hardlink':
+            for text in 'a\n', 'b\n':
+                out = self.run_echo(text, join(self.outs_dir, 'out_' + link_mode),
+                                    link_mode = link_mode, reuse_cwd = True)
+                self.assertEqual(out, text + 'earth\n')
+
+            wd = get_working_directory({'earth.model':self.earth_file},
+                                       self.tmp_dir, link_mode)
+            self.assertEqual(islink(join(wd.cwd, 'earth.model')),
+                             link_mode == 'symlink')
+            wd.close()
+            self.assertFalse(exists(wd.cwd))
+
+        # the working directory is recreated after closed:
+        out = self.run_echo('c\n', join(self.outs_dir, 'out_symlink'),
+                            link_mode = 'symlink', reuse_cwd = True)
+        self.assertEqual(out, 'c\nearth\n')
+        get_working_directory({'earth.model':self.earth_file},
+                              self.tmp_dir, 'symlink').close()
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 0)
+
+if __name__=='__main__':
+    unittest.main()
@@ -1,12 +1,24 @@
 import unittest
 from os.path import join
+from os import makedirs
+import os
+import signal
 import glob
 
 from viscojapan.test_utils import MyTestCase
 from viscojapan.pollitz.compute_greens_function \
      import ComputeGreensFunction
+from viscojapan.pollitz.pollitz_wrapper import get_working_directory
 from viscojapan.utils import delete_if_exists
 
+class KilledInTask(ComputeGreensFunction):
+    ''' A pool process that is killed after making its working directory.
+'''
+    def _stat2gA(self, file_flt):
+        get_working_directory({'earth.model':self.earth_file},
+                              self._get_tmp_dir(), self.link_mode)
+        os.kill(os.getpid(), signal.SIGKILL)
+
 class Test_ComputeGreensFunction(MyTestCase):
     def setUp(self):
         self.this_script = __file__
@@ -16,6 +28,76 @@ class Test_ComputeGreensFunction(MyTestCase):
         
         self.out2 = join(self.outs_dir,'out2')
 
+    def test_load_tasks_batched(self):
+        subflts_files = ['flt_%04d'%ii for ii in range(7)]
+        com = ComputeGreensFunction(
+            epochs = [0, 10],
+            file_sites = 'sites',
+            earth_file = 'earth.model',
+            earth_file_dir = 'earth_files',
+            outputs_dir = self.out1,
+            subflts_files = subflts_files,
+            controller_file = 'pool.config',
+            subflts_per_task = 3,
+            )
+        com.load_tasks()
+        self.assertEqual(len(com.tasks), 6)
+        self.assertEqual(len(com.output_files), 14)
+        self.assertEqual(com.tasks[2].kwargs,
+                         {'files_flt':['flt_0006'], 'epoch':0})
+        self.assertEqual(com.tasks[3].kwargs,
+                         {'files_flt':subflts_files[:3], 'epoch':10})
+        self.assertEqual(com.tasks[3].key,
+                         '_straina(epoch=10, file_flt=flt_0000); '
+                         '_straina(epoch=10, file_flt=flt_0001); '
+                         '_straina(epoch=10, file_flt=flt_0002)')
+
+    def test_load_tasks_skip_existing_with_journal(self):
+        subflts_files = ['flt_%04d'%ii for ii in range(4)]
+        def new(subflts_per_task):
+            return ComputeGreensFunction(
+                epochs = [10],
+                file_sites = 'sites',
+                earth_file = 'earth.model',
+                earth_file_dir = 'earth_files',
+                outputs_dir = self.out1,
+                subflts_files = subflts_files,
+                controller_file = 'pool.config',
+                subflts_per_task = subflts_per_task,
+                journal_file = join(self.outs_dir, 'journal'),
+                )
+        com = new(1)
+        com.load_tasks()
+        makedirs(self.out1)
+        for fn in com.output_files[:3]:
+            open(fn, 'w').close()
+
+        # resumed with another subflts_per_task
+        com = new(2)
+        com.load_tasks()
+        self.assertEqual(len(com.tasks), 1)
+        self.assertEqual(com.tasks[0].key, '_straina(epoch=10, file_flt=flt_0003)')
+
+    def test_reuse_cwd_removed_after_killed(self):
+        tmp_dir = join(self.outs_dir, 'tmp')
+        controller_file = join(self.outs_dir, 'pool.config.static')
+        with open(controller_file, 'wt') as fid:
+            fid.write('1 1 nan 1\n')
+        com = KilledInTask(
+            epochs = [0],
+            file_sites = 'sites',
+            earth_file = join(self.share_dir, 'earth.model'),
+            earth_file_dir = 'earth_files',
+            outputs_dir = self.out1,
+            subflts_files = ['flt_0000'],
+            controller_file = controller_file,
+            tmp_dir = tmp_dir,
+            link_mode = 'symlink',
+            reuse_cwd = True,
+            )
+        com.run()
+        self.assertEqual(os.listdir(tmp_dir), [])
+
 ## These tests use dpool, which need to be redesined.
         
 
@@ -2,8 +2,21 @@ import unittest
 from os.path import join
 
 import numpy as np
+import h5py
 
 import viscojapan as vj
+from viscojapan.pollitz.pollitz_outputs_to_epoch_file import read_pollitz_output
+
+def write_pollitz_outputs(outs_dir, epochs, num_subflts, num_sites):
+    np.random.seed(0)
+    outs = {}
+    for day in epochs:
+        for fltno in range(num_subflts):
+            data = np.random.randn(num_sites, 5)
+            fn = join(outs_dir, 'day_%04d_flt_%04d.out'%(day, fltno))
+            np.savetxt(fn, data, fmt='%12.5E')
+            outs[(day, fltno)] = np.loadtxt(fn, usecols=(2,3,4)).flatten()
+    return outs
 
 class Test_PollitzOutputsToEpochalData(vj.MyTestCase):
     def setUp(self):
@@ -37,6 +50,80 @@ class Test_PollitzOutputsToEpochalData(vj.MyTestCase):
             }
             )
         model()
-            
+
+    def test_parallel_ingestion(self):
+        epochs = [0, 10, 60]
+        num_subflts = 7
+        sites = ['S%03d'%ii for ii in range(4)]
+        outs = write_pollitz_outputs(self.outs_dir, epochs, num_subflts, len(sites))
+
+        model = vj.pollitz.PollitzOutputsToEpochalData(
+            epochs = epochs,
+            G_file = join(self.outs_dir, 'G_parallel.h5'),
+            num_subflts = num_subflts,
+            pollitz_outputs_dir = self.outs_dir,
+            sites = sites,
+            num_processes = 2,
+            block_size = 3,
+            )
+        model()
+
+        with h5py.File(join(self.outs_dir, 'G_parallel.h5'), 'r') as fid:
+            G = fid['data3d']
+            self.assertEqual(G.chunks[0], 1)
+            for nth, day in enumerate(epochs):
+                for fltno in range(num_subflts):
+                    ref = outs[(day, fltno)]
+                    if day != 0:
+                        ref = ref + outs[(0, fltno)]
+                    np.testing.assert_array_equal(G[nth,:,fltno], ref)
+            np.testing.assert_array_equal(fid['epochs'][...], epochs)
+
+    def test_compressed_float32(self):
+        epochs = [0, 10]
+        num_subflts = 5
+        sites = ['S%03d'%ii for ii in range(3)]
+        outs = write_pollitz_outputs(self.outs_dir, epochs, num_subflts, len(sites))
+
+        G_file = join(self.outs_dir, 'G_float32.h5')
+        model = vj.pollitz.PollitzOutputsToEpochalData(
+            epochs = epochs,
+            G_file = G_file,
+            num_subflts = num_subflts,
+            pollitz_outputs_dir = self.outs_dir,
+            sites = sites,
+            num_processes = 1,
+            layout = 'site',
+            compression = 'gzip',
+            storage_dtype = 'float32',
+            error_bound = 1e-4,
+            )
+        model()
+
+        with h5py.File(G_file, 'r') as fid:
+            self.assertEqual(fid['data3d'].dtype, np.float32)
+            self.assertEqual(fid['data3d'].compression, 'gzip')
+            self.assertEqual(fid['data3d'].chunks[0], len(epochs))
+            G = vj.epoch_3d_array.G.load(fid, memory_mode = True)
+        for fltno in range(num_subflts):
+            np.testing.assert_allclose(G.get_array_3d()[1,:,fltno],
+                                       outs[(0, fltno)] + outs[(10, fltno)], atol=1e-4)
+
+    def test_read_pollitz_output(self):
+        fn = join(self.outs_dir, 'out')
+        data = np.random.randn(4, 5)
+        np.savetxt(fn, data, fmt='%12.5E')
+        np.testing.assert_allclose(read_pollitz_output(fn, 4),
+                                   data[:,2:5].flatten(), rtol=1e-5)
+        with self.assertRaises(AssertionError):
+            read_pollitz_output(fn, 5)
+
+        # the last row is cut in the middle of a number
+        with open(fn, 'wt') as fid:
+            np.savetxt(fid, data[:3], fmt='%12.5E')
+            fid.write('%12.5E %12.5E %12.5E %12.5E  1.2E'%tuple(data[3,:4]))
+        with self.assertRaises(ValueError):
+            read_pollitz_output(fn, 4)
+
 if __name__ == '__main__':
     unittest.main()
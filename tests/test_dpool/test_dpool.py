@@ -2,6 +2,12 @@ import unittest
 from time import sleep
 from random import randrange
 from os.path import join
+import subprocess
+import signal
+import sys
+import time
+
+import psutil as ps
 
 from viscojapan.test_utils import MyTestCase
 from dpool.dpool import DPool, Task
@@ -22,6 +28,83 @@ class Test_DPool(MyTestCase):
             )
         dp.run()
 
+    def test_kill_process_group(self):
+        controller_file = join(self.outs_dir, 'pool.config')
+        with open(controller_file, 'wt') as fid:
+            fid.write('1 2 nan 1\n')
+
+        # Each task starts a command, as the Pollitz wrappers do.
+        tasks = [Task(target = subprocess.call, args = (['sleep', '30'],))
+                 for n in range(2)]
+        dp = DPool(tasks = tasks, controller_file = controller_file)
+        for task in tasks:
+            dp.dp_state.q_waiting.put(task)
+        dp._add_procs(2)
+        for pid, p in dp.running_procs.items():
+            self.assertEqual(pid, p.pid)
+
+        t0 = time.time()
+        while len(ps.Process(next(reversed(dp.running_procs))).children()) == 0:
+            self.assertLess(time.time() - t0, 10.)
+            time.sleep(0.1)
+        pid = next(reversed(dp.running_procs))
+        children = ps.Process(pid).children(recursive = True)
+
+        dp._kill_procs(1)
+        self.assertNotIn(pid, dp.running_procs)
+        self.assertEqual(len(dp.running_procs), 1)
+        gone, alive = ps.wait_procs(children, timeout = 5)
+        self.assertEqual(alive, [])
+        self.assertEqual(dp.dp_state.num_aborted_tasks(), 1)
+
+        dp._kill_procs(1)
+        self.assertEqual(dp.running_procs, {})
+
+    def run_pool_and_signal(self, sig):
+        ''' Start a pool in another process, send it sig, and return
+the workers and the commands they ran.
+'''
+        controller_file = join(self.outs_dir, 'pool.config')
+        with open(controller_file, 'wt') as fid:
+            fid.write('1 2 nan 1\n')
+        code = '''
+import subprocess, sys, time
+from dpool.dpool import DPool, Task
+tasks = [Task(target = subprocess.call, args = (['sleep', '30'],))
+         for n in range(2)]
+dp = DPool(tasks = tasks, controller_file = sys.argv[1])
+for task in tasks:
+    dp.dp_state.q_waiting.put(task)
+dp._add_procs(2)
+print('workers:', *dp.running_procs, flush=True)
+time.sleep(60)
+'''
+        parent = subprocess.Popen([sys.executable, '-c', code, controller_file],
+                                  stdout = subprocess.PIPE,
+                                  universal_newlines = True)
+        line = parent.stdout.readline()
+        while not line.startswith('workers:'):
+            line = parent.stdout.readline()
+        pids = [int(pid) for pid in line.split()[1:]]
+        t0 = time.time()
+        while not all(ps.Process(pid).children() for pid in pids):
+            self.assertLess(time.time() - t0, 10.)
+            time.sleep(0.1)
+        procs = [ps.Process(pid) for pid in pids]
+        for p in list(procs):
+            procs += p.children(recursive = True)
+
+        parent.send_signal(sig)
+        parent.wait(10)
+        parent.stdout.close()
+        return procs
+
+    def test_workers_killed_with_pool(self):
+        for sig in signal.SIGINT, signal.SIGTERM:
+            procs = self.run_pool_and_signal(sig)
+            gone, alive = ps.wait_procs(procs, timeout = 5)
+            self.assertEqual(alive, [], signal.Signals(sig).name)
+
 if __name__ == '__main__':
     unittest.main()
         
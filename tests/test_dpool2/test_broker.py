@@ -0,0 +1,187 @@
+import unittest
+import os
+import signal
+import time
+from os.path import join, exists
+from multiprocessing import Process, AuthenticationError
+
+from viscojapan.test_utils import MyTestCase
+from viscojapan.utils import delete_if_exists
+from dpool2 import DPool, Task
+from dpool2.broker import Node, parse_address, get_authkey, read_authkey, \
+     serve_broker, stop_broker, connect_broker, AUTHKEY_ENV
+
+def touch(fn):
+    open(fn, 'wt').close()
+
+def kill_worker_once(fn):
+    ''' Kill the worker process running it the first time.
+'''
+    if not exists(fn + '.killed'):
+        touch(fn + '.killed')
+        os.kill(os.getpid(), signal.SIGKILL)
+    touch(fn)
+
+def run_node(address, controller_file, heartbeat_interval = 5.):
+    Node(address, controller_file = controller_file, sample_interval = 0.2,
+         heartbeat_interval = heartbeat_interval).run()
+
+class Test_Broker(MyTestCase):
+    def setUp(self):
+        self.this_script = __file__
+        super().setUp()
+
+        self.controller_file = join(self.outs_dir, 'pool.config.static')
+        with open(self.controller_file, 'wt') as fid:
+            fid.write('1 2 nan 1\n')
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('node1:50000'), ('node1', 50000))
+        self.assertEqual(parse_address('/tmp/broker.sock'), '/tmp/broker.sock')
+
+    def test_authkey(self):
+        env = os.environ.pop(AUTHKEY_ENV, None)
+        try:
+            # A TCP broker is never served with a default key:
+            with self.assertRaises(ValueError):
+                get_authkey(('localhost', 50000))
+            with self.assertRaises(ValueError):
+                serve_broker(None, ('localhost', 0))
+            self.assertEqual(get_authkey(('localhost', 50000), 'secret'), b'secret')
+
+            os.environ[AUTHKEY_ENV] = 'from env'
+            self.assertEqual(get_authkey(('localhost', 50000)), b'from env')
+        finally:
+            os.environ.pop(AUTHKEY_ENV, None)
+            if env is not None:
+                os.environ[AUTHKEY_ENV] = env
+
+        fn = join(self.outs_dir, 'authkey')
+        with open(fn, 'wt') as fid:
+            fid.write('s3cret\n')
+        self.assertEqual(read_authkey(fn), b's3cret')
+
+    def test_unix_socket_authkey(self):
+        env = os.environ.pop(AUTHKEY_ENV, None)
+        address = join(self.outs_dir, 'broker_key.sock')
+        delete_if_exists(address)
+        try:
+            keys = []
+            for ii in range(2):
+                server = serve_broker(None, address)
+                try:
+                    # a random key of this run, readable only by the user
+                    self.assertEqual(os.stat(address).st_mode & 0o777, 0o600)
+                    key_file = address + '.authkey'
+                    self.assertEqual(os.stat(key_file).st_mode & 0o777, 0o600)
+                    keys.append(get_authkey(address))
+                    self.assertGreaterEqual(len(keys[-1]), 32)
+                    connect_broker(address)
+                    with self.assertRaises(AuthenticationError):
+                        connect_broker(address, b'dpool2-unix-socket', timeout = 0.)
+                finally:
+                    stop_broker(server)
+                    delete_if_exists(address)
+                self.assertFalse(exists(key_file))
+            self.assertNotEqual(keys[0], keys[1])
+        finally:
+            if env is not None:
+                os.environ[AUTHKEY_ENV] = env
+
+    def test_nodes(self):
+        address = join(self.outs_dir, 'broker.sock')
+        delete_if_exists(address)
+        outs = [join(self.outs_dir, 'touch_%02d'%n) for n in range(12)]
+        for fn in outs:
+            delete_if_exists(fn)
+
+        # Two nodes standing in for two hosts:
+        nodes = [Process(target = run_node, args = (address, self.controller_file))
+                 for ii in range(2)]
+        for node in nodes:
+            node.start()
+
+        dp = DPool(tasks = [Task(target = touch, args = (fn,)) for fn in outs],
+                   controller_file = self.controller_file,
+                   log_file = join(self.outs_dir, 'broker.log'),
+                   broker_address = address,
+                   local_processes = False)
+        dp.run()
+        for node in nodes:
+            node.join(timeout = 30)
+            self.assertEqual(node.exitcode, 0)
+
+        self.assertTrue(all(exists(fn) for fn in outs))
+        self.assertEqual(dp.num_finished_tasks, 12)
+        workers = set(task.pid for task in dp.finished_tasks)
+        self.assertGreater(len(workers), 1)
+        self.assertTrue(all(task.t_consumed is not None for task in dp.finished_tasks))
+
+    def test_worker_killed_in_task(self):
+        address = join(self.outs_dir, 'broker_kill.sock')
+        delete_if_exists(address)
+        outs = [join(self.outs_dir, 'killed_%02d'%n) for n in range(3)]
+        for fn in outs:
+            delete_if_exists(fn)
+            delete_if_exists(fn + '.killed')
+
+        node = Process(target = run_node, args = (address, self.controller_file, 0.2))
+        node.start()
+
+        dp = DPool(tasks = [Task(target = kill_worker_once, args = (outs[0],))] +
+                           [Task(target = touch, args = (fn,)) for fn in outs[1:]],
+                   controller_file = self.controller_file,
+                   log_file = join(self.outs_dir, 'broker_kill.log'),
+                   broker_address = address,
+                   local_processes = False,
+                   max_retries = 1,
+                   retry_backoff = 0.1,
+                   worker_timeout = 2.)
+        dp.run()
+        node.join(timeout = 30)
+        self.assertEqual(node.exitcode, 0)
+
+        # The task of the killed worker is run again on another worker:
+        self.assertTrue(exists(outs[0] + '.killed'))
+        self.assertTrue(all(exists(fn) for fn in outs))
+        self.assertEqual(dp.num_finished_tasks, 3)
+        self.assertEqual(len(dp.failed_tasks), 0)
+        retried = [task for task in dp.finished_tasks if task.retries > 0]
+        self.assertEqual(len(retried), 1)
+        self.assertEqual(retried[0].args, (outs[0],))
+
+    def test_worker_lost_before_started(self):
+        fn = join(self.outs_dir, 'lost_before_started')
+        task = Task(target = touch, args = (fn,))
+        dp = DPool(tasks = [task],
+                   controller_file = self.controller_file,
+                   local_processes = False,
+                   worker_timeout = 1.)
+        dp._handle_event(('joined', 'node:1', None))
+        dp.renew_lease('node:1')
+        dp._dispatch()
+        self.assertEqual(dp.num_idle_processes, 0)
+        self.assertEqual(dp._pending_tasks, [])
+
+        # the worker takes the task and is lost before it reports 'started'
+        self.assertIs(dp.dp_state.get_task('node:1', timeout = 1.), task)
+        dp._lease_renewed['node:1'] = time.time() - 10.
+        dp._expire_remote_workers()
+        self.assertEqual(dp._pending_tasks, [task])
+        self.assertEqual(dp.num_processes, 0)
+        self.assertEqual(dp.num_idle_processes, 0)
+
+        # its late events are ignored, and it is asked to exit
+        dp._handle_event(('started', 'node:1', task))
+        dp._handle_event(('finished', 'node:1', task))
+        self.assertEqual(dp.num_processes, 0)
+        self.assertEqual(dp.num_finished_tasks, 0)
+        self.assertIsNone(dp.dp_state.get_task('node:1', timeout = 1.))
+
+        # another worker gets the task
+        dp._handle_event(('joined', 'node:2', None))
+        dp._dispatch()
+        self.assertIs(dp.dp_state.get_task('node:2', timeout = 1.), task)
+
+if __name__ == '__main__':
+    unittest.main()
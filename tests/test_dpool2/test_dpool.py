@@ -1,10 +1,21 @@
 import unittest
-from time import sleep
+from time import sleep, time
 from random import randrange
-from os.path import join
+from os.path import join, exists
+import json
 
 from viscojapan.test_utils import MyTestCase
+from viscojapan.utils import delete_if_exists
 from dpool2.dpool import DPool, Task
+from dpool2 import TaskJournal
+
+def fail_once(fn):
+    if not exists(fn):
+        open(fn, 'wt').close()
+        raise RuntimeError('First run fails.')
+
+def touch(fn):
+    open(fn, 'wt').close()
 
 class Test_DPool(MyTestCase):
     def setUp(self):
@@ -22,6 +33,98 @@ class Test_DPool(MyTestCase):
             )
         dp.run()
 
+    def test_task_key(self):
+        self.assertEqual(Task(target = touch, args = ('a',), kwargs = {'n':1}).key,
+                         'touch(a, n=1)')
+        # the repr of an object has its address, which changes between runs
+        with self.assertWarns(UserWarning):
+            Task(target = touch, args = (object(),)).key
+        self.assertEqual(Task(target = touch, args = (object(),), key = 'k').key, 'k')
+
+    def test_static_short_tasks(self):
+        controller_file = self.write_static_config()
+
+        tasks = [Task(target = sleep, args = (0.2,)) for n in range(8)]
+        tasks.append(Task(target = int, args = ('x',)))
+        dp = DPool(
+            tasks = tasks,
+            controller_file = controller_file,
+            log_file = join(self.outs_dir, 'dpool.log'),
+            )
+        t0 = time()
+        dp.run()
+        # tasks follow each other without waiting for the sleep interval.
+        self.assertLess(time() - t0, 4.)
+
+        self.assertEqual(dp.num_finished_tasks, 9)
+        self.assertEqual(dp.num_processes, 0)
+        failed = [task for task in dp.finished_tasks if task.exception is not None]
+        self.assertEqual(len(failed), 1)
+        self.assertIn('ValueError', failed[0].exception)
+        with open(join(self.outs_dir, 'dpool.log'), 'rt') as fid:
+            log = fid.read()
+        self.assertEqual(log.count('event=task_finished'), 8)
+        self.assertIn('event=task_failed', log)
+
+    def write_static_config(self):
+        controller_file = join(self.outs_dir, 'pool.config.static')
+        with open(controller_file, 'wt') as fid:
+            fid.write('1 2 nan 5\n')
+        return controller_file
+
+    def test_journal_resume_and_retry(self):
+        controller_file = self.write_static_config()
+        journal_file = join(self.outs_dir, 'journal.jsonl')
+        delete_if_exists(journal_file)
+
+        flag = join(self.outs_dir, 'flag')
+        delete_if_exists(flag)
+        outs = [join(self.outs_dir, 'touch_%d'%n) for n in range(4)]
+        for fn in outs:
+            delete_if_exists(fn)
+
+        tasks = [Task(target = touch, args = (fn,)) for fn in outs[:2]]
+        tasks.append(Task(target = fail_once, args = (flag,), key = 'flaky'))
+        dp = DPool(tasks = tasks,
+                   controller_file = controller_file,
+                   journal_file = journal_file,
+                   max_retries = 2,
+                   retry_backoff = 0.1)
+        dp.run()
+        self.assertEqual(dp.num_finished_tasks, 3)
+        self.assertEqual(dp.failed_tasks, [])
+
+        with TaskJournal(journal_file) as journal:
+            self.assertTrue(journal.is_done('flaky'))
+            self.assertTrue(journal.is_done(tasks[0].key))
+            self.assertEqual(len(journal.durations()), 3)
+        with open(journal_file, 'rt') as fid:
+            states = [json.loads(ln)['state'] for ln in fid
+                      if json.loads(ln)['key'] == 'flaky']
+        self.assertEqual(states, ['queued', 'running', 'failed', 'queued', 'running', 'done'])
+
+        # a crash leaves a cut line:
+        with open(journal_file, 'at') as fid:
+            fid.write('{"key": "touch(')
+
+        for fn in outs[:2]:
+            delete_if_exists(fn)
+        tasks = [Task(target = touch, args = (fn,)) for fn in outs]
+        dp = DPool(tasks = tasks,
+                   controller_file = controller_file,
+                   journal_file = journal_file)
+        dp.run()
+        self.assertEqual(dp.num_total_tasks, 2)
+        self.assertEqual([exists(fn) for fn in outs], [False, False, True, True])
+
+        # the records after the cut line survive another replay:
+        with open(journal_file, 'rt') as fid:
+            recs = [json.loads(ln) for ln in fid]
+        self.assertEqual(recs[-1]['state'], 'done')
+        with TaskJournal(journal_file) as journal:
+            for task in tasks:
+                self.assertTrue(journal.is_done(task.key))
+
 if __name__ == '__main__':
     unittest.main()
         